@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Async jobs
+
+asyncio front end of a process pool running the solvers of
+hyperbolicpoincareriemannianopt, with progress events and cancellation.
+"""
+
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+
+import numpy.linalg as la
+
+from hyperbolicpoincareriemannianopt import StoppingCriterion, stop_test, create_bunch_test_set
+
+# set in every worker of an AsyncSolverPool by pool_initializer
+pool_events = None
+pool_cancelled = None
+
+
+def pool_initializer(events, cancelled):
+  global pool_events, pool_cancelled
+  pool_events = events
+  pool_cancelled = cancelled
+
+
+class ProgressReporter(StoppingCriterion):
+    # passed as stop to a solver running in the pool: every `every` iterations
+    # it sends an event to the parent, and it stops the solver once the job
+    # is cancelled. The stopping decision is otherwise left to stop
+    def __init__(self, job_id, slot, report, every=1, stop=None):
+        self.job_id = job_id
+        self.slot = slot
+        self.report = report
+        self.every = every
+        self.stop = stop
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.k = 0
+        if self.stop is not None:
+            self.stop.reset()
+
+    def __call__(self, manifold, x, f, g):
+        self.k += 1
+        if self.report and self.k % self.every == 0:
+            pool_events.put({"job": self.job_id, "step": self.k,
+                             "f": None if f is None else float(f), "grad_norm": float(la.norm(g))})
+        if pool_cancelled[self.slot]:
+            self.reason = "cancelled"
+            return True
+        if stop_test(self.stop, manifold, x, f, g):
+            self.reason = None if self.stop is None else self.stop.reason
+            return True
+        return False
+
+
+def pool_solve(job_id, slot, report, every, solver, args, kwargs):
+  kwargs = dict(kwargs)
+  kwargs["stop"] = ProgressReporter(job_id, slot, report, every, kwargs.get("stop"))
+  return solver(*args, **kwargs)
+
+
+class AsyncSolverPool:
+    # asyncio front end of a process pool: the coroutines return when the job
+    # is done, at most max_in_flight jobs are submitted at the same time, and
+    # the progress events of the solvers are pumped into the event loop by
+    # a thread. Jobs need picklable functions (no lambdas), the workers are
+    # spawned, forking would copy the locks held by the threads of the parent
+
+    def __init__(self, workers=None, max_in_flight=64, context="spawn"):
+        context = multiprocessing.get_context(context)
+        self.events = context.Queue()
+        self.cancelled = context.Array("b", max_in_flight, lock=False)
+        self.executor = ProcessPoolExecutor(workers, context, pool_initializer, (self.events, self.cancelled))
+        self.max_in_flight = max_in_flight
+        self.free_slots = None
+        self.ids = count()
+        self.listeners = {}
+        self.loop = None
+        self.pump = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _start(self):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            # a job holds its slot, and its place among the ones in flight,
+            # until the process lets it go, a timed out job may still run
+            self.free_slots = asyncio.Queue()
+            for slot in range(self.max_in_flight):
+                self.free_slots.put_nowait(slot)
+            self.pump = threading.Thread(target=self._pump, daemon=True)
+            self.pump.start()
+
+    def _pump(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            self.loop.call_soon_threadsafe(self._dispatch, event)
+
+    def _dispatch(self, event):
+        listener = self.listeners.get(event["job"])
+        if listener is not None:
+            listener(event)
+
+    async def _submit(self, timeout, progress, submit):
+        self._start()
+        slot = await self.free_slots.get()
+        job_id = next(self.ids)
+        self.cancelled[slot] = 0
+        try:
+            future = submit(job_id, slot)
+        except BaseException:
+            self.free_slots.put_nowait(slot)
+            raise
+        if progress is not None:
+            self.listeners[job_id] = progress
+
+        def release(_):
+            self.loop.call_soon_threadsafe(self.free_slots.put_nowait, slot)
+        future.add_done_callback(release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # a job already running stops at its next iteration
+            self.cancelled[slot] = 1
+            raise
+        finally:
+            self.listeners.pop(job_id, None)
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        # any picklable call, cancelled only if it has not started yet
+        return await self._submit(timeout, None, lambda job_id, slot: self.executor.submit(fn, *args, **kwargs))
+
+    async def solve(self, solver, x_0, x_set, *args, timeout=None, progress=None, every=1, **kwargs):
+        # solver(x_0, x_set, *args, stop=..., **kwargs) as the *_poincare and
+        # *_hyperboloid wrappers, progress(event) is called in the event loop
+        return await self._submit(timeout, progress, lambda job_id, slot: self.executor.submit(
+            pool_solve, job_id, slot, progress is not None, every, solver, (x_0, x_set) + args, kwargs))
+
+    async def sweep(self, solver, bunch_test_set, *args, timeout=None, progress=None, every=1, **kwargs):
+        return await asyncio.gather(*[
+            self.solve(solver, x_0, x_set, *args, timeout=timeout, progress=progress, every=every, **kwargs)
+            for (x_0, x_set, _) in bunch_test_set
+        ])
+
+    async def generate_bunch(self, manifold, card_bunch=50, card_x=4, jobs=8, seed=0, timeout=None):
+        sizes = [card_bunch//jobs + (i < card_bunch % jobs) for i in range(jobs)]
+        chunks = await asyncio.gather(*[
+            self.run(create_bunch_test_set, manifold, size, card_x, seed=seed + i, timeout=timeout)
+            for i, size in enumerate(sizes) if size > 0
+        ])
+        return [problem for chunk in chunks for problem in chunk]
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        self.events.put(None)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""Barycenter service
+
+http front end batching frechet mean requests into segmented_frechet_mean
+calls, see hyperbolicpoincareriemannianopt for the solvers.
+"""
+
+import json
+import math
+import multiprocessing
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from hyperbolicpoincareriemannianopt import PoincareBall, Hyperboloid, segmented_frechet_mean
+
+
+def check_points(points, model):
+  # the solvers take any array, the requests are checked before batching so
+  # one bad request cannot fail the others of its batch
+  if points.ndim != 2 or len(points) == 0:
+    raise ValueError("points must be a non empty list of points")
+  if not np.isfinite(points).all():
+    raise ValueError("points must be finite")
+  if model == "poincare":
+    if not (np.sum(points*points, axis=1) < 1).all():
+      raise ValueError("points must lie inside the unit ball")
+  else:
+    # upper sheet, with <x, x> = -1 up to the rounding of the squares
+    minkowski = np.sum(points[:, :-1]**2, axis=1) - points[:, -1]**2
+    if points.shape[1] < 2 or not ((points[:, -1] > 0) & (np.abs(minkowski + 1) <= 1e-6*points[:, -1]**2)).all():
+      raise ValueError("points must lie on the upper sheet of the hyperboloid")
+
+
+# the segmented_frechet_mean arguments a request may set, with their types
+solver_options = {"max_steps": int, "tol": float, "gamma": float, "max_backtracks": int, "cg_steps": int}
+
+
+def check_options(options):
+  # the options are part of the key grouping the requests of a batch, so
+  # they must be known scalars
+  if not isinstance(options, dict):
+    raise ValueError("options must be an object")
+  for name, value in options.items():
+    if name not in solver_options:
+      raise ValueError("unknown option {}".format(name))
+    if name == "cg_steps" and value is None:
+      continue
+    types = (int, float) if solver_options[name] is float else int
+    if isinstance(value, bool) or not isinstance(value, types) or not math.isfinite(value):
+      raise ValueError("option {} must be a finite {}".format(name, solver_options[name].__name__))
+
+
+def json_safe(obj):
+  # json has no NaN or infinity, non finite floats are sent as null
+  if isinstance(obj, dict):
+    return {key: json_safe(value) for key, value in obj.items()}
+  if isinstance(obj, (list, tuple)):
+    return [json_safe(value) for value in obj]
+  if isinstance(obj, float) and not math.isfinite(obj):
+    return None
+  return obj
+
+
+class BatchRequest:
+    def __init__(self, points, model, options):
+        self.points = points
+        self.model = model
+        self.options = options
+        self.future = Future()
+        self.arrival = time.perf_counter()
+
+
+class BarycenterBatcher:
+    # coalesces the requests arriving within max_wait of the first one, up to
+    # max_batch of them, into one segmented_frechet_mean call per model,
+    # dimension and options; workers threads solve batches concurrently
+    models = ("poincare", "hyperboloid")
+
+    def __init__(self, max_batch=64, max_wait=0.002, workers=1):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=10000)
+        self.requests = 0
+        self.batches = 0
+        self.busy_time = 0.0
+        self.start_time = time.perf_counter()
+        self.workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, points, model="poincare", **options):
+        points = np.asarray(points, dtype=float)
+        if model not in self.models:
+            raise ValueError("unknown model {}".format(model))
+        check_points(points, model)
+        check_options(options)
+        request = BatchRequest(points, model, options)
+        self.queue.put(request)
+        return request.future
+
+    def solve(self, points, model="poincare", timeout=None, **options):
+        return self.submit(points, model, **options).result(timeout)
+
+    def close(self):
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def _collect(self):
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first.arrival + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                request = self.queue.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if request is None:
+                # shutdown, left for the next round
+                self.queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            start = time.perf_counter()
+            try:
+                self._run(batch)
+            except Exception as e:
+                # the worker outlives a failed batch, its requests get the error
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            end = time.perf_counter()
+            with self.lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self.busy_time += end - start
+                self.latencies.extend(end - request.arrival for request in batch)
+
+    def _run(self, batch):
+        groups = {}
+        for request in batch:
+            try:
+                key = (request.model, request.points.shape[1], tuple(sorted(request.options.items())))
+                groups.setdefault(key, []).append(request)
+            except Exception as e:
+                request.future.set_exception(e)
+        for (model, dim, options), requests in groups.items():
+            try:
+                manifold = PoincareBall(dim, 1) if model == "poincare" else Hyperboloid(dim - 1, 1)
+                points = np.vstack([request.points for request in requests])
+                ids = np.repeat(np.arange(len(requests)), [len(request.points) for request in requests])
+                _, means, info = segmented_frechet_mean(manifold, points, ids, **dict(options))
+            except Exception as e:
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+            for i, request in enumerate(requests):
+                request.future.set_result({
+                    "mean": means[i],
+                    "f": float(info["f"][i]),
+                    "grad_norm": float(info["grad_norm"][i]),
+                    "steps": int(info["steps"][i]),
+                })
+
+    def metrics(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            requests, batches, busy_time = self.requests, self.batches, self.busy_time
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            "requests": requests,
+            "batches": batches,
+            "mean_batch": requests/batches if batches else 0.0,
+            "throughput": requests/elapsed,
+            "busy_time": busy_time,
+            "queued": self.queue.qsize(),
+            "latency_mean": float(np.mean(latencies)) if len(latencies) else 0.0,
+            "latency_p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "latency_p99": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
+
+
+class BarycenterHandler(BaseHTTPRequestHandler):
+    # POST /solve {"points": [[...], ...], "model": "poincare", "options": {...}}
+    # GET /metrics
+    # malformed requests get a 400, requests not solved within the timeout
+    # of the server a 504, anything else failing a 500
+
+    def do_POST(self):
+        if self.path != "/solve":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            options = body.get("options", {})
+            check_options(options)
+            result = self.server.batcher.solve(body["points"], body.get("model", "poincare"),
+                                               timeout=self.server.solve_timeout, **options)
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        except TimeoutError:
+            self._send(504, {"error": "not solved within {} s".format(self.server.solve_timeout)})
+            return
+        except Exception as e:
+            self._send(500, {"error": "{}: {}".format(type(e).__name__, e)})
+            return
+        result["mean"] = result["mean"].tolist()
+        self._send(200, result)
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self._send(404, {"error": "not found"})
+            return
+        self._send(200, self.server.batcher.metrics())
+
+    def _send(self, code, payload):
+        body = json.dumps(json_safe(payload), allow_nan=False).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BarycenterHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # backlog for bursts of concurrent clients
+    request_queue_size = 1024
+
+
+class BarycenterService:
+    # http front end of a BarycenterBatcher, every connection has its own
+    # thread so that concurrent requests meet in the batcher queue
+
+    def __init__(self, host="127.0.0.1", port=0, max_batch=64, max_wait=0.002, workers=1, timeout=60):
+        self.batcher = BarycenterBatcher(max_batch, max_wait, workers)
+        self.server = BarycenterHTTPServer((host, port), BarycenterHandler)
+        self.server.batcher = self.batcher
+        self.server.solve_timeout = timeout
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.batcher.close()
+
+
+def service_main(connection, host, port, kwargs):
+  service = BarycenterService(host, port, **kwargs)
+  connection.send(service.url)
+  service.server.serve_forever()
+
+
+def start_service_process(host="127.0.0.1", port=0, **kwargs):
+  # the service in a process of its own, returns the process and its url.
+  # Spawned, a fork would copy the locks of the threads of the parent
+  context = multiprocessing.get_context("spawn")
+  parent, child = context.Pipe()
+  process = context.Process(target=service_main, args=(child, host, port, kwargs), daemon=True)
+  process.start()
+  return process, parent.recv()
+
+
+class BarycenterClient:
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+
+    def _request(self, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode()
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def solve(self, points, model="poincare", **options):
+        result = self._request("/solve", {"points": np.asarray(points).tolist(), "model": model, "options": options})
+        # null coordinates are the non finite ones
+        result["mean"] = np.array(result["mean"], dtype=float)
+        return result
+
+    def metrics(self):
+        return self._request("/metrics")
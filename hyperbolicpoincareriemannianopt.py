@@ -12,7 +12,18 @@ Original file is located at
 import numpy as np
 from random import random
 import math
-from itertools import compress
+import time
+import json
+import os
+import hashlib
+import types
+import functools
+import platform
+import tracemalloc
+import threading
+from contextlib import contextmanager
+from itertools import product
+from concurrent.futures import ThreadPoolExecutor
 
 import matplotlib.pyplot as plt
 # from numpy import linalg as LA
@@ -20,12 +31,282 @@ import numpy.linalg as la
 from sklearn.linear_model import HuberRegressor
 from sklearn.preprocessing import StandardScaler
 
-!pip install git+https://github.com/pymanopt/pymanopt
+# on colab: !pip install git+https://github.com/pymanopt/pymanopt
 import pymanopt
 from pymanopt.manifolds.manifold import Manifold
 
+"""# Utilities"""
+
+def blocked_pairwise(kernel, m, p, block_size=1024, n_jobs=1):
+  # fills the (m x p) matrix tile by tile, kernel(rows, cols) returns one tile
+  out = np.empty((m, p))
+  tiles = [(i, j) for i in range(0, m, block_size) for j in range(0, p, block_size)]
+
+  def fill(tile):
+    i, j = tile
+    rows = slice(i, min(i + block_size, m))
+    cols = slice(j, min(j + block_size, p))
+    out[rows, cols] = kernel(rows, cols)
+
+  if n_jobs == 1 or len(tiles) == 1:
+    for tile in tiles:
+      fill(tile)
+  else:
+    # numpy releases the GIL inside the tile products, threads are enough
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+      list(executor.map(fill, tiles))
+  return out
+
+"""# Profiling"""
+
+class NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+null_phase = NullPhase()
+
+
+class ProfilerPhase:
+    def __init__(self, profilers, name):
+        self.profilers = profilers
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = time.perf_counter() - self.start
+        for profiler in self.profilers:
+            calls, total = profiler.phases.get(self.name, (0, 0.0))
+            profiler.phases[self.name] = (calls + 1, total + elapsed)
+        return False
+
+
+class Profiler:
+    # calls and times of the instrumented functions and of the solver phases
+    # run by a thread inside profiling(profiler)
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.times = {}
+        self.phases = {}
+
+    def add(self, name, elapsed):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.times[name] = self.times.get(name, 0.0) + elapsed
+
+    def report(self):
+        return {
+            "calls": dict(self.calls),
+            "time": dict(self.times),
+            "phases": {name: {"calls": calls, "time": elapsed} for name, (calls, elapsed) in self.phases.items()},
+        }
+
+
+class ThreadProfiling(threading.local):
+    # per thread: the profilers of the open profiling blocks, innermost
+    # last, and the number of cost, gradient and hessian evaluations
+    def __init__(self):
+        self.profilers = []
+        self.evaluations = 0
+
+
+thread_profiling = ThreadProfiling()
+
+
+def profiled(name, evaluation=False):
+  # decorator counting and timing the calls in every profiler open in the
+  # calling thread, outside of profiling() it costs a thread local lookup
+  def decorate(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      state = thread_profiling
+      if evaluation:
+        state.evaluations += 1
+      if not state.profilers:
+        return fn(*args, **kwargs)
+      profilers = list(state.profilers)
+      start = time.perf_counter()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        elapsed = time.perf_counter() - start
+        for profiler in profilers:
+          profiler.add(name, elapsed)
+    return wrapper
+  return decorate
+
+
+def phase(name):
+  # solvers time their phases with `with phase(name):`, a shared no-op
+  # context manager when the thread is not profiling
+  profilers = thread_profiling.profilers
+  if not profilers:
+    return null_phase
+  return ProfilerPhase(list(profilers), name)
+
+
+# manifold methods counted by profiling(), the cost functions are decorated
+# with profiled where they are defined. Times are inclusive so Hyperboloid.exp
+# also pays for its inner_minkowski_columns calls
+profiled_methods = ["exp", "log", "dist", "cdist", "inner", "norm", "transp", "egrad2rgrad",
+                    "ehess2rhess", "mobius_add", "inner_minkowski_columns", "proj"]
+
+
+def instrumented(prefix):
+  # class decorator, the profiled_methods of the class are counted as prefix.name.
+  # Aliases bound in the class body (the pymanopt names) are rebound to the
+  # counted method, their calls are counted under the name they alias
+  def decorate(cls):
+    for name in profiled_methods:
+      if name in cls.__dict__:
+        method = cls.__dict__[name]
+        wrapped = profiled(prefix + "." + name)(method)
+        for alias, value in list(cls.__dict__.items()):
+          if value is method:
+            setattr(cls, alias, wrapped)
+    return cls
+  return decorate
+
+
+@contextmanager
+def profiling(profiler=None):
+  # counts the calls made by this thread inside the block, other threads are
+  # not seen. Blocks nest, the calls of an inner block are also counted in
+  # the outer ones; a profiler passed in keeps adding to its counts
+  profiler = Profiler() if profiler is None else profiler
+  thread_profiling.profilers.append(profiler)
+  try:
+    yield profiler
+  finally:
+    thread_profiling.profilers.pop()
+
+
+def profile_run(fn, *args, **kwargs):
+  # evaluations counts the cost, gradient and hessian evaluations of the run
+  evaluations = thread_profiling.evaluations
+  with profiling() as p:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+  report = p.report()
+  report["total_time"] = elapsed
+  report["evaluations"] = thread_profiling.evaluations - evaluations
+  return result, report
+
+"""# Numerical Guards"""
+
+class NumericalGuard(threading.local):
+    # keeps the iterates where the floats still describe the manifold: exp
+    # pulls the points of the disk back to 1 - |x|^2 >= eps and the ones of
+    # the hyperboloid to a time coordinate <= 1/sqrt(eps), past which <x, x>
+    # = -1 is lost in the rounding of the squares. The hyperboloid points
+    # get their time coordinate recomputed from the space ones when they
+    # leave that region (a cancelling step can land on the lower sheet),
+    # when <x, x> drifts from -1 by more than drift times the squared time
+    # coordinate and, if renormalize_every is set, every renormalize_every
+    # exps, long steps cancel in cosh(|u|) x + sinh(|u|) u/|u|. Steps are cut at the diameter
+    # of the region so cosh cannot overflow. arctanh of norms rounded to 1
+    # is taken at the largest float below 1.
+    # counts holds how many times each guard fired. Settings and counts are
+    # per thread, every thread starts from the constructor settings
+    def __init__(self, eps=1e-12, renormalize_every=None, drift=1e-10):
+        self.enabled = True
+        self.eps = eps
+        self.drift = drift
+        self.renormalize_every = renormalize_every
+        self.exps = 0
+        self.reset()
+
+    def reset(self):
+        self.counts = {"clamp": 0, "arctanh": 0, "step": 0, "renormalize": 0}
+
+    def clamp(self, X):
+        # X packed, rescales in place the columns too close to the boundary
+        if not self.enabled:
+            return X
+        norms2 = np.sum(X*X, axis=0)
+        outside = ~(norms2 <= 1 - self.eps)
+        if outside.any():
+            self.counts["clamp"] += int(np.sum(outside))
+            X[:, outside] *= np.sqrt((1 - self.eps)/norms2[outside])
+        return X
+
+    def arctanh(self, b):
+        if self.enabled:
+            limit = np.nextafter(1, 0)
+            clipped = ~(b <= limit)
+            if clipped.any():
+                self.counts["arctanh"] += int(np.sum(clipped))
+                b = np.minimum(b, limit)
+        return np.arctanh(b)
+
+    def step_length(self, t):
+        # geodesic step lengths on the hyperboloid, longer ones end outside
+        if not self.enabled:
+            return t
+        t_max = 2*np.arccosh(1/math.sqrt(self.eps))
+        longer = ~(t <= t_max)
+        if longer.any():
+            self.counts["step"] += int(np.sum(longer))
+            t = np.minimum(t, t_max)
+        return t
+
+    def renormalize(self, X):
+        # X packed, in place on the columns of a hyperboloid
+        if not self.enabled:
+            return X
+        self.exps += 1
+        cosh_max = 1/math.sqrt(self.eps)
+        periodic = self.renormalize_every and self.exps % self.renormalize_every == 0
+        norms2 = np.sum(X[:-1]*X[:-1], axis=0)
+        # the error on <x, x> = -1 grows by a constant factor per step once
+        # the tangent vectors are projected from points off the sheet, the
+        # points are put back when it is past the rounding of the squares
+        drift = np.abs(norms2 - X[-1]*X[-1] + 1) <= self.drift*X[-1]*X[-1]
+        if not periodic and ((1 <= X[-1]) & (X[-1] <= cosh_max) & drift).all():
+            return X
+        outside = ~(norms2 <= cosh_max**2 - 1)
+        if outside.any():
+            self.counts["clamp"] += int(np.sum(outside))
+            X[:-1, outside] *= np.sqrt((cosh_max**2 - 1)/norms2[outside])
+            norms2[outside] = cosh_max**2 - 1
+        self.counts["renormalize"] += X.shape[1]
+        X[-1] = np.sqrt(1 + norms2)
+        return X
+
+    def report(self):
+        return dict(self.counts)
+
+
+guard = NumericalGuard()
+
+
+@contextmanager
+def guarding(guard=guard, **settings):
+  # changes the guard settings (enabled, eps, renormalize_every, drift) of the
+  # calling thread only for the duration of the block and counts from zero
+  # inside it
+  old = {name: getattr(guard, name) for name in settings}
+  for name, value in settings.items():
+    setattr(guard, name, value)
+  guard.reset()
+  try:
+    yield guard
+  finally:
+    for name, value in old.items():
+      setattr(guard, name, value)
+
 """# Poincare Ball"""
 
+@instrumented("poincare")
 class PoincareBall(Manifold):
     def __init__(self, n, k):
         self.k = k
@@ -36,7 +317,7 @@ class PoincareBall(Manifold):
             )
         
     def _squeeze(self, X):
-        if self.k == 1 and len(X.shape) > 1:
+        if self.k == 1 and len(X.shape) > 1 and X.shape[1] == 1:
             return np.squeeze(X, axis=1)
         else:
             return X
@@ -66,23 +347,29 @@ class PoincareBall(Manifold):
     def typicaldist(self):
         return self.dim / 8
 
-    def inner(self, X, G, H):
+    def inner_columns(self, X, G, H):
         X = self._pack(X)
         G = self._pack(G)
         H = self._pack(H)
-        return sum(np.sum(G*H, axis=0) * self.conformal_factor(X)**2)
+        return np.sum(G*H, axis=0) * self.conformal_factor(X)**2
+
+    def inner(self, X, G, H):
+        return np.sum(self.inner_columns(X, G, H))
 
     def proj(self, X, G):
         # Identity map since the embedding space is the tangent space R^n
         return self._squeeze(G)
 
+    def norm_columns(self, X, G):
+        return np.sqrt(self.inner_columns(X, G, G))
+
     def norm(self, X, G):
         return math.sqrt(self.inner(X, G, G))
 
-    def rand(self):
-        isotropic = np.random.standard_normal(size=(self.n, self.k))
+    def rand(self, rng=np.random):
+        isotropic = rng.standard_normal(size=(self.n, self.k))
         isotropic = isotropic / la.norm(isotropic, axis=0)
-        radius = np.random.rand(self.k) ** (1 / self.n)
+        radius = rng.random(self.k) ** (1 / self.n)
         x = isotropic * radius
         return self._squeeze(x)
 
@@ -95,17 +382,36 @@ class PoincareBall(Manifold):
     def zerovec(self, X):
         return np.zeros(X.shape)
 
-    def dist(self, X, Y):
+    def dist_columns(self, X, Y):
         X = self._pack(X)
         Y = self._pack(Y)
         norms2x = np.sum(X*X, axis=0)
         norms2y = np.sum(Y*Y, axis=0)
         norms2diff = np.sum((X - Y)*(X - Y), axis=0)
-        #a = max(
-        #    1,
-        #    1 + 2*(norms2diff / ((1-norms2x)*(1-norms2y))),
-        #   )
-        return math.sqrt(np.sum(np.arccosh(1 + 2*(norms2diff / ((1-norms2x)*(1-norms2y))))**2))
+        # arccosh(1 + 2s) written as 2 arcsinh(sqrt(s))
+        return 2*np.arcsinh(np.sqrt(norms2diff / ((1-norms2x)*(1-norms2y))))
+
+    def dist(self, X, Y):
+        return math.sqrt(np.sum(self.dist_columns(X, Y)**2))
+
+    def cdist(self, X, Y, block_size=1024, n_jobs=1):
+        # matrix of the geodesic distances between the columns of X and Y
+        X = self._pack(X)
+        Y = self._pack(Y)
+        norms2x = np.sum(X*X, axis=0)
+        norms2y = np.sum(Y*Y, axis=0)
+        factor_x = 1 - norms2x
+        factor_y = 1 - norms2y
+
+        def kernel(rows, cols):
+            # |x - y|^2 from the differences, the gram expansion cancels for
+            # close points and 1/(1 - |x|^2) amplifies it near the boundary
+            D = X[:, rows, None] - Y[:, None, cols]
+            norms2diff = np.sum(D*D, axis=0)
+            # arccosh(1 + 2s) = 2 arcsinh(sqrt(s)) stays finite and accurate for s -> 0 and s -> inf
+            return 2*np.arcsinh(np.sqrt(norms2diff / (factor_x[rows, None]*factor_y[None, cols])))
+
+        return blocked_pairwise(kernel, X.shape[1], Y.shape[1], block_size, n_jobs)
 
     def egrad2rgrad(self, X, G):
         X = self._pack(X)
@@ -132,7 +438,8 @@ class PoincareBall(Manifold):
         factor = (1 - np.sum(X*X, axis=0))
         # avoid division by 0
         tmp = np.tanh(norm_u/factor) * (U/((norm_u + (norm_u == 0))))
-        return self.mobius_add(X, tmp)
+        # tanh rounds to 1 for long steps and the sum lands on the boundary
+        return self._squeeze(guard.clamp(self._pack(self.mobius_add(X, tmp))))
 
     def log(self, X, Y):
         X = self._pack(X)
@@ -141,16 +448,67 @@ class PoincareBall(Manifold):
         b = la.norm(a, axis=0)
 
         factor = 1 - np.sum(X*X, axis=0)
-        return self._squeeze(a * factor * np.arctanh(b) / b)
+        # arctanh(b)/b -> 1 for b -> 0
+        ratio = np.where(b == 0, 1, guard.arctanh(b)/np.where(b == 0, 1, b))
+        return self._squeeze(a * factor * ratio)
+
+    def gyration(self, X, Y, G):
+        # gyr[x, y]g = -(x + y) + (x + (y + g)) with + the mobius addition,
+        # in closed form since it is linear in g
+        X = self._pack(X)
+        Y = self._pack(Y)
+        G = self._pack(G)
+        x_dot_y = np.sum(X*Y, axis=0)
+        x_norm_q = np.sum(X*X, axis=0)
+        y_norm_q = np.sum(Y*Y, axis=0)
+        x_dot_g = np.sum(X*G, axis=0)
+        y_dot_g = np.sum(Y*G, axis=0)
+        a = -x_dot_g*y_norm_q + y_dot_g + 2*x_dot_y*y_dot_g
+        b = -y_dot_g*x_norm_q - x_dot_g
+        den = 1 + 2*x_dot_y + x_norm_q*y_norm_q
+        return self._squeeze(G + 2*(a*X + b*Y)/den)
 
     def transp(self, X1, X2, G):
-        return G
+        # parallel transport along the geodesic from X1 to X2,
+        # P(g) = lambda_x1/lambda_x2 gyr[x2, -x1] g
+        X1 = self._pack(X1)
+        X2 = self._pack(X2)
+        G = self._pack(G)
+        factor = self.conformal_factor(X1)/self.conformal_factor(X2)
+        return self._squeeze(self._pack(self.gyration(X2, -X1, G))*factor)
+
+    def transp_conformal(self, X1, X2, G):
+        # cheaper vector transport: keeps the riemannian norm but drops the
+        # gyration, a rotation in the plane of x1 and x2 whose angle is
+        # O(|x1||x2|), so it is exact when x1, x2 and 0 lie on a geodesic
+        X1 = self._pack(X1)
+        X2 = self._pack(X2)
+        G = self._pack(G)
+        return self._squeeze(G*self.conformal_factor(X1)/self.conformal_factor(X2))
 
     def pairmean(self, X, Y):
         return self.exp(X, self.log(X, Y) / 2)
 
+    # names of the pymanopt 2.x interface
+    inner_product = inner
+    projection = proj
+    to_tangent_space = proj
+    random_point = rand
+    random_tangent_vector = randvec
+    zero_vector = zerovec
+    euclidean_to_riemannian_gradient = egrad2rgrad
+    euclidean_to_riemannian_hessian = ehess2rhess
+    retraction = retr
+    transport = transp
+    pair_mean = pairmean
+
+    @property
+    def typical_dist(self):
+        return self.typicaldist()
+
 """# Hyperboloid"""
 
+@instrumented("hyperboloid")
 class Hyperboloid(Manifold):
     def __init__(self, n, k):
         self.n = n
@@ -161,7 +519,7 @@ class Hyperboloid(Manifold):
             )
 
     def _squeeze(self, X):
-        if self.k == 1 and len(X.shape) > 1:
+        if self.k == 1 and len(X.shape) > 1 and X.shape[1] == 1:
             return np.squeeze(X, axis=1)
         else:
             return X
@@ -175,19 +533,15 @@ class Hyperboloid(Manifold):
     def inner_minkowski_columns(self, U, V):
         U = self._pack(U)
         V = self._pack(V)
-        return self._squeeze(np.array(
-              [
-                  np.dot(U[:, i][:-1], V[:, i][:-1]) - U[:, i][-1]*V[:, i][-1]
-                  for i in range(self.k)
-              ]
-              ))
+        return np.sum(U[:-1]*V[:-1], axis=0) - U[-1]*V[-1]
 
     def typicaldist(self):
         return math.sqrt(self.dim)
 
+    def inner_columns(self, X, U, V):
+        return self.inner_minkowski_columns(U, V)
+
     def inner(self, X, U, V):
-        U = self._pack(U)
-        V = self._pack(V)
         return np.sum(self.inner_minkowski_columns(U, V))
 
     def proj(self, X, G):
@@ -196,12 +550,16 @@ class Hyperboloid(Manifold):
         inners = self.inner_minkowski_columns(X, G)
         return self._squeeze(G + X*inners)
 
+    def norm_columns(self, X, G):
+        return np.sqrt(np.maximum(0, self.inner_minkowski_columns(G, G)))
+
     def norm(self, X, G):
-        return math.sqrt(max(0, self.inner(X, G, G)))
+        # np.maximum keeps a nan, max(0, nan) would be 0
+        return float(np.sqrt(np.maximum(0, self.inner(X, G, G))))
 
-    def rand(self):
+    def rand(self, rng=np.random):
         ret = np.zeros((self.n+1, self.k))
-        x0 = np.random.normal(size=(self.n, self.k))
+        x0 = rng.normal(size=(self.n, self.k))
         x1 = np.sqrt(1 + np.sum(x0 * x0, axis=0))
         ret[:-1, :] = x0
         ret[-1, :] = x1
@@ -218,18 +576,34 @@ class Hyperboloid(Manifold):
     def _dists(self, X, Y):
         X = self._pack(X)
         Y = self._pack(Y)
-        alpha = -self.inner_minkowski_columns(X, Y)
-        alpha[alpha < 1] = 1
-        return np.arccosh(alpha)
+        # arccosh(-<x, y>) = 2 arcsinh(|x - y|/2), the difference does not
+        # cancel for close points as -<x, y> - 1 does
+        D = X - Y
+        return 2*np.arcsinh(np.sqrt(np.maximum(0, self.inner_minkowski_columns(D, D)))/2)
+
+    def dist_columns(self, X, Y):
+        return self._dists(X, Y)
 
     def dist(self, X, Y):
+        return la.norm(self._dists(X, Y))
+
+    def cdist(self, X, Y, block_size=1024, n_jobs=1):
+        # matrix of the geodesic distances between the columns of X and Y
         X = self._pack(X)
         Y = self._pack(Y)
-        return self._squeeze(la.norm(self._dists(X, Y)))
+
+        def kernel(rows, cols):
+            # 2 arcsinh(|x - y|/2) as in _dists, from the differences: the
+            # gram matrix would cancel in -<x, y> - 1 for close points
+            D = X[:, rows, None] - Y[:, None, cols]
+            mink2 = np.sum(D[:-1]*D[:-1], axis=0) - D[-1]*D[-1]
+            return 2*np.arcsinh(np.sqrt(np.maximum(0, mink2))/2)
+
+        return blocked_pairwise(kernel, X.shape[1], Y.shape[1], block_size, n_jobs)
 
     def egrad2rgrad(self, X, G):
         X = self._pack(X)
-        G = self._pack(G)
+        G = self._pack(G).copy()
         G[-1, :] = -G[-1, :]
         return self.proj(X, G)
 
@@ -238,6 +612,8 @@ class Hyperboloid(Manifold):
         G = self._pack(G)
         H = self._pack(H)
         U = self._pack(U)
+        G = G.copy()
+        H = H.copy()
         G[-1, :] = -G[-1, :]
         H[-1, :] = -H[-1, :]
         inners = self.inner_minkowski_columns(X, G)
@@ -252,19 +628,20 @@ class Hyperboloid(Manifold):
         X = self._pack(X)
         U = self._pack(U)
         # compute the individual minkowski norm for each individual column of U
-        mink_inners = self.inner_minkowski_columns(U, U)
-        vnormmf = np.vectorize(lambda x: math.sqrt(max(0, x)))
-        mink_norms = vnormmf(mink_inners)
-        a = np.sinh(mink_norms)/mink_norms
-        a[np.isnan(a)] = 1
-        return self._squeeze(np.cosh(mink_norms)*X + U*a)
+        mink_norms = self.norm_columns(X, U)
+        t = guard.step_length(mink_norms)
+        # sinh(t)/|u| -> 1 for t -> 0
+        a = np.sinh(t)/np.where(mink_norms == 0, 1, mink_norms)
+        a[mink_norms == 0] = 1
+        return self._squeeze(guard.renormalize(np.cosh(t)*X + U*a))
 
     def log(self, X, Y):
         X = self._pack(X)
         Y = self._pack(Y)
         d = self._dists(X, Y)
-        a = d/np.sinh(d)
-        a[np.isnan(a)] = 1
+        # d/sinh(d) -> 1 for d -> 0
+        a = d/np.where(d == 0, 1, np.sinh(d))
+        a[d == 0] = 1
         return self._squeeze(self.proj(X, Y*a))
 
     def transp(self, X1, X2, G):
@@ -276,7 +653,24 @@ class Hyperboloid(Manifold):
     def pairmean(self, X, Y):
         X = self._pack(X)
         Y = self._pack(Y)
-        return self._squeeze(self.exp(X, self.log(X, Y), 1/2))
+        return self._squeeze(self.exp(X, self.log(X, Y)/2))
+
+    # names of the pymanopt 2.x interface
+    inner_product = inner
+    projection = proj
+    to_tangent_space = proj
+    random_point = rand
+    random_tangent_vector = randvec
+    zero_vector = zerovec
+    euclidean_to_riemannian_gradient = egrad2rgrad
+    euclidean_to_riemannian_hessian = ehess2rhess
+    retraction = retr
+    transport = transp
+    pair_mean = pairmean
+
+    @property
+    def typical_dist(self):
+        return self.typicaldist()
 
 """# Derivative of the cost function"""
 
@@ -289,20 +683,27 @@ def poincare_dist_grad(x, y):
   return 4/(b*math.sqrt(c**2-1))*(((np.dot(y,y) - 2*np.dot(x, y) + 1)/(a**2))*x - y/a)
 
 
+@profiled("frechet_mean_poincare_grad", evaluation=True)
 def frechet_mean_poincare_grad(psi, x_set, manifold):
+  if isinstance(x_set, PreparedDataset):
+    return prepared_poincare_grad(psi, x_set)
   res = 0
   for x_i in x_set:
     res += manifold.dist(psi, x_i)*poincare_dist_grad(psi, x_i)
   return res*2/(len(x_set))
 
 
+@profiled("frechet_mean_poincare_rgrad")
 def frechet_mean_poincare_rgrad(psi, x_set, manifold):
   egrad = frechet_mean_poincare_grad(psi, x_set, manifold)
   return manifold.egrad2rgrad(psi, egrad)
 
 
 # --- Hyperboloid Gradient
+@profiled("frechet_mean_hyperboloid_grad", evaluation=True)
 def frechet_mean_hyperboloid_grad(theta, x_set, manifold):
+  if isinstance(x_set, PreparedDataset):
+    return prepared_hyperboloid_grad(theta, x_set)
   res = 0
   for x_i in x_set:
     x_i_g = x_i.copy()
@@ -312,12 +713,86 @@ def frechet_mean_hyperboloid_grad(theta, x_set, manifold):
   return res
 
 
+@profiled("frechet_mean_hyperboloid_rgrad")
 def frechet_mean_hyperboloid_rgrad(theta, x_set, manifold):
   egrad = frechet_mean_hyperboloid_grad(theta, x_set, manifold)
   return manifold.egrad2rgrad(theta, egrad)
 
 
+# --- Hessian-vector products
+def arccosh_sq_derivatives(c):
+  # h'(c) and h''(c) for h(c) = arccosh(c)^2, series near c = 1 where the
+  # closed forms are 0/0
+  c = np.maximum(c, 1)
+  e = c - 1
+  small = e < 1e-5
+  c_safe = np.where(small, 2, c)
+  h1 = 2*np.arccosh(c_safe)/np.sqrt(c_safe*c_safe - 1)
+  h2 = (2 - c_safe*h1)/(c_safe*c_safe - 1)
+  h1 = np.where(small, 2 - 2*e/3 + 4*e*e/15, h1)
+  h2 = np.where(small, -2/3 + 8*e/15, h2)
+  return h1, h2
+
+
+@profiled("frechet_mean_poincare_ehess", evaluation=True)
+def frechet_mean_poincare_ehess(psi, x_set):
+  # euclidean gradient at psi and the euclidean hessian-vector product
+  # u -> H u, written for d(psi, a)^2 = h(c) with c = 1 + 2|psi-a|^2/(alpha beta)
+  A = np.asarray(x_set)
+  alpha = 1 - np.dot(psi, psi)
+  beta = 1 - np.sum(A*A, axis=1)
+  diff = psi - A
+  delta = np.sum(diff*diff, axis=1)
+  h1, h2 = arccosh_sq_derivatives(1 + 2*delta/(alpha*beta))
+  grad_c = (4/(alpha*beta))[:, None]*(diff + (delta/alpha)[:, None]*psi)
+  m = len(A)
+  egrad = np.dot(h1, grad_c)/m
+
+  def hvp(u):
+    xu = np.dot(psi, u)
+    du = np.dot(diff, u)
+    hess_c_u = (2/beta)[:, None]*(2*u/alpha + 4*diff*xu/alpha**2 + 4*np.outer(du, psi)/alpha**2
+                                  + 2*np.outer(delta, u)/alpha**2 + 8*np.outer(delta, psi)*xu/alpha**3)
+    return (np.dot(h2*np.dot(grad_c, u), grad_c) + np.dot(h1, hess_c_u))/m
+
+  return egrad, hvp
+
+
+def frechet_mean_poincare_rhess(psi, x_set, manifold):
+  egrad, hvp = frechet_mean_poincare_ehess(psi, x_set)
+  return lambda u: manifold.ehess2rhess(psi, egrad, hvp(u), u)
+
+
+@profiled("frechet_mean_hyperboloid_ehess", evaluation=True)
+def frechet_mean_hyperboloid_ehess(theta, x_set):
+  # here c = -<theta, a> is linear in theta, so H = mean h''(c) (J a)(J a)^T
+  A_g = np.array(x_set, dtype=float)
+  A_g[:, -1] = -A_g[:, -1]
+  h1, h2 = arccosh_sq_derivatives(-np.dot(A_g, theta))
+  m = len(A_g)
+  egrad = -np.dot(h1, A_g)/m
+
+  def hvp(u):
+    return np.dot(h2*np.dot(A_g, u), A_g)/m
+
+  return egrad, hvp
+
+
+def frechet_mean_hyperboloid_rhess(theta, x_set, manifold):
+  egrad, hvp = frechet_mean_hyperboloid_ehess(theta, x_set)
+  return lambda u: manifold.ehess2rhess(theta, egrad, hvp(u), u)
+
+
+@profiled("frechet_mean", evaluation=True)
 def frechet_mean(theta, x_set, distance):
+  # distance is a function or a manifold, whose dist is used; a prepared set
+  # is measured at once in the model of the manifold
+  if isinstance(distance, Manifold):
+    if isinstance(x_set, PreparedDataset) and isinstance(distance, PoincareBall):
+      return np.mean(x_set.poincare_dists(theta)[0]**2)
+    if isinstance(x_set, PreparedDataset) and isinstance(distance, Hyperboloid):
+      return np.mean(x_set.hyperboloid_dists(theta)[0]**2)
+    distance = distance.dist
   sum_ = 0
   s = len(x_set)
   for x_i in x_set:
@@ -333,6 +808,115 @@ def inv_rho(y):
   return np.array(np.append(y[:],[(1+r)/2]))*2/(1-r) 
 
 
+def rho_set(theta_set):
+  # rho applied to every row of theta_set
+  theta_set = np.asarray(theta_set)
+  return theta_set[:, :-1]/(theta_set[:, -1:] + 1)
+
+
+def inv_rho_set(x_set):
+  # inv_rho applied to every row of x_set
+  x_set = np.asarray(x_set)
+  r = np.sum(x_set*x_set, axis=1)[:, None]
+  return np.hstack([x_set, (1 + r)/2])*2/(1 - r)
+
+
+class PreparedDataset:
+    # the quantities of a point set that do not depend on the iterate,
+    # computed once in both models: ball rows, squared norms, 1 - |a|^2, the
+    # hyperboloid lift and its sign flipped copy. lift() and ball() are views
+    # on the same cache in the two models, iterating over a view gives its
+    # rows. The points are copied read-only at construction, so the cache is
+    # filled once, at the first use
+    def __init__(self, points, model="poincare"):
+        self.model = model
+        points = np.array(points, dtype=float)
+        points.flags.writeable = False
+        self.cache = {"points": points, "model": model}
+
+    def view(self, model):
+        view = PreparedDataset.__new__(PreparedDataset)
+        view.model = model
+        view.cache = self.cache
+        return view
+
+    def lift(self):
+        return self.view("hyperboloid")
+
+    def ball(self):
+        return self.view("poincare")
+
+    def prepared(self):
+        cache = self.cache
+        if "X" not in cache:
+            points = cache["points"]
+            if cache["model"] == "poincare":
+                X, H = points, inv_rho_set(points)
+            else:
+                X, H = rho_set(points), points
+            norms2 = np.sum(X*X, axis=1)
+            H_g = H.copy()
+            H_g[:, -1] = -H_g[:, -1]
+            for array in (X, H, norms2, H_g):
+                array.flags.writeable = False
+            cache.update(X=X, norms2=norms2, b=1 - norms2, H=H, H_g=H_g)
+        return cache
+
+    def rows(self):
+        return self.prepared()["X" if self.model == "poincare" else "H"]
+
+    def __len__(self):
+        return len(self.cache["points"])
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __getitem__(self, i):
+        return self.rows()[i]
+
+    def __array__(self, dtype=None, copy=None):
+        rows = self.rows()
+        return rows if dtype is None else rows.astype(dtype)
+
+    def poincare_dists(self, psi):
+        # distances from psi and q, with cosh(d) = 1 + 2q
+        cache = self.prepared()
+        psi = np.ravel(psi)
+        q = np.sum((cache["X"] - psi)**2, axis=1)/((1 - np.dot(psi, psi))*cache["b"])
+        return 2*np.arcsinh(np.sqrt(q)), q
+
+    def hyperboloid_dists(self, theta):
+        # distances from theta and alpha = cosh(d)
+        alpha = np.maximum(-(self.prepared()["H_g"] @ np.ravel(theta)), 1)
+        return np.arccosh(alpha), alpha
+
+
+def prepare(x_set):
+  return x_set if isinstance(x_set, PreparedDataset) else PreparedDataset(x_set)
+
+
+def prepared_poincare_grad(psi, x_set):
+  # frechet_mean_poincare_grad summed over the rows at once, d/sinh(d) -> 1
+  # for the points equal to psi
+  cache = x_set.prepared()
+  psi = np.ravel(psi)
+  d, q = x_set.poincare_dists(psi)
+  sinh_d = 2*np.sqrt(q*(1 + q))
+  coef = 4*np.where(q == 0, 1, d/np.where(q == 0, 1, sinh_d))/cache["b"]
+  a = 1 - np.dot(psi, psi)
+  X = cache["X"]
+  radial = np.dot(coef, cache["norms2"] - 2*(X @ psi) + 1)/a**2
+  return (radial*psi - (coef @ X)/a)*2/len(X)
+
+
+def prepared_hyperboloid_grad(theta, x_set):
+  # frechet_mean_hyperboloid_grad summed over the rows at once
+  cache = x_set.prepared()
+  d, alpha = x_set.hyperboloid_dists(theta)
+  ratio = np.where(d == 0, 1, d/np.where(d == 0, 1, np.sqrt(alpha**2 - 1)))
+  return -(ratio @ cache["H_g"])*2/len(d)
+
+
 def plot_alg(seq, x_set, ax):
   x = np.linspace(-1.0, 1.0, 100)
   y = np.linspace(-1.0, 1.0, 100)
@@ -352,9 +936,24 @@ def poincare_dist(x, y):
   return np.arccosh(1 + 2*(np.dot(x-y, x-y)/((1-np.dot(x,x))*(1-np.dot(y,y)))))
 
 
+def nearest_centroid(manifold, x_set, centroids, block_size=1024, n_jobs=1):
+  # x_set and centroids hold one point per row, as the bunch sets
+  d = manifold.cdist(np.asarray(x_set).T, np.asarray(centroids).T, block_size, n_jobs)
+  labels = np.argmin(d, axis=1)
+  return labels, d[np.arange(len(labels)), labels]
+
+
+def medoid(manifold, x_set, block_size=1024, n_jobs=1):
+  # point of x_set with the smallest frechet function over x_set
+  x_set = np.asarray(x_set)
+  d = manifold.cdist(x_set.T, x_set.T, block_size, n_jobs)
+  i = np.argmin(np.sum(d**2, axis=1))
+  return x_set[i], i
+
+
 def convergence_seq(psi_seq, limit):
   # return [poincare_dist(psi, limit) for psi in psi_seq]
-  return [la.norm(psi - limit) for psi in psi_seq]
+  return la.norm(np.asarray(psi_seq) - limit, axis=1)
 
 
 def plot_seq(x_set, psi_seq, f_seq, g_seq, limit, dim):
@@ -375,37 +974,178 @@ def plot_seq(x_set, psi_seq, f_seq, g_seq, limit, dim):
   conv_seq = convergence_seq(psi_seq, limit)
   ax2.semilogy(conv_seq)
   ax3.semilogy(f_seq)
-  g_norm = [la.norm(g) for g in g_seq]
+  g_norm = la.norm(np.reshape(g_seq, (len(g_seq), -1)), axis=1)
   ax4.semilogy((g_norm))
 
+"""# Stopping Criteria"""
+
+class StoppingCriterion:
+    # called once per iteration with the current point, value and
+    # riemannian gradient, f is None when the solver has not computed it.
+    # The convergence tests never pass on a gradient that is not finite
+    reason = None
+
+    def reset(self):
+        self.reason = None
+
+    def __call__(self, manifold, x, f, g):
+        return False
+
+
+class GradientNorm(StoppingCriterion):
+    def __init__(self, tol=1e-9):
+        self.tol = tol
+
+    def __call__(self, manifold, x, f, g):
+        if np.isfinite(g).all() and manifold.norm(x, g) < self.tol:
+            self.reason = "gradient norm < {}".format(self.tol)
+            return True
+        return False
+
+
+class RelativeDecrease(StoppingCriterion):
+    def __init__(self, tol=1e-12):
+        self.tol = tol
+        self.f_prev = None
+
+    def reset(self):
+        super().reset()
+        self.f_prev = None
+
+    def __call__(self, manifold, x, f, g):
+        if f is None or not np.isfinite(g).all():
+            return False
+        f_prev, self.f_prev = self.f_prev, f
+        if f_prev is not None and abs(f_prev - f) <= self.tol*abs(f_prev):
+            self.reason = "relative decrease < {}".format(self.tol)
+            return True
+        return False
+
+
+class StepLength(StoppingCriterion):
+    def __init__(self, tol=1e-12):
+        self.tol = tol
+        self.x_prev = None
+
+    def reset(self):
+        super().reset()
+        self.x_prev = None
+
+    def __call__(self, manifold, x, f, g):
+        x_prev, self.x_prev = self.x_prev, x
+        if x_prev is not None and np.isfinite(g).all() and manifold.dist(x_prev, x) < self.tol:
+            self.reason = "step length < {}".format(self.tol)
+            return True
+        return False
+
+
+class Budget(StoppingCriterion):
+    # evals counts the cost, gradient and hessian evaluations made by the
+    # thread of the solver since the reset at the start of the run, line
+    # searches included
+    def __init__(self, max_seconds=None, max_evals=None):
+        self.max_seconds = max_seconds
+        self.max_evals = max_evals
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.start = time.perf_counter()
+        self.evals_start = thread_profiling.evaluations
+
+    @property
+    def evals(self):
+        return thread_profiling.evaluations - self.evals_start
+
+    def __call__(self, manifold, x, f, g):
+        if self.max_evals is not None and self.evals >= self.max_evals:
+            self.reason = "evaluation budget {} exhausted".format(self.max_evals)
+            return True
+        if self.max_seconds is not None and time.perf_counter() - self.start >= self.max_seconds:
+            self.reason = "time budget {}s exhausted".format(self.max_seconds)
+            return True
+        return False
+
+
+def certified_distance(manifold, x, g):
+  # the frechet function is 2-strongly geodesically convex on hyperbolic
+  # space, hence d(x, x*) <= |grad f(x)| / 2 at every point x; nothing is
+  # certified by a gradient that is not finite
+  if not np.isfinite(g).all():
+    return math.inf
+  return manifold.norm(x, g)/2
+
+
+class CertifiedDistance(StoppingCriterion):
+    def __init__(self, tol=1e-6):
+        self.tol = tol
+        self.bound = math.inf
+
+    def __call__(self, manifold, x, f, g):
+        self.bound = certified_distance(manifold, x, g)
+        if self.bound <= self.tol:
+            self.reason = "distance to the minimizer <= {}".format(self.tol)
+            return True
+        return False
+
+
+class AnyOf(StoppingCriterion):
+    def __init__(self, *criteria):
+        self.criteria = criteria
+
+    def reset(self):
+        super().reset()
+        for criterion in self.criteria:
+            criterion.reset()
+
+    def __call__(self, manifold, x, f, g):
+        # every criterion sees every iterate, so the stateful ones stay in sync
+        stop = [criterion(manifold, x, f, g) for criterion in self.criteria]
+        if any(stop):
+            self.reason = "; ".join(c.reason for c, s in zip(self.criteria, stop) if s)
+            return True
+        return False
+
+
+def stop_test(stop, manifold, x, f, g):
+  if stop is None:
+    # also false on nan
+    return la.norm(g) < 10e-10
+  return stop(manifold, x, f, g)
+
 """# Optimization Algorithm
 
 ## Fixed Lenght Step Size
 """
 
-def optimisation_fixed_lenght(manifold, x_0, f_grad, x_set, learning_rate, max_steps=10, limited=True):
+def optimisation_fixed_lenght(manifold, x_0, f_grad, x_set, learning_rate, max_steps=10, limited=True, stop=None):
   x_seq = [x_0]
   f_seq = []
   g_seq = []
 
   k = 0
+  if stop is not None:
+    stop.reset()
 
   while True:
     psi = x_seq[-1]
-    g = f_grad(psi, x_set, manifold)
-
-    if la.norm(g) < 10e-10:
-      break
+    with phase("direction"):
+      g = f_grad(psi, x_set, manifold)
 
     if np.isnan(g).any():
       x_seq = x_seq[:-1]
       break
 
-    new_psi=manifold.exp(psi, -learning_rate*g)
+    if stop_test(stop, manifold, psi, f_seq[-1] if f_seq else None, g):
+      break
 
-    x_seq.append(new_psi)
-    f_seq.append(frechet_mean(new_psi, x_set, manifold.dist))
-    g_seq.append(g)
+    with phase("line_search"):
+      new_psi=manifold.exp(psi, -learning_rate*g)
+
+    with phase("logging"):
+      x_seq.append(new_psi)
+      f_seq.append(frechet_mean(new_psi, x_set, manifold))
+      g_seq.append(g)
 
     # forced exit condition
     k = k+1
@@ -415,45 +1155,268 @@ def optimisation_fixed_lenght(manifold, x_0, f_grad, x_set, learning_rate, max_s
   return x_seq, f_seq, g_seq
 
 
-def optimisation_fl_poincare(psi_0, x_set, learning_rate, max_steps=10, limited=True):
-  return optimisation_fixed_lenght(PoincareManifold, psi_0, frechet_mean_poincare_rgrad, x_set, learning_rate, max_steps, limited)
+def optimisation_fl_poincare(psi_0, x_set, learning_rate, max_steps=10, limited=True, stop=None):
+  return optimisation_fixed_lenght(PoincareManifold, psi_0, frechet_mean_poincare_rgrad, prepare(x_set), learning_rate, max_steps, limited, stop)
 
 
-def optimisation_fl_hyperboloid(psi_0, x_set, learning_rate, max_steps=10, limited=True):
-  psi_seq, f_seq, g_seq = optimisation_fixed_lenght(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, [inv_rho(x_i) for x_i in x_set], learning_rate, max_steps, limited)
+def optimisation_fl_hyperboloid(psi_0, x_set, learning_rate, max_steps=10, limited=True, stop=None):
+  psi_seq, f_seq, g_seq = optimisation_fixed_lenght(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, prepare(x_set).lift(), learning_rate, max_steps, limited, stop)
+  return [rho(psi) for psi in psi_seq], f_seq, g_seq
+
+"""## Accelerated Gradient"""
+
+def accelerated_gradient(manifold, x_0, f_grad, x_set, learning_rate, max_steps=100, kappa=None,
+                         restart="function", transp=None, stop=None):
+  # nesterov momentum along geodesics: the gradient step is taken from
+  # y_k, then y_k+1 extrapolates the geodesic from x_k through x_k+1.
+  # kappa = L/mu gives the constant momentum (sqrt(kappa)-1)/(sqrt(kappa)+1)
+  # of the strongly convex case, otherwise t_k follows nesterov's sequence.
+  # restart is "function" (f increases) or "gradient" (the transported
+  # gradient points along the last step, or f increases), and sets the
+  # momentum back to 0
+  transp = manifold.transp if transp is None else transp
+  x_seq = [x_0]
+  f_seq = []
+  g_seq = []
+
+  k = 0
+  if stop is not None:
+    stop.reset()
+
+  y_k = x_0
+  t_k = 1
+  f_k = frechet_mean(x_0, x_set, manifold)
+
+  while True:
+    x_k = x_seq[-1]
+    with phase("direction"):
+      g_y = f_grad(y_k, x_set, manifold)
+    if np.isnan(g_y).any():
+      if y_k is x_k:
+        x_seq = x_seq[:-1]
+        break
+      # the extrapolated point is lost, restart from x_k
+      y_k = x_k
+      t_k = 1
+      continue
+    if stop_test(stop, manifold, y_k, None, g_y):
+      if y_k is not x_k:
+        x_seq.append(y_k)
+        f_seq.append(frechet_mean(y_k, x_set, manifold))
+        g_seq.append(g_y)
+      break
+
+    with phase("line_search"):
+      new_x = manifold.exp(y_k, -learning_rate*g_y)
+      f_new = frechet_mean(new_x, x_set, manifold)
+
+    # the gradient test cannot see a step overshooting the minimum along
+    # it, an increase of f restarts in both modes
+    restarted = not f_new <= f_k
+    if restart == "gradient" and not restarted:
+      with phase("transport"):
+        restarted = manifold.inner(new_x, transp(y_k, new_x, g_y), -manifold.log(new_x, x_k)) > 0
+
+    if restarted and y_k is not x_k:
+      # drop the momentum and redo the step from x_k
+      y_k = x_k
+      t_k = 1
+    elif not np.isfinite(f_new):
+      break
+    else:
+      with phase("logging"):
+        x_seq.append(new_x)
+        f_seq.append(f_new)
+        g_seq.append(g_y)
+
+      with phase("direction"):
+        t_new = (1 + math.sqrt(1 + 4*t_k**2))/2
+        if kappa is not None:
+          beta = (math.sqrt(kappa) - 1)/(math.sqrt(kappa) + 1)
+        else:
+          beta = (t_k - 1)/t_new
+        t_k = 1 if restarted else t_new
+        y_k = new_x
+        if beta > 0 and not restarted:
+          y_new = manifold.exp(new_x, -beta*manifold.log(new_x, x_k))
+          if not np.isnan(y_new).any():
+            y_k = y_new
+      f_k = f_new
+
+    # forced exit condition
+    k = k+1
+    if k >= max_steps:
+      break
+
+  return x_seq, f_seq, g_seq
+
+
+def accelerated_poincare(psi_0, x_set, learning_rate, max_steps=100, kappa=None, restart="function", stop=None, transp=None):
+  return accelerated_gradient(PoincareManifold, psi_0, frechet_mean_poincare_rgrad, prepare(x_set), learning_rate, max_steps, kappa, restart, transp, stop)
+
+
+def accelerated_hyperboloid(psi_0, x_set, learning_rate, max_steps=100, kappa=None, restart="function", stop=None):
+  psi_seq, f_seq, g_seq = accelerated_gradient(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, prepare(x_set).lift(), learning_rate, max_steps, kappa, restart, stop=stop)
   return [rho(psi) for psi in psi_seq], f_seq, g_seq
 
 """## Armijo"""
 
 def armijo_step_riemannian(manifold, theta, x_set, g_k, sigma, gamma, lambda_):
   h = 0
-  while frechet_mean(manifold.exp(theta, -(sigma**h)*lambda_*g_k), x_set, manifold.dist) > frechet_mean(theta, x_set, manifold.dist) + gamma*(sigma**h)*lambda_*manifold.inner(theta, g_k, -g_k):
+  f_theta = frechet_mean(theta, x_set, manifold)
+  slope = manifold.inner(theta, g_k, -g_k)
+  while frechet_mean(manifold.exp(theta, -(sigma**h)*lambda_*g_k), x_set, manifold) > f_theta + gamma*(sigma**h)*lambda_*slope:
     h += 1
   return h
 
 
-def armijo_optimization(manifold, x_0, f_grad, x_set, sigma, gamma, lambda_, max_steps=10):
+def armijo_optimization(manifold, x_0, f_grad, x_set, sigma, gamma, lambda_, max_steps=10, stop=None):
   x_seq = [x_0]
   f_seq = []
   g_seq = []
 
   k = 0
+  if stop is not None:
+    stop.reset()
 
   while True:
     x_k = x_seq[-1]
-    g_k = f_grad(x_k, x_set, manifold)
+    with phase("direction"):
+      g_k = f_grad(x_k, x_set, manifold)
     if np.isnan(g_k).any():
       x_seq = x_seq[:-1]
       break
-    if la.norm(g_k) < 10e-10:
+    if stop_test(stop, manifold, x_k, f_seq[-1] if f_seq else None, g_k):
       break
 
-    h_k = armijo_step_riemannian(manifold, x_k, x_set, g_k, sigma, gamma, lambda_)
-    new_psi = manifold.exp(x_k, -(sigma**h_k)*lambda_*g_k)
+    with phase("line_search"):
+      h_k = armijo_step_riemannian(manifold, x_k, x_set, g_k, sigma, gamma, lambda_)
+      new_psi = manifold.exp(x_k, -(sigma**h_k)*lambda_*g_k)
     
-    x_seq.append(new_psi)
-    f_seq.append(frechet_mean(new_psi, x_set, manifold.dist))
-    g_seq.append(g_k)
+    with phase("logging"):
+      x_seq.append(new_psi)
+      f_seq.append(frechet_mean(new_psi, x_set, manifold))
+      g_seq.append(g_k)
+
+    # forced exit condition
+    k = k+1
+    if k >= max_steps:
+      break
+
+  return x_seq, f_seq, g_seq
+
+
+def armijo_poincare(psi_0, x_set, sigma, gamma, lambda_, max_steps=10, stop=None):
+  return armijo_optimization(PoincareManifold, psi_0 , frechet_mean_poincare_rgrad, prepare(x_set), sigma, gamma, lambda_, max_steps, stop)
+
+
+def armijo_hyperboloid(psi_0, x_set, sigma, gamma, lambda_, max_steps=10, stop=None):
+  psi_seq, f_seq, g_seq = armijo_optimization(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, prepare(x_set).lift(), sigma, gamma, lambda_, max_steps, stop)
+  return [rho(psi) for psi in psi_seq], f_seq, g_seq
+
+"""## Armijo with interpolation"""
+
+def interpolate_step(f_0, dphi0, alpha, f_alpha, alpha_prev=None, f_prev=None):
+  # minimizer of the quadratic through phi(0), phi'(0), phi(alpha) or, with a
+  # previous trial, of the cubic also through phi(alpha_prev)
+  if alpha_prev is None:
+    return -dphi0*alpha**2/(2*(f_alpha - f_0 - dphi0*alpha))
+  d1 = f_alpha - f_0 - dphi0*alpha
+  d0 = f_prev - f_0 - dphi0*alpha_prev
+  den = alpha_prev**2*alpha**2*(alpha - alpha_prev)
+  a = (alpha_prev**2*d1 - alpha**2*d0)/den
+  b = (-alpha_prev**3*d1 + alpha**3*d0)/den
+  if a == 0:
+    return -dphi0/(2*b)
+  return (-b + math.sqrt(max(b*b - 3*a*dphi0, 0)))/(3*a)
+
+
+def armijo_interpolation(manifold, f_grad, x_set, x, f_x, g, d, alpha_0, gamma=1e-4, max_iters=30, f_ref=None,
+                         approximate=False):
+  # backtracking along exp(x, alpha*d) with interpolated trial steps,
+  # returns the accepted step, point, value and gradient; f_ref replaces
+  # f_x in the sufficient decrease test of the nonmonotone searches.
+  # approximate also accepts on the slope once the decrease is below the
+  # rounding of f
+  dphi0 = manifold.inner(x, g, d)
+  f_ref = f_x if f_ref is None else f_ref
+  alpha = alpha_0
+  alpha_prev = f_prev = None
+  for _ in range(max_iters):
+    new_x = manifold.exp(x, alpha*d)
+    f_new = frechet_mean(new_x, x_set, manifold)
+    if f_new <= f_ref + gamma*alpha*dphi0:
+      return alpha, new_x, f_new, f_grad(new_x, x_set, manifold)
+    if approximate and abs(f_new - f_x) <= 1e-12*abs(f_x):
+      # the decrease is below the rounding of f, accept on the slope
+      # instead (approximate Armijo condition of Hager and Zhang)
+      g_new = f_grad(new_x, x_set, manifold)
+      if manifold.inner(new_x, g_new, manifold.transp(x, new_x, d)) <= -(1 - 2*gamma)*dphi0:
+        return alpha, new_x, f_new, g_new
+    if np.isfinite(f_new):
+      alpha_new = interpolate_step(f_x, dphi0, alpha, f_new, alpha_prev, f_prev)
+      alpha_prev, f_prev = alpha, f_new
+    else:
+      alpha_new = 0.1*alpha
+    # keep the new trial in [alpha/10, alpha/2]
+    if not np.isfinite(alpha_new):
+      alpha_new = 0.5*alpha
+    alpha = min(max(alpha_new, 0.1*alpha), 0.5*alpha)
+  return 0, x, f_x, g
+
+
+def approximate_armijo(manifold, f_grad, x_set, x, f_x, g, d, alpha_0, gamma=1e-4, max_iters=30, f_ref=None):
+  # line search of RCG and LBFGS, which iterate down to gradients whose
+  # decrease f cannot resolve
+  return armijo_interpolation(manifold, f_grad, x_set, x, f_x, g, d, alpha_0, gamma, max_iters, f_ref, approximate=True)
+
+
+def initial_step(lambda_, alpha_prev, f_k, f_prev, dphi0):
+  # first-order guess 2 (f_k - f_prev) / phi'(0) from the last decrease
+  if alpha_prev is None:
+    return lambda_
+  alpha = 1.01*2*(f_k - f_prev)/dphi0
+  if not np.isfinite(alpha) or alpha <= 0:
+    alpha = alpha_prev
+  return min(lambda_, alpha)
+
+
+def armijo_adaptive_optimization(manifold, x_0, f_grad, x_set, gamma, lambda_, max_steps=10, stop=None):
+  x_seq = [x_0]
+  f_seq = []
+  g_seq = []
+
+  k = 0
+  if stop is not None:
+    stop.reset()
+
+  alpha_k = None
+  f_prev = None
+  f_k = frechet_mean(x_0, x_set, manifold)
+  with phase("direction"):
+    g_k = f_grad(x_0, x_set, manifold)
+
+  while True:
+    x_k = x_seq[-1]
+    if np.isnan(g_k).any():
+      x_seq = x_seq[:-1]
+      break
+    if stop_test(stop, manifold, x_k, f_k, g_k):
+      break
+
+    with phase("line_search"):
+      dphi0 = manifold.inner(x_k, g_k, -g_k)
+      alpha_0 = initial_step(lambda_, alpha_k, f_k, f_prev, dphi0)
+      alpha_k, new_x, f_new, g_new = armijo_interpolation(manifold, f_grad, x_set, x_k, f_k, g_k, -g_k, alpha_0, gamma)
+    if alpha_k == 0:
+      break
+
+    with phase("logging"):
+      x_seq.append(new_x)
+      f_seq.append(f_new)
+      g_seq.append(g_k)
+
+    f_prev, f_k, g_k = f_k, f_new, g_new
 
     # forced exit condition
     k = k+1
@@ -463,17 +1426,18 @@ def armijo_optimization(manifold, x_0, f_grad, x_set, sigma, gamma, lambda_, max
   return x_seq, f_seq, g_seq
 
 
-def armijo_poincare(psi_0, x_set, sigma, gamma, lambda_, max_steps=10):
-  return armijo_optimization(PoincareManifold, psi_0 , frechet_mean_poincare_rgrad, x_set, sigma, gamma, lambda_, max_steps)
+def armijo_adaptive_poincare(psi_0, x_set, gamma, lambda_, max_steps=10, stop=None):
+  return armijo_adaptive_optimization(PoincareManifold, psi_0, frechet_mean_poincare_rgrad, prepare(x_set), gamma, lambda_, max_steps, stop)
 
 
-def armijo_hyperboloid(psi_0, x_set, sigma, gamma, lambda_, max_steps=10):
-  psi_seq, f_seq, g_seq = armijo_optimization(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, [inv_rho(x_i) for x_i in x_set], sigma, gamma, lambda_, max_steps)
+def armijo_adaptive_hyperboloid(psi_0, x_set, gamma, lambda_, max_steps=10, stop=None):
+  psi_seq, f_seq, g_seq = armijo_adaptive_optimization(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, prepare(x_set).lift(), gamma, lambda_, max_steps, stop)
   return [rho(psi) for psi in psi_seq], f_seq, g_seq
 
 """## Barzilai Borwein"""
 
-def RBB(manifold, x_0, f_grad, x_set, a_min, a_max, max_steps=100):
+def RBB(manifold, x_0, f_grad, x_set, a_min, a_max, max_steps=100, stop=None, transp=None):
+  transp = manifold.transp if transp is None else transp
   x_seq = [x_0]
   f_seq = []
   g_seq = []
@@ -481,31 +1445,41 @@ def RBB(manifold, x_0, f_grad, x_set, a_min, a_max, max_steps=100):
   a_BB = a_min
 
   k = 0
+  if stop is not None:
+    stop.reset()
 
   g_k = f_grad(x_0, x_set, manifold)
   while True:
-    if la.norm(g_k) < 10e-10:
+    x_k = x_seq[-1]
+
+    if np.isnan(g_k).any():
+      x_seq = x_seq[:-1]
       break
 
-    x_k = x_seq[-1]
+    if stop_test(stop, manifold, x_k, f_seq[-1] if f_seq else None, g_k):
+      break
 
     a_k = a_BB
-    new_psi = manifold.exp(x_k, -a_k*g_k)
-    new_g = f_grad(new_psi, x_set, manifold)
-
-    x_seq.append(new_psi)
-    f_seq.append(frechet_mean(new_psi, x_set, manifold.dist))
-    g_seq.append(g_k)
+    with phase("line_search"):
+      new_psi = manifold.exp(x_k, -a_k*g_k)
+    with phase("direction"):
+      new_g = f_grad(new_psi, x_set, manifold)
+
+    with phase("logging"):
+      x_seq.append(new_psi)
+      f_seq.append(frechet_mean(new_psi, x_set, manifold))
+      g_seq.append(g_k)
     
-    s_k = -a_k*manifold.transp(x_k, new_psi, g_k)
-    y_k = new_g + s_k/a_k
-
-    tmp = manifold.inner(new_psi, s_k, y_k)
-    if tmp > 0:
-      new_tau = manifold.inner(new_psi, s_k, s_k)/(tmp)
-      a_BB = min(a_max, max(a_min, new_tau))
-    else:
-      a_BB = a_max
+    with phase("transport"):
+      s_k = -a_k*transp(x_k, new_psi, g_k)
+      y_k = new_g + s_k/a_k
+
+      tmp = manifold.inner(new_psi, s_k, y_k)
+      if tmp > 0:
+        new_tau = manifold.inner(new_psi, s_k, s_k)/(tmp)
+        a_BB = min(a_max, max(a_min, new_tau))
+      else:
+        a_BB = a_max
 
     # forced exit condition
     k = k+1
@@ -517,12 +1491,98 @@ def RBB(manifold, x_0, f_grad, x_set, a_min, a_max, max_steps=100):
   return x_seq, f_seq, g_seq
 
 
-def RBB_poincare(psi_0, x_set, a_min, a_max, max_steps=100):
-  return RBB(PoincareManifold, psi_0, frechet_mean_poincare_rgrad, x_set, a_min, a_max, max_steps)
+def RBB_poincare(psi_0, x_set, a_min, a_max, max_steps=100, stop=None, transp=None):
+  return RBB(PoincareManifold, psi_0, frechet_mean_poincare_rgrad, prepare(x_set), a_min, a_max, max_steps, stop, transp)
+
+
+def RBB_hyperboloid(psi_0, x_set, a_min, a_max, max_steps=100, stop=None):
+  psi_seq, f_seq, g_seq = RBB(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, prepare(x_set).lift(), a_min, a_max, max_steps, stop)
+  return [rho(psi) for psi in psi_seq], f_seq, g_seq
+
+
+def BB_step(manifold, x, s_k, y_k, k, rule):
+  # BB1 = <s,s>/<s,y>, BB2 = <s,y>/<y,y>, "alternate" uses BB1 on even k;
+  # with <s,y> <= 0 both are meaningless and |s|/|y| is used instead
+  if rule not in ("BB1", "BB2", "alternate"):
+    raise ValueError("unknown BB rule {}".format(rule))
+  sy = manifold.inner(x, s_k, y_k)
+  if sy <= 0:
+    y_norm = manifold.norm(x, y_k)
+    return manifold.norm(x, s_k)/y_norm if y_norm > 0 else math.inf
+  if rule == "BB1" or (rule == "alternate" and k % 2 == 0):
+    return manifold.inner(x, s_k, s_k)/sy
+  return sy/manifold.inner(x, y_k, y_k)
+
+
+def RBB_nonmonotone(manifold, x_0, f_grad, x_set, a_min, a_max, max_steps=100, M=10, rule="alternate",
+                    nonmonotone="GLL", eta=0.85, gamma=1e-4, stop=None, transp=None):
+  # nonmonotone="GLL" tests against the max of the last M values (Grippo,
+  # Lampariello, Lucidi), "ZH" against the average C_k of Zhang and Hager
+  if nonmonotone not in ("GLL", "ZH"):
+    raise ValueError("unknown nonmonotone rule {}".format(nonmonotone))
+  if rule not in ("BB1", "BB2", "alternate"):
+    raise ValueError("unknown BB rule {}".format(rule))
+  transp = manifold.transp if transp is None else transp
+  x_seq = [x_0]
+  f_seq = []
+  g_seq = []
+
+  k = 0
+  if stop is not None:
+    stop.reset()
+
+  f_k = frechet_mean(x_0, x_set, manifold)
+  with phase("direction"):
+    g_k = f_grad(x_0, x_set, manifold)
+  f_window = [f_k]
+  C_k, Q_k = f_k, 1
+  # the first step is 1/|g|, a stationary start stops before using it
+  g_norm = manifold.norm(x_0, g_k)
+  a_BB = min(a_max, max(a_min, 1/g_norm)) if g_norm > 0 else a_max
+
+  while True:
+    x_k = x_seq[-1]
+    if np.isnan(g_k).any():
+      x_seq = x_seq[:-1]
+      break
+    if stop_test(stop, manifold, x_k, f_k, g_k):
+      break
+
+    with phase("line_search"):
+      f_ref = max(f_window) if nonmonotone == "GLL" else C_k
+      a_k, new_x, f_new, g_new = armijo_interpolation(manifold, f_grad, x_set, x_k, f_k, g_k, -g_k, a_BB, gamma, f_ref=f_ref)
+    if a_k == 0:
+      break
+
+    with phase("logging"):
+      x_seq.append(new_x)
+      f_seq.append(f_new)
+      g_seq.append(g_k)
+
+    with phase("transport"):
+      s_k = -a_k*transp(x_k, new_x, g_k)
+      y_k = g_new - transp(x_k, new_x, g_k)
+      a_BB = min(a_max, max(a_min, BB_step(manifold, new_x, s_k, y_k, k, rule)))
+
+    f_window = (f_window + [f_new])[-M:]
+    Q_new = eta*Q_k + 1
+    C_k, Q_k = (eta*Q_k*C_k + f_new)/Q_new, Q_new
+    f_k, g_k = f_new, g_new
+
+    # forced exit condition
+    k = k+1
+    if k >= max_steps:
+      break
+
+  return x_seq, f_seq, g_seq
+
+
+def RBB_nonmonotone_poincare(psi_0, x_set, a_min, a_max, max_steps=100, M=10, rule="alternate", nonmonotone="GLL", stop=None, transp=None):
+  return RBB_nonmonotone(PoincareManifold, psi_0, frechet_mean_poincare_rgrad, prepare(x_set), a_min, a_max, max_steps, M, rule, nonmonotone, stop=stop, transp=transp)
 
 
-def RBB_hyperboloid(psi_0, x_set, a_min, a_max, max_steps=100):
-  psi_seq, f_seq, g_seq = RBB(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, [inv_rho(x) for x in x_set], a_min, a_max, max_steps)
+def RBB_nonmonotone_hyperboloid(psi_0, x_set, a_min, a_max, max_steps=100, M=10, rule="alternate", nonmonotone="GLL", stop=None):
+  psi_seq, f_seq, g_seq = RBB_nonmonotone(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, prepare(x_set).lift(), a_min, a_max, max_steps, M, rule, nonmonotone, stop=stop)
   return [rho(psi) for psi in psi_seq], f_seq, g_seq
 
 """## L-BFGS"""
@@ -538,10 +1598,10 @@ def zoom(manifold, f_grad, x_set, f_0, x_0, g_0, p, alpha_lo, alpha_hi, max_iter
     alpha_i = 0.5*(alpha_lo + alpha_hi)
     alpha = alpha_i
     x_i = manifold.exp(x_0, alpha_i*p)
-    f_i = frechet_mean(x_i, x_set, manifold.dist)
+    f_i = frechet_mean(x_i, x_set, manifold)
     g_i = f_grad(x_i, x_set, manifold)
     x_lo = manifold.exp(x_0, alpha_lo*p)
-    f_lo = frechet_mean(x_lo, x_set, manifold.dist)
+    f_lo = frechet_mean(x_lo, x_set, manifold)
 
     if f_i > f_0 + c1*alpha_i*dphi0 or f_i >= f_lo:
       alpha_hi = alpha_i
@@ -568,17 +1628,17 @@ def strong_wolfe(manifold, f_grad, x_0, x_set, g_0, p, max_iter=20):
   alpha_im1 = 0
   alpha_i = 1
   i = 0
-  f_0 = frechet_mean(x_0, x_set, HyperboloidManifold.dist)
+  f_0 = frechet_mean(x_0, x_set, manifold)
   f_im1 = f_0
 
   dphi0 = manifold.inner(x_0, g_0, p)
 
   while True:
     x_i = manifold.exp(x_0, alpha_i*p)
-    f_i = frechet_mean(x_i, x_set, manifold.dist)
+    f_i = frechet_mean(x_i, x_set, manifold)
     g_i = f_grad(x_i, x_set, manifold)
 
-    if f_i > f_0 + c1*dphi0 or (i>1 and f_i >= f_im1):
+    if f_i > f_0 + c1*alpha_i*dphi0 or (i>1 and f_i >= f_im1):
       return zoom(manifold, f_grad, x_set, f_0, x_0, g_0, p, alpha_im1, alpha_i)
     
     dphi = manifold.inner(x_i, g_i, manifold.transp(x_0, x_i, p))
@@ -599,168 +1659,542 @@ def strong_wolfe(manifold, f_grad, x_0, x_set, g_0, p, max_iter=20):
     i = i+1
 
 
-def choice_dir_LBFGS(manifold, l, k, x_k, g_k, s_seq, y_seq, p_seq, gamma_seq):
+def choice_dir_LBFGS(manifold, x_k, g_k, s_seq, y_seq, r_seq, gamma):
+  # two loop recursion with H_0 = gamma I, the pairs are stored from the
+  # oldest to the newest and r_i = 1/<s_i, y_i>
   q = g_k
   alpha = []
-
-  for i in reversed(range(k-l-1)):
-    a_i = p_seq[i]*manifold.inner(x_k, s_seq[i], q)
-    q = q - a_i*y_seq[i]
+  for s_i, y_i, r_i in zip(reversed(s_seq), reversed(y_seq), reversed(r_seq)):
+    a_i = r_i*manifold.inner(x_k, s_i, q)
+    q = q - a_i*y_i
     alpha.append(a_i)
   alpha.reverse()
 
-  H = gamma_seq[-1] * np.eye(g_k.shape[0])
-  z = np.dot(H, q)
-  for i in range(k-l-1):
-    b = p_seq[i]*manifold.inner(x_k, y_seq[i], z)
-    z = z + s_seq[i]*(alpha[i] - b)
+  z = gamma*q
+  for s_i, y_i, r_i, a_i in zip(s_seq, y_seq, r_seq, alpha):
+    b = r_i*manifold.inner(x_k, y_i, z)
+    z = z + s_i*(a_i - b)
   return z
 
 
-def LBFGS_poincare(psi_0, f_grad, x_set, M, p_min, p_max, max_steps=100):
-  psi_seq = [psi_0]
-  f_seq = []
-  g_seq = []
+def LBFGS(manifold, x_0, f_grad, x_set, M, p_min, p_max, max_steps=100, stop=None, transp=None,
+          line_search=approximate_armijo, cautious=1e-6):
+  # gamma = <s,y>/<y,y> of the latest kept pair clipped to [p_min, p_max].
+  # A pair is kept only when <s,y> >= cautious |g| |s|^2 (cautious update of
+  # Li and Fukushima); the memory is dropped and a steepest descent step
+  # taken when the direction is not a descent one or the search fails on it
+  transp = manifold.transp if transp is None else transp
+  x_seq = [x_0]
   s_seq = []
   y_seq = []
-  p_seq = []
-  gamma_seq = [1]
-  
+  r_seq = []
+  gamma = min(p_max, max(p_min, 1))
+
   k = 0
-  l = 0
+  if stop is not None:
+    stop.reset()
 
-  g_k = f_grad(psi_0, x_set, PoincareManifold)
-  g_seq.append(g_k)
-  f_seq.append(frechet_mean(psi_0, x_set, PoincareManifold.dist))
+  f_k = frechet_mean(x_0, x_set, manifold)
+  with phase("direction"):
+    g_k = f_grad(x_0, x_set, manifold)
+  f_seq = []
+  g_seq = []
 
   while True:
-    if la.norm(g_k) < 10e-10:
-      g_seq.append(g_new)
+    x_k = x_seq[-1]
+    if np.isnan(g_k).any():
+      x_seq, f_seq, g_seq = x_seq[:-1], f_seq[:-1], g_seq[:-1]
+      break
+    if stop_test(stop, manifold, x_k, f_k, g_k):
       break
 
-    psi = psi_seq[-1]
+    with phase("direction"):
+      d_k = -choice_dir_LBFGS(manifold, x_k, g_k, s_seq, y_seq, r_seq, gamma)
+      # also false on nan
+      if not manifold.inner(x_k, g_k, d_k) < -1e-10*manifold.norm(x_k, g_k)*manifold.norm(x_k, d_k):
+        s_seq, y_seq, r_seq = [], [], []
+        d_k = -gamma*g_k
+
+    with phase("line_search"):
+      alpha_k, new_x, f_new, g_new = line_search(manifold, f_grad, x_set, x_k, f_k, g_k, d_k, 1)
+      if alpha_k == 0 and s_seq:
+        s_seq, y_seq, r_seq = [], [], []
+        d_k = -gamma*g_k
+        alpha_k, new_x, f_new, g_new = line_search(manifold, f_grad, x_set, x_k, f_k, g_k, d_k, 1)
+    if alpha_k == 0:
+      break
 
-    z = choice_dir_LBFGS(PoincareManifold, l, k, psi, g_k, s_seq, y_seq, p_seq, gamma_seq)
-    step_size = 1 #strong_wolfe(PoincareManifold, f_grad, psi, x_set, g_k, -z)
-    new_psi = PoincareManifold.exp(psi, -step_size*z)
-    g_new = f_grad(new_psi, x_set, PoincareManifold)
+    with phase("logging"):
+      x_seq.append(new_x)
+      f_seq.append(f_new)
+      g_seq.append(g_k)
+
+    with phase("transport"):
+      s_k = transp(x_k, new_x, alpha_k*d_k)
+      # scaling of Huang, Gallivan and Absil, 1 for an isometric transport
+      tmp = manifold.norm(new_x, s_k)
+      beta_k = 1
+      if tmp != 0:
+        beta_k = alpha_k*manifold.norm(x_k, d_k)/tmp
+      y_k = g_new/beta_k - transp(x_k, new_x, g_k)
+      s_seq = [transp(x_k, new_x, s_i) for s_i in s_seq]
+      y_seq = [transp(x_k, new_x, y_i) for y_i in y_seq]
+
+      sy = manifold.inner(new_x, s_k, y_k)
+      yy = manifold.inner(new_x, y_k, y_k)
+      if np.isfinite(sy) and yy > 0 and sy >= cautious*manifold.norm(new_x, g_new)*manifold.inner(new_x, s_k, s_k):
+        s_seq.append(s_k)
+        y_seq.append(y_k)
+        r_seq.append(1/sy)
+        if len(s_seq) > M:
+          s_seq.pop(0)
+          y_seq.pop(0)
+          r_seq.pop(0)
+        gamma = min(p_max, max(p_min, sy/yy))
+
+    f_k, g_k = f_new, g_new
 
-    psi_seq.append(new_psi)
-    f_seq.append(frechet_mean(new_psi, x_set, PoincareManifold.dist))
-    g_seq.append(g_new)
-    
-    g_k = g_new
-
-    tmp = PoincareManifold.norm(new_psi, PoincareManifold.transp(psi, new_psi, -step_size*z))
-    beta_k = 1
-    if tmp != 0:
-      beta_k = PoincareManifold.norm(psi, -step_size*z)/tmp
-    s_k = PoincareManifold.transp(psi, new_psi, -step_size*z)
-    y_k = g_new/beta_k - PoincareManifold.transp(psi, new_psi, g_k)
-    
-    gamma_seq.append(PoincareManifold.inner(new_psi, s_k, y_k)/PoincareManifold.inner(new_psi, y_k, y_k))
+    # forced exit condition
+    k = k+1
+    if k >= max_steps:
+      break
 
-    tmp = PoincareManifold.inner(new_psi, s_k, y_k)
-    if tmp > 0:
-      new_p = 1/tmp 
-      p_k = min(p_max, max(p_min, new_p))
-    else:
-      p_k = p_max
+  return x_seq, f_seq, g_seq
 
-    l = max(k-M, 0)
 
-    s_seq.append(s_k)
-    y_seq.append(y_k)
-    p_seq.append(p_k)
-    if k>=M:
-      s_seq.pop(0)
-      y_seq.pop(0)
-      p_seq.pop(0)
-    
-    for i in range(k-l):
-      s_seq[i] = PoincareManifold.transp(psi, new_psi, s_seq[i])
-      y_seq[i] = PoincareManifold.transp(psi, new_psi, y_seq[i])
+def LBFGS_poincare(psi_0, f_grad, x_set, M, p_min, p_max, max_steps=100, stop=None, transp=None):
+  return LBFGS(PoincareManifold, psi_0, f_grad, prepare(x_set), M, p_min, p_max, max_steps, stop, transp)
 
+
+def LBFGS_hyperboloid(psi_0, f_grad, x_set, M, p_min, p_max, max_steps=100, stop=None):
+  psi_seq, f_seq, g_seq = LBFGS(HyperboloidManifold, inv_rho(psi_0), f_grad, prepare(x_set).lift(), M, p_min, p_max, max_steps, stop)
+  return [rho(psi) for psi in psi_seq], f_seq, g_seq
+
+"""## Conjugate Gradient"""
+
+def CG_beta(manifold, x, g_new, g_old_t, d_old_t, g_old_norm2, beta_rule, eta=0.01):
+  # g_old_t and d_old_t are the previous gradient and direction already
+  # transported to x
+  g_new_norm2 = manifold.inner(x, g_new, g_new)
+  if beta_rule == "FR":
+    return g_new_norm2/g_old_norm2
+  y_k = g_new - g_old_t
+  if beta_rule == "PR+":
+    return max(0, manifold.inner(x, g_new, y_k)/g_old_norm2)
+  if beta_rule == "HZ":
+    dy = manifold.inner(x, d_old_t, y_k)
+    if dy == 0:
+      return 0
+    beta = manifold.inner(x, y_k - 2*d_old_t*manifold.inner(x, y_k, y_k)/dy, g_new)/dy
+    eta_k = -1/(manifold.norm(x, d_old_t)*min(eta, math.sqrt(g_old_norm2)))
+    return max(beta, eta_k)
+  raise ValueError("unknown beta rule {}".format(beta_rule))
+
+
+def RCG(manifold, x_0, f_grad, x_set, beta_rule="PR+", lambda_=1, max_steps=100, restart=None,
+        transp=None, line_search=approximate_armijo, stop=None):
+  # restart is the number of iterations between two steepest descent steps,
+  # a restart also happens whenever the new direction is not a descent one
+  transp = manifold.transp if transp is None else transp
+  restart = len(x_0) if restart is None else restart
+  x_seq = [x_0]
+  f_seq = []
+  g_seq = []
+
+  k = 0
+  if stop is not None:
+    stop.reset()
+
+  alpha_k = None
+  f_prev = None
+  f_k = frechet_mean(x_0, x_set, manifold)
+  with phase("direction"):
+    g_k = f_grad(x_0, x_set, manifold)
+    d_k = -g_k
+
+  while True:
+    x_k = x_seq[-1]
+    if np.isnan(g_k).any():
+      x_seq = x_seq[:-1]
+      break
+    if stop_test(stop, manifold, x_k, f_k, g_k):
+      break
+
+    with phase("line_search"):
+      dphi0 = manifold.inner(x_k, g_k, d_k)
+      alpha_0 = initial_step(lambda_, alpha_k, f_k, f_prev, dphi0)
+      alpha_k, new_x, f_new, g_new = line_search(manifold, f_grad, x_set, x_k, f_k, g_k, d_k, alpha_0)
+    if alpha_k == 0:
+      break
+
+    with phase("logging"):
+      x_seq.append(new_x)
+      f_seq.append(f_new)
+      g_seq.append(g_k)
+
+    with phase("transport"):
+      g_old_t = transp(x_k, new_x, g_k)
+      d_old_t = transp(x_k, new_x, d_k)
+
+    with phase("direction"):
+      if (k+1) % restart == 0:
+        d_new = -g_new
+      else:
+        beta = CG_beta(manifold, new_x, g_new, g_old_t, d_old_t, manifold.inner(x_k, g_k, g_k), beta_rule)
+        d_new = -g_new + beta*d_old_t
+        if manifold.inner(new_x, g_new, d_new) >= 0:
+          d_new = -g_new
+
+    f_prev, f_k, g_k, d_k = f_k, f_new, g_new, d_new
+
+    # forced exit condition
     k = k+1
     if k >= max_steps:
       break
 
-  return psi_seq, f_seq, g_seq
+  return x_seq, f_seq, g_seq
+
 
+def RCG_poincare(psi_0, x_set, beta_rule="PR+", max_steps=100, stop=None, transp=None):
+  return RCG(PoincareManifold, psi_0, frechet_mean_poincare_rgrad, prepare(x_set), beta_rule, max_steps=max_steps, transp=transp, stop=stop)
+
+
+def RCG_hyperboloid(psi_0, x_set, beta_rule="PR+", max_steps=100, stop=None):
+  psi_seq, f_seq, g_seq = RCG(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, prepare(x_set).lift(), beta_rule, max_steps=max_steps, stop=stop)
+  return [rho(psi) for psi in psi_seq], f_seq, g_seq
+
+"""## Trust Region"""
+
+def truncated_CG(manifold, x, g, hess, Delta, kappa=0.1, theta=1, max_inner=None):
+  # Steihaug-Toint CG on the model <g, eta> + <eta, Hess eta>/2 inside
+  # |eta| <= Delta, hess is only applied to vectors, returns eta, H eta
+  # and whether the boundary was hit. By default CG may run for as many
+  # iterations as the coordinates of g, at least the tangent dimension
+  max_inner = g.size if max_inner is None else max_inner
+  eta = np.zeros(g.shape)
+  H_eta = np.zeros(g.shape)
+  r = g
+  norm_r0 = manifold.norm(x, r)
+  r_r = norm_r0**2
+  delta = -r
+  e_Pe = 0
+  e_Pd = 0
+  d_Pd = r_r
+
+  for _ in range(max_inner):
+    H_delta = hess(delta)
+    d_Hd = manifold.inner(x, delta, H_delta)
+    alpha = r_r/d_Hd if d_Hd != 0 else math.inf
+    e_Pe_new = e_Pe + 2*alpha*e_Pd + alpha**2*d_Pd
+
+    if d_Hd <= 0 or e_Pe_new >= Delta**2:
+      # follow delta up to the trust region boundary
+      tau = (-e_Pd + math.sqrt(max(0, e_Pd**2 + d_Pd*(Delta**2 - e_Pe))))/d_Pd
+      return eta + tau*delta, H_eta + tau*H_delta, True
+
+    eta = eta + alpha*delta
+    H_eta = H_eta + alpha*H_delta
+    e_Pe = e_Pe_new
+    r = r + alpha*H_delta
+    # manifold.norm clamps the rounding of the minkowski inner at 0
+    norm_r = manifold.norm(x, r)
+    if norm_r <= norm_r0*min(norm_r0**theta, kappa):
+      break
+    r_r_new = norm_r**2
 
-def LBFGS_hyperboloid(psi_0, f_grad, x_set, M, p_min, p_max, max_steps=100):
-  psi_seq = [psi_0]
+    beta = r_r_new/r_r
+    r_r = r_r_new
+    delta = -r + beta*delta
+    e_Pd = beta*(e_Pd + alpha*d_Pd)
+    d_Pd = r_r + beta**2*d_Pd
+
+  return eta, H_eta, False
+
+
+def RTR(manifold, x_0, f_grad, f_hess, x_set, Delta_0=1, Delta_max=10, rho_prime=0.1, max_steps=100, max_inner=None, stop=None):
+  # f_hess(x, x_set, manifold) returns the map u -> Hess f(x)[u]
+  x_seq = [x_0]
   f_seq = []
   g_seq = []
-  s_seq = []
-  y_seq = []
-  p_seq = []
-  gamma_seq = [1]
-  
-  l = 0
-  k = 0
 
-  x_set_h = [inv_rho(x_i) for x_i in x_set]
+  k = 0
+  if stop is not None:
+    stop.reset()
 
-  g_k = f_grad(inv_rho(psi_0), x_set_h, HyperboloidManifold)
-  g_seq.append(g_k)
-  f_seq.append(frechet_mean(psi_0, x_set, PoincareManifold.dist))
+  Delta = Delta_0
+  f_k = frechet_mean(x_0, x_set, manifold)
+  with phase("direction"):
+    g_k = f_grad(x_0, x_set, manifold)
 
   while True:
-    if la.norm(g_k) < 10e-10:
+    x_k = x_seq[-1]
+    if np.isnan(g_k).any():
+      x_seq = x_seq[:-1]
+      break
+    if stop_test(stop, manifold, x_k, f_k, g_k):
       break
 
-    theta = inv_rho(psi_seq[-1])
-    
-    z = choice_dir_LBFGS(HyperboloidManifold, l, k, theta, g_k, s_seq, y_seq, p_seq, gamma_seq)
-    step_size = 1 #strong_wolfe(HyperboloidManifold, f_grad, theta, x_set_h, g_k, -z)
-    new_theta = HyperboloidManifold.exp(theta, -step_size*z)
-    g_new = f_grad(new_theta, x_set_h, HyperboloidManifold)
-
-    new_psi = rho(new_theta)
-    psi_seq.append(new_psi)
-    f_seq.append(frechet_mean(new_psi, x_set, PoincareManifold.dist))
-
-    tmp = HyperboloidManifold.norm(new_theta, HyperboloidManifold.transp(theta, new_theta, -step_size*z))
-    beta_k = 1
-    if tmp != 0:
-      beta_k = HyperboloidManifold.norm(theta, -step_size*z)/tmp
-    s_k = HyperboloidManifold.transp(theta, new_theta, -step_size*z)
-    y_k = g_new/beta_k - HyperboloidManifold.transp(theta, new_theta, g_k)
-    
-    gamma_seq.append(HyperboloidManifold.inner(new_theta, s_k, y_k)/HyperboloidManifold.inner(new_theta, y_k, y_k))
+    with phase("direction"):
+      eta, H_eta, boundary = truncated_CG(manifold, x_k, g_k, f_hess(x_k, x_set, manifold), Delta, max_inner=max_inner)
+
+    with phase("line_search"):
+      new_x = manifold.exp(x_k, eta)
+      f_new = frechet_mean(new_x, x_set, manifold)
+      # rounding guard on the ratio as in Absil, Baker and Gallivan
+      eps = 1e-15*max(1, abs(f_k))
+      model_decrease = -manifold.inner(x_k, g_k, eta) - manifold.inner(x_k, eta, H_eta)/2
+      ratio = (f_k - f_new + eps)/(model_decrease + eps)
+
+      if not np.isfinite(ratio) or ratio < 0.25:
+        Delta = Delta/4
+      elif ratio > 0.75 and boundary:
+        Delta = min(2*Delta, Delta_max)
+
+    if np.isfinite(ratio) and ratio > rho_prime:
+      with phase("direction"):
+        g_new = f_grad(new_x, x_set, manifold)
+      with phase("logging"):
+        x_seq.append(new_x)
+        f_seq.append(f_new)
+        g_seq.append(g_k)
+      f_k, g_k = f_new, g_new
 
-    tmp = HyperboloidManifold.inner(new_theta, s_k, y_k)
-    if tmp > 0:
-      new_p = 1/tmp 
-      p_k = min(p_max, max(p_min, new_p))
-    else:
-      p_k = p_max
+    # forced exit condition
+    k = k+1
+    if k >= max_steps:
+      break
 
+  return x_seq, f_seq, g_seq
 
-    l = max(k-M, 0)
 
-    s_seq.append(s_k)
-    y_seq.append(y_k)
-    p_seq.append(p_k)
-    if k>=M:
-      s_seq.pop(0)
-      y_seq.pop(0)
-      p_seq.pop(0)
-    
-    for i in range(k-l):
-      s_seq[i] = HyperboloidManifold.transp(theta, new_theta, s_seq[i])
-      y_seq[i] = HyperboloidManifold.transp(theta, new_theta, y_seq[i])
+def RTR_poincare(psi_0, x_set, max_steps=100, stop=None, max_inner=None):
+  return RTR(PoincareManifold, psi_0, frechet_mean_poincare_rgrad, frechet_mean_poincare_rhess, prepare(x_set), max_steps=max_steps, max_inner=max_inner, stop=stop)
 
-    k = k+1
-    if k >= max_steps:
+
+def RTR_hyperboloid(psi_0, x_set, max_steps=100, stop=None, max_inner=None):
+  psi_seq, f_seq, g_seq = RTR(HyperboloidManifold, inv_rho(psi_0), frechet_mean_hyperboloid_rgrad, frechet_mean_hyperboloid_rhess, prepare(x_set).lift(), max_steps=max_steps, max_inner=max_inner, stop=stop)
+  return [rho(psi) for psi in psi_seq], f_seq, g_seq
+
+"""# Segmented Barycenters"""
+
+def minkowski_rows(U, V):
+  # minkowski inner product of corresponding rows
+  return np.sum(U[:, :-1]*V[:, :-1], axis=1) - U[:, -1]*V[:, -1]
+
+
+def hyperboloid_exp_rows(theta, v):
+  norms = np.sqrt(np.maximum(0, minkowski_rows(v, v)))
+  a = np.sinh(norms)/np.where(norms == 0, 1, norms)
+  a[norms == 0] = 1
+  theta = np.cosh(norms)[:, None]*theta + a[:, None]*v
+  # back on the hyperboloid, against the drift of the rounding
+  return theta/np.sqrt(np.maximum(-minkowski_rows(theta, theta), 1e-300))[:, None]
+
+
+def segment_rows(starts, counts, segments):
+  # rows of the sorted points belonging to segments, and where every
+  # segment starts among them
+  c = counts[segments]
+  sub_starts = np.cumsum(c) - c
+  rows = np.arange(np.sum(c)) + np.repeat(starts[segments] - sub_starts, c)
+  return rows, sub_starts
+
+
+def hyperboloid_distances(theta, P, repeats):
+  # distances of the rows of P from the row of theta of their segment
+  T = np.repeat(theta, repeats, axis=0)
+  alpha = np.maximum(-minkowski_rows(T, P), 1)
+  return T, alpha, np.arccosh(alpha)
+
+
+def hyperboloid_cost(theta, P, weights, sub_starts, repeats):
+  # weighted frechet function of every segment, the weights sum to one in each
+  _, _, d = hyperboloid_distances(theta, P, repeats)
+  return np.add.reduceat(weights*d**2, sub_starts)
+
+
+def hyperboloid_newton_direction(theta, P, weights, sub_starts, repeats, cg_steps):
+  # f, v = weighted mean of the logarithms = -grad f/2, and the solution of
+  # H eta = v by conjugate gradient run in lockstep on all the segments, where
+  # H = hess f/2 = weighted mean of c I - (c - 1) u u^T with c = d coth(d)
+  # and u the unit logarithm of every point
+  T, alpha, d = hyperboloid_distances(theta, P, repeats)
+  a = d/np.where(d == 0, 1, np.sinh(d))
+  a[d == 0] = 1
+  logs = a[:, None]*(P - alpha[:, None]*T)
+  v = np.add.reduceat(weights[:, None]*logs, sub_starts, axis=0)
+  c = alpha*a
+  U = logs/np.where(d == 0, 1, d)[:, None]
+  c_mean = np.add.reduceat(weights*c, sub_starts)[:, None]
+
+  def hessian(w):
+    uw = minkowski_rows(U, np.repeat(w, repeats, axis=0))
+    return c_mean*w - np.add.reduceat((weights*(c - 1)*uw)[:, None]*U, sub_starts, axis=0)
+
+  eta = np.zeros_like(v)
+  r = v.copy()
+  p = r.copy()
+  rr = np.maximum(0, minkowski_rows(r, r))
+  rr_0 = rr.copy()
+  for _ in range(cg_steps):
+    running = rr > 1e-20*rr_0
+    if not np.any(running):
       break
+    Hp = hessian(p)
+    pHp = minkowski_rows(p, Hp)
+    step = np.where(running & (pHp > 0), rr/np.where(pHp > 0, pHp, 1), 0)
+    eta += step[:, None]*p
+    r -= step[:, None]*Hp
+    rr_new = np.maximum(0, minkowski_rows(r, r))
+    p = r + (rr_new/np.where(rr > 0, rr, 1))[:, None]*p
+    rr = rr_new
+  return np.add.reduceat(weights*d**2, sub_starts), v, eta
+
+
+def segmented_frechet_mean(manifold, points, segment_ids, max_steps=100, tol=1e-9, gamma=1e-4, max_backtracks=30, cg_steps=None):
+  # one frechet mean for every distinct segment id, all of them solved at once
+  # on the hyperboloid. points hold one point per row in the coordinates of
+  # manifold (PoincareBall or Hyperboloid), every reduction is a reduceat over
+  # the segments still active, a segment leaves once its gradient is below tol
+  points = np.asarray(points, dtype=float)
+  groups, inverse, counts = np.unique(segment_ids, return_inverse=True, return_counts=True)
+  order = np.argsort(np.ravel(inverse), kind="stable")
+  A = points[order] if isinstance(manifold, Hyperboloid) else inv_rho_set(points[order])
+  weights = 1/np.repeat(counts, counts)
+  starts = np.cumsum(counts) - counts
+  if cg_steps is None:
+    cg_steps = A.shape[1] - 1
+
+  # warm start at the lorentzian centroids
+  S = np.add.reduceat(A, starts, axis=0)
+  theta = S/np.sqrt(np.maximum(-minkowski_rows(S, S), 1e-300))[:, None]
+
+  G = len(groups)
+  steps = np.zeros(G, dtype=int)
+  grad_norm = np.full(G, np.inf)
+  f_all = np.zeros(G)
+  active = np.arange(G)
+  for k in range(max_steps + 1):
+    rows, sub_starts = segment_rows(starts, counts, active)
+    f, v, eta = hyperboloid_newton_direction(theta[active], A[rows], weights[rows], sub_starts, counts[active], cg_steps)
+    f_all[active] = f
+    g_norm = 2*np.sqrt(np.maximum(0, minkowski_rows(v, v)))
+    # far apart points bound the gradient norm the rounding lets us reach,
+    # a segment whose gradient stops decreasing has got there
+    keep = (g_norm >= tol) & (g_norm < grad_norm[active])
+    grad_norm[active] = g_norm
+    slope = 2*minkowski_rows(v, eta)
+    active, f, eta, slope = active[keep], f[keep], eta[keep], slope[keep]
+    if len(active) == 0 or k == max_steps:
+      break
+
+    # backtracking from the newton step, only the rejected segments are re-evaluated
+    t = np.ones(len(active))
+    accepted = np.zeros(len(active), dtype=bool)
+    pending = np.arange(len(active))
+    for _ in range(max_backtracks):
+      candidate = hyperboloid_exp_rows(theta[active[pending]], t[pending, None]*eta[pending])
+      rows, sub_starts = segment_rows(starts, counts, active[pending])
+      f_c = hyperboloid_cost(candidate, A[rows], weights[rows], sub_starts, counts[active[pending]])
+      # changes of f below its rounding are accepted as in approximate_armijo
+      ok = (f_c <= f[pending] - gamma*t[pending]*slope[pending]) | (abs(f_c - f[pending]) <= 1e-12*abs(f[pending]))
+      theta[active[pending[ok]]] = candidate[ok]
+      accepted[pending[ok]] = True
+      pending = pending[~ok]
+      if len(pending) == 0:
+        break
+      t[pending] /= 2
+
+    steps[active[accepted]] += 1
+    # segments without an acceptable step are at the rounding level, they stop here
+    active = active[accepted]
+
+  means = theta if isinstance(manifold, Hyperboloid) else rho_set(theta)
+  return groups, means, {"f": f_all, "grad_norm": grad_norm, "steps": steps}
+
+
+class BarycenterTracker:
+    # frechet mean of a stream: of the last window points, or with decay of
+    # all of them weighted by decay**age, forgotten once the weight is below
+    # min_weight. Every update warm starts from the previous mean and takes a
+    # few newton steps over the buffer, so its cost depends on the window only.
+    # f and grad_norm are the ones of the mean after the update
+
+    def __init__(self, manifold, window=None, decay=None, steps=2, min_weight=1e-6, gamma=1e-4):
+        if window is None:
+            if decay is None:
+                raise ValueError("either window or decay is needed")
+            window = int(math.ceil(math.log(min_weight)/math.log(decay)))
+        self.manifold = manifold
+        self.window = window
+        self.decay = decay
+        self.steps = steps
+        self.gamma = gamma
+        self.reset()
+
+    def reset(self):
+        self.points = None
+        self.arrivals = np.zeros(self.window, dtype=int)
+        self.count = 0
+        self.theta = None
+        self.f = 0.0
+        self.grad_norm = 0.0
+
+    def update(self, x):
+        point = np.asarray(x, dtype=float) if isinstance(self.manifold, Hyperboloid) else inv_rho(np.asarray(x, dtype=float))
+        if self.points is None:
+            self.points = np.zeros((self.window, len(point)))
+        slot = self.count % self.window
+        self.points[slot] = point
+        self.arrivals[slot] = self.count
+        self.count += 1
+        size = min(self.count, self.window)
+        if self.theta is None:
+            self.theta = point[None, :]
+
+        P = self.points[:size]
+        if self.decay is None:
+            weights = np.full(size, 1/size)
+        else:
+            weights = self.decay**(self.count - 1 - self.arrivals[:size])
+            weights /= np.sum(weights)
+        starts = np.zeros(1, dtype=int)
+        repeats = np.array([size])
+        f, v, eta = hyperboloid_newton_direction(self.theta, P, weights, starts, repeats, len(point) - 1)
+        for step in range(self.steps):
+            # armijo backtracking keeps the step safe when a jump of the data
+            # puts the previous mean far from the new one
+            slope = 2*minkowski_rows(v, eta)[0]
+            if not slope > 0:
+                break
+            t = 1
+            for _ in range(30):
+                candidate = hyperboloid_exp_rows(self.theta, t*eta)
+                if hyperboloid_cost(candidate, P, weights, starts, repeats)[0] <= f[0] - self.gamma*t*slope:
+                    self.theta = candidate
+                    break
+                t /= 2
+            else:
+                # no decrease f can resolve, the mean is as good as it gets
+                break
+            # no newton direction is needed after the last step
+            cg_steps = len(point) - 1 if step < self.steps - 1 else 0
+            f, v, eta = hyperboloid_newton_direction(self.theta, P, weights, starts, repeats, cg_steps)
+        self.f = f[0]
+        self.grad_norm = 2*math.sqrt(max(0, minkowski_rows(v, v)[0]))
+        return self.mean()
+
+    def mean(self):
+        if self.theta is None:
+            return None
+        if isinstance(self.manifold, Hyperboloid):
+            return self.theta[0].copy()
+        return rho(self.theta[0])
 
-  return psi_seq, f_seq, g_seq
 
 """# Caricamento e Creazione dei dati"""
 
-def generate_starting_point(x_set):
+def euclidean_midpoint(x_set):
   psi_0 = np.zeros(x_set.shape[1]) # poincare_points_factory() # calcolare come media dei punti x_set
   for a_i in x_set:
     psi_0 += a_i
@@ -768,6 +2202,43 @@ def generate_starting_point(x_set):
   return psi_0
 
 
+def einstein_midpoint(x_set):
+  # weighted average in the Klein model, weights are the Lorentz factors
+  x_set = np.asarray(x_set)
+  k_set = 2*x_set/(1 + np.sum(x_set*x_set, axis=1))[:, None]
+  gamma = 1/np.sqrt(1 - np.sum(k_set*k_set, axis=1))
+  k = np.dot(gamma, k_set)/np.sum(gamma)
+  return k/(1 + math.sqrt(1 - np.dot(k, k)))
+
+
+def lorentzian_centroid(x_set):
+  # sum of the points on the hyperboloid projected back on it
+  theta = np.sum(inv_rho_set(x_set), axis=0)
+  theta = theta/math.sqrt(theta[-1]**2 - np.dot(theta[:-1], theta[:-1]))
+  return rho(theta)
+
+
+starting_points = {
+    "euclidean": euclidean_midpoint,
+    "einstein": einstein_midpoint,
+    "lorentzian": lorentzian_centroid,
+}
+
+
+def generate_starting_point(x_set, method="euclidean"):
+  return starting_points[method](x_set)
+
+
+def approximate_mean(x_set, method="einstein"):
+  # the frechet function is 2-strongly geodesically convex, so
+  # f(psi) - f* <= |grad f(psi)|^2 / 4 bounds the objective gap
+  psi = generate_starting_point(x_set, method)
+  manifold = PoincareBall(len(psi), 1)
+  f = frechet_mean(psi, x_set, manifold)
+  g = frechet_mean_poincare_rgrad(psi, x_set, manifold)
+  return psi, f, manifold.norm(psi, g)**2/4
+
+
 def parse_set_in_list(x_set):
   points = []
   for x in x_set:
@@ -809,63 +2280,296 @@ def load_bunch_from_file(file_name="bunch.txt"):
   return dim, x_set_s
 
 
-def create_bunch_test_set(manifold, card_bunch=50, card_x=4):
+def create_bunch_test_set(manifold, card_bunch=50, card_x=4, checkpoint=None, seed=None):
+  # with a checkpoint file the problems are saved as soon as each one is
+  # ready, an interrupted generation restarts from the problems already there.
+  # The file is written aside and renamed, a crash never leaves half a line.
+  # Each problem has its own generator, spawned from seed by its index, so a
+  # resumed generation draws the same problems as an uninterrupted one
+  seeds = np.random.SeedSequence(seed).spawn(card_bunch)
   bunch_test_set = []
-  for i in range(card_bunch):
+  if checkpoint is not None and os.path.exists(checkpoint):
+    _, bunch_test_set = load_bunch_from_file(checkpoint)
+  for i in range(len(bunch_test_set), card_bunch):
     print(i/card_bunch * 100, "%")
-    x_set = np.array([manifold.rand() for _ in range(card_x)])
+    rng = np.random.default_rng(seeds[i])
+    x_set = np.array([manifold.rand(rng) for _ in range(card_x)])
     x_0 = generate_starting_point(x_set)
     # TODO: confrontarmi con il prof per il calcolo del limite
     psi_seq, _, _ = optimisation_fl_poincare(x_0, x_set, 0.001, 5000, False)
     limit = psi_seq[-1]
     bunch_test_set.append((x_0, x_set, limit))
+    if checkpoint is not None:
+      save_to_file([format_data_to_save(*problem) for problem in bunch_test_set], checkpoint + ".tmp")
+      os.replace(checkpoint + ".tmp", checkpoint)
 
   return bunch_test_set
 
 #dim = 2
 #PoincareManifold = PoincareBall(dim, 1)
 #HyperboloidManifold = Hyperboloid(dim, 1)
-#bunch = create_bunch_test_set(PoincareManifold, card_bunch=200, card_x=4)
+#bunch = create_bunch_test_set(PoincareManifold, card_bunch=200, card_x=4, checkpoint="bunch_checkpoint.txt")
 #save_bunch_test_set(bunch)
 
-dim, bunch = load_bunch_from_file()
+# the problems of bunch.txt are in R^2, they are read by the experiments
+# at the end of the file
+dim = 2
 PoincareManifold = PoincareBall(dim, 1)
 HyperboloidManifold = Hyperboloid(dim, 1)
 
+"""# Result Cache"""
+
+CACHE_VERSION = 1
+
+
+def fingerprint_update(digest, obj, seen):
+  # feeds digest with obj, functions are followed through their code, closures
+  # and the module level names they read, so that editing a solver or a
+  # helper it calls changes the fingerprint
+  if isinstance(obj, types.FunctionType):
+    digest.update(b"function" + obj.__qualname__.encode())
+    if getattr(obj, "__module__", None) != __name__ or id(obj) in seen:
+      return
+    seen.add(id(obj))
+    fingerprint_update(digest, obj.__code__, seen)
+    fingerprint_update(digest, obj.__defaults__, seen)
+    fingerprint_update(digest, obj.__kwdefaults__, seen)
+    for cell in obj.__closure__ or ():
+      fingerprint_update(digest, cell.cell_contents, seen)
+    for name in sorted(code_names(obj.__code__)):
+      if name in obj.__globals__:
+        value = obj.__globals__[name]
+        digest.update(name.encode())
+        # module level instances (guard) only count through their class, the
+        # manifolds also through their dimensions
+        if not isinstance(value, (types.FunctionType, type, types.ModuleType, int, float, str, tuple, list, dict, np.ndarray, Manifold)) and value is not None:
+          value = type(value)
+        fingerprint_update(digest, value, seen)
+  elif isinstance(obj, types.CodeType):
+    digest.update(obj.co_code)
+    digest.update(repr(obj.co_names).encode())
+    for const in obj.co_consts:
+      fingerprint_update(digest, const, seen)
+  elif isinstance(obj, type):
+    digest.update(b"class" + obj.__qualname__.encode())
+    if obj.__module__ != __name__ or id(obj) in seen:
+      return
+    seen.add(id(obj))
+    for name in sorted(vars(obj)):
+      if isinstance(vars(obj)[name], types.FunctionType):
+        digest.update(name.encode())
+        fingerprint_update(digest, vars(obj)[name], seen)
+  elif isinstance(obj, types.ModuleType):
+    digest.update(b"module" + obj.__name__.encode())
+  elif isinstance(obj, PreparedDataset):
+    # the same key as the points it is made of
+    fingerprint_update(digest, np.asarray(obj), seen)
+  elif isinstance(obj, np.ndarray):
+    digest.update(repr((obj.dtype.str, obj.shape)).encode())
+    digest.update(np.ascontiguousarray(obj).tobytes())
+  elif isinstance(obj, (list, tuple)):
+    digest.update(repr((type(obj).__name__, len(obj))).encode())
+    for item in obj:
+      fingerprint_update(digest, item, seen)
+  elif isinstance(obj, dict):
+    digest.update(repr(("dict", len(obj))).encode())
+    for key in sorted(obj, key=repr):
+      digest.update(repr(key).encode())
+      fingerprint_update(digest, obj[key], seen)
+  elif isinstance(obj, (int, float, complex, str, bytes, bool, type(None), np.generic)):
+    digest.update(repr(obj).encode())
+  else:
+    # parameter objects such as stopping criteria: class and attributes
+    fingerprint_update(digest, type(obj), seen)
+    fingerprint_update(digest, dict(vars(obj)) if hasattr(obj, "__dict__") else repr(obj), seen)
+
+
+def code_names(code):
+  names = set(code.co_names)
+  for const in code.co_consts:
+    if isinstance(const, types.CodeType):
+      names |= code_names(const)
+  return names
+
+
+def fingerprint(*objs):
+  digest = hashlib.sha256(repr((CACHE_VERSION, np.__version__)).encode())
+  seen = set()
+  for obj in objs:
+    fingerprint_update(digest, obj, seen)
+  return digest.hexdigest()
+
+
+class ResultCache:
+    # directory of npz files addressed by the fingerprint of the algorithm,
+    # its arguments (problem included) and the code it runs
+
+    def __init__(self, root="results_cache"):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + ".npz")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def load(self, key):
+        if key not in self:
+            return None
+        with np.load(self.path(key)) as data:
+            return {name: data[name] for name in data.files}
+
+    def save(self, key, **arrays):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written aside and renamed, an interrupted run never leaves a truncated entry
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+
+
+def cached_run(cache, algorithm, *args, **kwargs):
+  # runs algorithm(*args, **kwargs) -> (x_seq, f_seq, g_seq) unless the same
+  # run of the same code is already in the cache
+  if cache is None:
+    return algorithm(*args, **kwargs)
+  key = fingerprint(algorithm, args, kwargs)
+  data = cache.load(key)
+  if data is not None:
+    cache.hits += 1
+    return list(data["x_seq"]), list(data["f_seq"]), list(data["g_seq"])
+  cache.misses += 1
+  x_seq, f_seq, g_seq = algorithm(*args, **kwargs)
+  cache.save(key, x_seq=np.asarray(x_seq), f_seq=np.asarray(f_seq), g_seq=np.asarray(g_seq))
+  return x_seq, f_seq, g_seq
+
 """# Test Algorithms"""
 
+class TrajectoryStore:
+    # trajectories of many runs in preallocated columns, one row per run with
+    # nan after its last iterate, so that the analyses are array operations.
+    # The solvers still return their lists, add copies every run once, in
+    # a handful of vectorized assignments
+    columns = ["x", "f", "g_norm", "step", "length", "evals", "limit"]
+
+    def __init__(self, dim, max_steps, capacity=1024):
+        self.dim = dim
+        self.max_steps = max_steps
+        self.size = 0
+        self.manifold = PoincareBall(dim, 1)
+        self._allocate(max(1, capacity))
+
+    def _allocate(self, capacity):
+        shapes = {
+            "x": ((capacity, self.max_steps+1, self.dim), np.nan),
+            "f": ((capacity, self.max_steps+1), np.nan),
+            "g_norm": ((capacity, self.max_steps+1), np.nan),
+            "step": ((capacity, self.max_steps), np.nan),
+            "length": ((capacity,), 0),
+            "evals": ((capacity,), 0),
+            "limit": ((capacity, self.dim), np.nan),
+        }
+        for name, (shape, fill) in shapes.items():
+            column = np.full(shape, fill, dtype=float if fill != 0 else int)
+            if hasattr(self, name):
+                column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, x_seq, f_seq, g_seq, limit=None, evals=0):
+        if self.size == len(self.length):
+            self._allocate(2*len(self.length))
+        i = self.size
+        x = np.reshape(x_seq, (len(x_seq), -1))[:self.max_steps+1]
+        self.x[i, :len(x)] = x
+        f = np.asarray(f_seq, dtype=float)[:self.max_steps+1]
+        self.f[i, :len(f)] = f
+        if len(g_seq) > 0:
+          g = np.reshape(g_seq, (len(g_seq), -1))[:self.max_steps+1]
+          self.g_norm[i, :len(g)] = la.norm(g, axis=1)
+        # step sizes as geodesic lengths, all the steps of the run at once
+        if len(x) > 1:
+          self.step[i, :len(x)-1] = self.manifold.dist_columns(x[:-1].T, x[1:].T)
+        self.length[i] = len(x)
+        self.evals[i] = evals
+        if limit is not None:
+          self.limit[i] = limit
+        self.size += 1
+        return i
+
+    def save(self, file_name):
+        np.savez(file_name, max_steps=self.max_steps,
+                 **{name: getattr(self, name)[:self.size] for name in self.columns})
+
+    @classmethod
+    def load(cls, file_name):
+        with np.load(file_name) as data:
+            store = cls(data["x"].shape[2], int(data["max_steps"]), len(data["length"]))
+            for name in cls.columns:
+                getattr(store, name)[:len(data[name])] = data[name]
+            store.size = len(data["length"])
+        return store
+
+    def errors(self):
+        return la.norm(self.x[:self.size] - self.limit[:self.size, None, :], axis=2)
+
+    def hitting_times(self, epsilon=1e-4):
+        # as time_to_converge, runs hitting at step 0 or never count max_steps
+        times = np.argmax(self.errors() < epsilon, axis=1)
+        times[times == 0] = self.max_steps
+        return times
+
+
+def record_runs(store, solver, bunch_test_set, max_steps, cache=None, count_evals=False):
+  # count_evals profiles every run for the number of cost, gradient and
+  # hessian evaluations
+  for (x_0, x_set, limit) in bunch_test_set:
+    x_set = prepare(x_set)
+    evals = 0
+    if count_evals:
+      (x_seq, f_seq, g_seq), report = profile_run(solver, x_0, x_set, max_steps)
+      evals = report["evaluations"]
+    else:
+      x_seq, f_seq, g_seq = cached_run(cache, solver, x_0, x_set, max_steps)
+    store.add(x_seq, f_seq, g_seq, limit, evals)
+  return store
+
+
+def multiplicity(a, b):
+  # for every run, how many runs share its pair of values
+  _, inverse, counts = np.unique(np.column_stack([a, b]), axis=0, return_inverse=True, return_counts=True)
+  return counts[np.ravel(inverse)]
+
+
 def time_to_converge(seq, limit, iter_test, epsilon=1e-4):
-  differences = []
-  for s in seq:
-    diff = s - limit
-    differences.append(math.sqrt(np.dot(diff, diff)) < epsilon)
+  differences = la.norm(np.asarray(seq) - limit, axis=1) < epsilon
   time_conv = np.argmax(differences)
   if time_conv == 0:
     time_conv = iter_test
   return time_conv
 
 
-def test_algorithm(algotithm_poincare, algorithm_hyperboloid, bunch_test_set, iter_test, figname, tollerance_outlier=0):
-  a = []
-  b = []
-  
-  for (x_0, x_set, limit) in bunch_test_set:
-    seq, _, _ = algotithm_poincare(x_0, x_set, iter_test)
-    a.append(time_to_converge(seq, limit, iter_test, 1e-5))
-    seq, _, _ = algorithm_hyperboloid(x_0, x_set, iter_test)
-    b.append(time_to_converge(seq, limit, iter_test, 1e-5))
+def test_algorithm(algotithm_poincare, algorithm_hyperboloid, bunch_test_set, iter_test, figname, tollerance_outlier=0, cache=None):
+  dim = bunch_test_set[0][1].shape[1]
+  store_a = record_runs(TrajectoryStore(dim, iter_test, len(bunch_test_set)), algotithm_poincare, bunch_test_set, iter_test, cache)
+  store_b = record_runs(TrajectoryStore(dim, iter_test, len(bunch_test_set)), algorithm_hyperboloid, bunch_test_set, iter_test, cache)
+  a = store_a.hitting_times(1e-5)
+  b = store_b.hitting_times(1e-5)
 
-  mean_conv_a = sum(a)/len(bunch_test_set)
-  mean_conv_b = sum(b)/len(bunch_test_set)
+  mean_conv_a = np.mean(a)
+  mean_conv_b = np.mean(b)
 
   print("Mean convergence Disk:", mean_conv_a)
   print("Mean convergence Iperboloid:", mean_conv_b)
 
-  ab = list(zip(a, b))
-  z = [ab.count(i) for i in ab]
-  filter = [z_i > tollerance_outlier for z_i in z]
-  a_cutted = list(compress(a, filter))
-  b_cutted = list(compress(b, filter))
+  z = multiplicity(a, b)
+  filter = z > tollerance_outlier
+  a_cutted = a[filter]
+  b_cutted = b[filter]
 
   a_scaler, b_scaler = StandardScaler(), StandardScaler()
   a_train = a_scaler.fit_transform(np.array(a_cutted)[..., None])
@@ -877,8 +2581,8 @@ def test_algorithm(algotithm_poincare, algorithm_hyperboloid, bunch_test_set, it
   ang_coef_lin, t = np.polyfit(a_cutted, b_cutted, 1)
   test_a = np.array([0, iter_test])
   predictions = b_scaler.inverse_transform(
-      model.predict(a_scaler.transform(test_a[..., None]))
-  )
+      model.predict(a_scaler.transform(test_a[..., None]))[..., None]
+  ).ravel()
 
   ang_coef_huber = (predictions[1] - predictions[0]) / (test_a[1] - test_a[0])
 
@@ -896,127 +2600,770 @@ def test_algorithm(algotithm_poincare, algorithm_hyperboloid, bunch_test_set, it
   plt.xlabel("Step to Converge on Poincare Disk", fontsize=18)
   plt.ylabel("Step to Converge on Hyperboloid", fontsize=18)
   plt.savefig(figname)
+  return store_a, store_b
 
-def make_fl_curve(algorithm_poincare, algorithm_hyperbolid, X0, X, limit, iter_test, max_iter=100):
+def make_fl_curve(algorithm_poincare, algorithm_hyperbolid, X0, X, limit, iter_test, max_iter=100, cache=None):
   sequence_poincare = []
   sequence_hyper = []
+  # prepared once for all the parameter values
+  X = prepare(X)
 
   for i in range(1, iter_test):
-    poincare_seq, _, _= algorithm_poincare(X0, X, (i/iter_test), max_iter)
+    poincare_seq, _, _= cached_run(cache, algorithm_poincare, X0, X, (i/iter_test), max_iter)
     min_poincare = time_to_converge(poincare_seq, limit, max_iter)
     sequence_poincare.append(min_poincare)
-    hyper_seq, _, _ = algorithm_hyperbolid(X0, X, (i/iter_test), max_iter)
+    hyper_seq, _, _ = cached_run(cache, algorithm_hyperbolid, X0, X, (i/iter_test), max_iter)
     min_hyper = time_to_converge(hyper_seq, limit, max_iter)
     sequence_hyper.append(min_hyper)
 
   return np.array(sequence_poincare), np.array(sequence_hyper)
 
 
-def test_one_parameter_optimization(algorithm_poincare, algorithm_hyperbolid, bunch_test_set, iter_test, max_iter=100):
+def test_one_parameter_optimization(algorithm_poincare, algorithm_hyperbolid, bunch_test_set, iter_test, max_iter=100, cache=None):
   sequence_poincare = np.zeros(iter_test-1)
   sequence_hyper = np.zeros(iter_test-1)
   for (x_0, x_set, limit) in bunch_test_set:
-    fl_poincare_curve, fl_hyper_curve = make_fl_curve(algorithm_poincare, algorithm_hyperbolid, x_0, x_set, limit, iter_test, max_iter)
+    fl_poincare_curve, fl_hyper_curve = make_fl_curve(algorithm_poincare, algorithm_hyperbolid, x_0, x_set, limit, iter_test, max_iter, cache)
     sequence_poincare += fl_poincare_curve
     sequence_hyper += fl_hyper_curve
   return sequence_poincare/len(bunch_test_set), sequence_hyper/len(bunch_test_set)
 
-x_0_test, x_set_test, limit_test = bunch[0]
-print("limit:", limit_test)
-
-psi_seq_test, f_seq_test, g_seq_test = optimisation_fl_poincare(x_0_test, x_set_test, 0.1, 100)
-print("Limit sequence poincare: ", psi_seq_test[-1])
-plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
-
-psi_seq_test, f_seq_test, g_seq_test = optimisation_fl_hyperboloid(x_0_test, x_set_test, 0.26, 100)
-print("Limit sequence iperboloide: ", psi_seq_test[-1])
-plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
-
-psi_seq_test, f_seq_test, g_seq_test = armijo_poincare(x_0_test, x_set_test, 0.2, 0.001, 0.25, 100)
-print("Limit sequence poincare: ", psi_seq_test[-1])
-plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
-
-psi_seq_test, f_seq_test, g_seq_test = armijo_hyperboloid(x_0_test, x_set_test, 0.2, 0.0001, 0.25, 100)
-print("Limit sequence iperboloide: ", psi_seq_test[-1])
-plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
-
-psi_seq_test, f_seq_test, g_seq_test = RBB_poincare(x_0_test, x_set_test, 0.0001, 0.9, 100)
-print("Limit sequence poincare: ", psi_seq_test[-1])
-plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
-
-psi_seq_test, f_seq_test, g_seq_test = RBB_hyperboloid(x_0_test, x_set_test, 0.0001, 0.9, 100)
-print("Limit sequence iperboloide: ", psi_seq_test[-1])
-plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
-
-sequence_fixed_lenght_poincare, sequence_fixed_lenght_hyper = test_one_parameter_optimization(
-    optimisation_fl_poincare,
-    optimisation_fl_hyperboloid,
-    bunch[:20],
-    100)
-
-print(min(sequence_fixed_lenght_poincare))
-alpha_D = (np.argmin(sequence_fixed_lenght_poincare)+1)/100
-print(alpha_D)
-
-plt.figure(figsize=(10,10))
-plt.plot([i/100 for i in range(1, 100)], sequence_fixed_lenght_poincare)
-plt.xlabel("parameter value", fontsize=18)
-plt.ylabel("step to convergence", fontsize=18)
-plt.savefig("fixed_step_parameter_poincare")
-
-print(min(sequence_fixed_lenght_hyper))
-alpha_H = (np.argmin(sequence_fixed_lenght_hyper)+1)/100
-print(alpha_H)
-
-plt.figure(figsize=(10,10))
-plt.plot([i/100 for i in range(1, 100)], sequence_fixed_lenght_hyper)
-plt.xlabel("parameter value", fontsize=18)
-plt.ylabel("step to convergence", fontsize=18)
-plt.savefig("fixed_step_parameter_hyperboloid")
-
-sequence_armijo_poincare, sequence_armijo_hyper = test_one_parameter_optimization(
-    lambda X0, X, learning_rate, max_iter: armijo_poincare(X0, X, 0.2, 0.001, learning_rate, max_iter),
-    lambda X0, X, learning_rate, max_iter: armijo_hyperboloid(X0, X, 0.2, 0.001, learning_rate, max_iter),
-    bunch[:10],
-    100)
-
-print(min(sequence_armijo_poincare))
-lambda_D = (np.argmin(sequence_armijo_poincare)+1)/100
-print(lambda_D)
-
-plt.figure(figsize=(10,10))
-plt.plot([i/100 for i in range(1, 100)], sequence_armijo_poincare)
-plt.xlabel("parameter value", fontsize=18)
-plt.ylabel("step to convergence", fontsize=18)
-plt.savefig("armijo_parameter_poincare")
-
-print(min(sequence_armijo_hyper))
-lambda_H = (np.argmin(sequence_armijo_hyper)+1)/100
-print(lambda_H)
-
-plt.figure(figsize=(10,10))
-plt.plot([i/100 for i in range(1, 100)], sequence_armijo_hyper)
-plt.xlabel("parameter value", fontsize=18)
-plt.ylabel("step to convergence", fontsize=18)
-plt.savefig("armijo_parameter_hyperboloid")
-
-test_algorithm(lambda X0, X, max_iter: optimisation_fl_poincare(X0, X, alpha_D, max_iter),
-               lambda X0, X, max_iter: optimisation_fl_hyperboloid(X0, X, alpha_H, max_iter),
-               bunch,
-               100,
-               "fixed_step_size",
-               5)
-
-test_algorithm(lambda X0, X, max_iter: armijo_poincare(X0, X, 0.2, 0.001, lambda_D, max_iter),
-               lambda X0, X, max_iter: armijo_hyperboloid(X0, X, 0.2, 0.001, lambda_H, max_iter),
-               bunch,
-               100,
-               "armijo",
-               5)
-
-test_algorithm(lambda X0, X, max_iter: RBB_poincare(X0, X, 0.0001, 0.9, max_iter),
-               lambda X0, X, max_iter: RBB_hyperboloid(X0, X, 0.0001, 0.9, max_iter),
-               bunch,
-               100,
-               "barzilai_borwein",
-               5)
\ No newline at end of file
+"""## Hyperparameter Tuning"""
+
+def convergence_score(seq, limit, budget, epsilon=1e-5):
+  # steps needed to reach the limit, the runs that did not converge within
+  # the budget are ranked after it by the orders of magnitude of error left
+  errors = la.norm(np.asarray(seq) - limit, axis=1)
+  if not np.isfinite(errors[-1]):
+    return math.inf
+  hits = np.flatnonzero(errors < epsilon)
+  if len(hits) > 0:
+    return float(hits[0])
+  return budget + math.log10(errors[-1]/epsilon)
+
+
+def search_grid(space, num=10):
+  # space maps every parameter to (low, high, "linear" | "log")
+  axes = []
+  for low, high, scale in space.values():
+    if scale == "log":
+      axes.append(np.geomspace(low, high, num))
+    else:
+      axes.append(np.linspace(low, high, num))
+  return [dict(zip(space, map(float, values))) for values in product(*axes)]
+
+
+def search_sample(space, num, rng):
+  configs = []
+  for _ in range(num):
+    config = {}
+    for name, (low, high, scale) in space.items():
+      if scale == "log":
+        config[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+      else:
+        config[name] = float(rng.uniform(low, high))
+    configs.append(config)
+  return configs
+
+
+class TuningRun:
+    # scores configurations on a prefix of the shuffled problems with an
+    # iteration budget, keeping track of how many solver runs the tuning has
+    # cost; runs read back from the cache are counted apart
+
+    def __init__(self, algorithm, problems, epsilon=1e-5, seed=0, cache=None):
+        self.algorithm = algorithm
+        self.cache = cache
+        order = np.random.default_rng(seed).permutation(len(problems))
+        self.problems = [(x_0, prepare(x_set), limit) for (x_0, x_set, limit) in (problems[i] for i in order)]
+        self.epsilon = epsilon
+        self.results = {}
+        self.cost = {"runs": 0, "cached": 0, "iterations": 0, "time": 0.0}
+
+    def score(self, config, n_problems, budget):
+        scores = []
+        for i, (x_0, x_set, limit) in enumerate(self.problems[:n_problems]):
+            key = (tuple(sorted(config.items())), i)
+            if key in self.results:
+                score, run_budget = self.results[key]
+                # a run converged within a smaller budget is not changed by a larger one
+                if run_budget == budget or score < run_budget:
+                    scores.append(score)
+                    continue
+            hits = None if self.cache is None else self.cache.hits
+            start = time.perf_counter()
+            seq, _, _ = cached_run(self.cache, self.algorithm, x_0, x_set, budget, **config)
+            if hits is not None and self.cache.hits > hits:
+                self.cost["cached"] += 1
+            else:
+                self.cost["time"] += time.perf_counter() - start
+                self.cost["runs"] += 1
+                self.cost["iterations"] += len(seq) - 1
+            score = convergence_score(seq, limit, budget, self.epsilon)
+            self.results[key] = (score, budget)
+            scores.append(score)
+        return float(np.mean(scores))
+
+
+def successive_halving(algorithm, problems, configs, max_iter=100, min_iter=10, min_problems=5, eta=3, n_rungs=None, epsilon=1e-5, seed=0, cache=None, run=None):
+  # algorithm(X0, X, max_iter, **config), every rung keeps the best 1/eta of
+  # the configurations and gives them eta times more problems and iterations
+  if run is None:
+    run = TuningRun(algorithm, problems, epsilon, seed, cache)
+  grid_runs = len(configs)*len(problems)
+  if n_rungs is None:
+    # as many rungs as the resources can be divided by eta
+    ratio = max(len(problems)/min_problems, max_iter/min_iter, 1)
+    n_rungs = 1 + int(math.floor(math.log(ratio, eta) + 1e-9))
+  for rung in range(n_rungs):
+    fraction = eta**(rung - n_rungs + 1)
+    n_problems = min(len(problems), max(min_problems, math.ceil(len(problems)*fraction)))
+    budget = max(min_iter, math.ceil(max_iter*fraction))
+    scores = [run.score(config, n_problems, budget) for config in configs]
+    order = np.argsort(scores, kind="stable")
+    if rung < n_rungs - 1:
+      configs = [configs[i] for i in order[:max(1, math.ceil(len(configs)/eta))]]
+  return configs[order[0]], scores[order[0]], dict(run.cost, grid_runs=grid_runs)
+
+
+def hyperband(algorithm, problems, space, max_iter=100, min_iter=10, min_problems=5, eta=3, epsilon=1e-5, seed=0, cache=None):
+  # brackets of successive halving trading the number of sampled
+  # configurations against the resources given to each of them
+  rng = np.random.default_rng(seed)
+  run = TuningRun(algorithm, problems, epsilon, seed, cache)
+  s_max = int(math.floor(math.log(max_iter/min_iter, eta) + 1e-9))
+  best, best_score = None, math.inf
+  for s in range(s_max, -1, -1):
+    n = int(math.ceil((s_max + 1)/(s + 1)*eta**s))
+    config, score, _ = successive_halving(algorithm, problems, search_sample(space, n, rng),
+                                          max_iter, min_iter, min_problems, eta, s + 1, epsilon, run=run)
+    if score < best_score:
+      best, best_score = config, score
+  return best, best_score, dict(run.cost)
+
+
+"""# Benchmark"""
+
+def machine_metadata():
+  return {
+      "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "python": platform.python_version(),
+      "numpy": np.__version__,
+      "platform": platform.platform(),
+      "processor": platform.processor(),
+      "cpu_count": os.cpu_count(),
+  }
+
+
+def time_call(fn, repeat=5, min_time=0.05):
+  # per call seconds, the call is looped until one repeat lasts min_time
+  number = 1
+  while True:
+    start = time.perf_counter()
+    for _ in range(number):
+      fn()
+    elapsed = time.perf_counter() - start
+    if elapsed >= min_time:
+      break
+    number *= 10
+  times = [elapsed/number]
+  for _ in range(repeat - 1):
+    start = time.perf_counter()
+    for _ in range(number):
+      fn()
+    times.append((time.perf_counter() - start)/number)
+  return min(times), float(np.median(times))
+
+
+def peak_memory(fn):
+  tracemalloc.start()
+  try:
+    fn()
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+
+def benchmark_record(name, fn, repeat=5, **sizes):
+  time_min, time_median = time_call(fn, repeat)
+  record = {"name": name, "time": time_median, "time_min": time_min, "peak_bytes": peak_memory(fn)}
+  record.update(sizes)
+  return record
+
+
+def benchmark_primitives(sizes=((2, 1, 4), (10, 1, 100), (10, 100, 100), (50, 1000, 1000)), repeat=5):
+  # sizes are (n, k, m): dimension, columns per point, points in the set
+  records = []
+  for n, k, m in sizes:
+    poincare = PoincareBall(n, k)
+    hyperboloid = Hyperboloid(n, k)
+    X = np.reshape(poincare.rand(), (n, k))*0.9
+    Y = np.reshape(poincare.rand(), (n, k))*0.9
+    U = poincare.log(X, Y)
+    X_h = inv_rho_set(X.T).T
+    Y_h = inv_rho_set(Y.T).T
+    U_h = hyperboloid.log(X_h, Y_h)
+    cases = [
+        ("poincare.mobius_add", lambda: poincare.mobius_add(X, Y)),
+        ("poincare.exp", lambda: poincare.exp(X, U)),
+        ("poincare.log", lambda: poincare.log(X, Y)),
+        ("poincare.dist", lambda: poincare.dist(X, Y)),
+        ("hyperboloid.inner_minkowski_columns", lambda: hyperboloid.inner_minkowski_columns(X_h, Y_h)),
+        ("hyperboloid.exp", lambda: hyperboloid.exp(X_h, U_h)),
+        ("hyperboloid.log", lambda: hyperboloid.log(X_h, Y_h)),
+        ("hyperboloid.dist", lambda: hyperboloid.dist(X_h, Y_h)),
+    ]
+    for name, fn in cases:
+      records.append(benchmark_record(name, fn, repeat, n=n, k=k, m=m))
+
+    # the gradients work on one point against a set of m points
+    poincare_1 = PoincareBall(n, 1)
+    hyperboloid_1 = Hyperboloid(n, 1)
+    x_set = np.array([poincare_1.rand() for _ in range(m)])*0.9
+    x_set_h = list(inv_rho_set(x_set))
+    psi = x_set[0]/2
+    theta = inv_rho(psi)
+    cases = [
+        ("frechet_mean_poincare_rgrad", lambda: frechet_mean_poincare_rgrad(psi, x_set, poincare_1)),
+        ("frechet_mean_hyperboloid_rgrad", lambda: frechet_mean_hyperboloid_rgrad(theta, x_set_h, hyperboloid_1)),
+        ("frechet_mean_poincare", lambda: frechet_mean(psi, x_set, poincare_1)),
+    ]
+    for name, fn in cases:
+      records.append(benchmark_record(name, fn, repeat, n=n, k=1, m=m))
+  return records
+
+
+# solver_suite[name](x_0, x_set, max_steps) -> (psi_seq, f_seq, g_seq) on the disk
+solver_suite = {
+    "fixed_poincare": lambda X0, X, max_iter: optimisation_fl_poincare(X0, X, 0.1, max_iter),
+    "fixed_hyperboloid": lambda X0, X, max_iter: optimisation_fl_hyperboloid(X0, X, 0.26, max_iter),
+    "accelerated_poincare": lambda X0, X, max_iter: accelerated_poincare(X0, X, 0.1, max_iter),
+    "accelerated_hyperboloid": lambda X0, X, max_iter: accelerated_hyperboloid(X0, X, 0.26, max_iter),
+    "armijo_poincare": lambda X0, X, max_iter: armijo_poincare(X0, X, 0.2, 0.001, 0.25, max_iter),
+    "armijo_hyperboloid": lambda X0, X, max_iter: armijo_hyperboloid(X0, X, 0.2, 0.001, 0.25, max_iter),
+    "armijo_adaptive_poincare": lambda X0, X, max_iter: armijo_adaptive_poincare(X0, X, 1e-4, 1, max_iter),
+    "armijo_adaptive_hyperboloid": lambda X0, X, max_iter: armijo_adaptive_hyperboloid(X0, X, 1e-4, 1, max_iter),
+    "RBB_poincare": lambda X0, X, max_iter: RBB_poincare(X0, X, 0.0001, 0.9, max_iter),
+    "RBB_hyperboloid": lambda X0, X, max_iter: RBB_hyperboloid(X0, X, 0.0001, 0.9, max_iter),
+    "RBB_nonmonotone_poincare": lambda X0, X, max_iter: RBB_nonmonotone_poincare(X0, X, 1e-4, 1e4, max_iter),
+    "RBB_nonmonotone_hyperboloid": lambda X0, X, max_iter: RBB_nonmonotone_hyperboloid(X0, X, 1e-4, 1e4, max_iter),
+    "RCG_poincare": lambda X0, X, max_iter: RCG_poincare(X0, X, "PR+", max_iter),
+    "RCG_hyperboloid": lambda X0, X, max_iter: RCG_hyperboloid(X0, X, "PR+", max_iter),
+    "RTR_poincare": lambda X0, X, max_iter: RTR_poincare(X0, X, max_iter),
+    "RTR_hyperboloid": lambda X0, X, max_iter: RTR_hyperboloid(X0, X, max_iter),
+    "LBFGS_poincare": lambda X0, X, max_iter: LBFGS_poincare(X0, frechet_mean_poincare_rgrad, X, 5, 1e-4, 1e4, max_iter),
+    "LBFGS_hyperboloid": lambda X0, X, max_iter: LBFGS_hyperboloid(X0, frechet_mean_hyperboloid_rgrad, X, 5, 1e-4, 1e4, max_iter),
+}
+
+
+def synthetic_bunch(n, m, card_bunch=10, seed=0):
+  # problems without a precomputed limit, the error is certified from the gradient
+  rng = np.random.default_rng(seed)
+  manifold = PoincareBall(n, 1)
+  bunch_set = []
+  for _ in range(card_bunch):
+    x_set = np.array([manifold.rand(rng) for _ in range(m)])
+    bunch_set.append((generate_starting_point(x_set), x_set, None))
+  return bunch_set
+
+
+def run_solver_benchmark(name, solver, bunch_test_set, max_steps, label):
+  manifold = PoincareBall(bunch_test_set[0][1].shape[1], 1)
+  steps = []
+  errors = []
+  start = time.perf_counter()
+  for (x_0, x_set, limit) in bunch_test_set:
+    seq, _, _ = solver(x_0, x_set, max_steps)
+    steps.append(len(seq) - 1)
+    if limit is not None:
+      errors.append(manifold.dist(seq[-1], limit))
+    else:
+      g = frechet_mean_poincare_rgrad(seq[-1], x_set, manifold)
+      errors.append(certified_distance(manifold, seq[-1], g))
+  elapsed = time.perf_counter() - start
+  x_0, x_set, _ = bunch_test_set[0]
+  _, report = profile_run(solver, x_0, x_set, max_steps)
+  return {
+      "name": name,
+      "set": label,
+      "n": x_set.shape[1],
+      "m": x_set.shape[0],
+      "problems": len(bunch_test_set),
+      "time": elapsed/len(bunch_test_set),
+      "steps": float(np.mean(steps)),
+      "error": float(np.nanmedian(errors)) if not np.isnan(errors).all() else float("nan"),
+      "failures": int(np.sum(~np.isfinite(errors))),
+      "peak_bytes": peak_memory(lambda: solver(x_0, x_set, max_steps)),
+      "evals": report["evaluations"],
+      "calls": report["calls"],
+  }
+
+
+def benchmark_solvers(bunch_test_set, solvers=None, scaled=((10, 100), (50, 1000)), max_steps=100, card_bunch=10):
+  solvers = solver_suite if solvers is None else solvers
+  sets = [("bunch", bunch_test_set)]
+  sets += [("synthetic", synthetic_bunch(n, m, card_bunch)) for n, m in scaled]
+  records = []
+  for label, bunch_set in sets:
+    for name, solver in solvers.items():
+      records.append(run_solver_benchmark(name, solver, bunch_set, max_steps, label))
+  return records
+
+
+def benchmark_key(record):
+  return (record["name"], record.get("set"), record.get("n"), record.get("k"), record.get("m"))
+
+
+def load_benchmark(file_name):
+  with open(file_name, "r") as f:
+    return json.load(f)
+
+
+def save_benchmark(results, file_name="benchmark.json"):
+  with open(file_name, "w") as f:
+    json.dump(results, f, indent=2)
+
+
+def compare_benchmarks(current, baseline, threshold=0.1):
+  # current and baseline are results or file names, a record regresses
+  # when it is more than threshold slower than the baseline one
+  if isinstance(current, str):
+    current = load_benchmark(current)
+  if isinstance(baseline, str):
+    baseline = load_benchmark(baseline)
+  regressions = []
+  for layer in ["primitives", "solvers"]:
+    old = {benchmark_key(r): r for r in baseline.get(layer, [])}
+    for record in current.get(layer, []):
+      base = old.get(benchmark_key(record))
+      if base is None or base["time"] <= 0:
+        continue
+      ratio = record["time"]/base["time"]
+      if ratio > 1 + threshold:
+        regressions.append((layer, benchmark_key(record), ratio))
+        print("REGRESSION", layer, benchmark_key(record), "{:.2f}x".format(ratio))
+  if not regressions:
+    print("no regressions over", threshold)
+  return regressions
+
+
+def benchmark(bunch_test_set, file_name="benchmark.json", baseline=None, threshold=0.1, **kwargs):
+  results = {
+      "metadata": machine_metadata(),
+      "primitives": benchmark_primitives(),
+      "solvers": benchmark_solvers(bunch_test_set, **kwargs),
+  }
+  save_benchmark(results, file_name)
+  if baseline is not None:
+    compare_benchmarks(results, baseline, threshold)
+  return results
+
+#benchmark(bunch, "benchmark_baseline.json")
+#benchmark(bunch, "benchmark.json", baseline="benchmark_baseline.json")
+
+"""# Automatic Solver Selection"""
+
+def auto_steps(x_set):
+  # the frechet function is 2-strongly convex and L = 2 max d coth(d)-smooth
+  # around the einstein midpoint (d the distances of the points from it),
+  # steps in [1/L, 1/2] are the safe and the newton ones. O(m n)
+  data = prepare(x_set).ball()
+  d, _ = data.poincare_dists(einstein_midpoint(data.prepared()["X"]))
+  curvature = float(np.max(np.where(d == 0, 1, d/np.tanh(np.where(d == 0, 1, d)))))
+  return 1/(2*curvature), 1/2
+
+
+# auto_solvers[name](x_0, x_set, steps, max_steps, stop) -> (psi_seq, f_seq, g_seq) on the disk
+auto_solvers = {
+    "fixed_poincare": lambda X0, X, steps, max_iter, stop: optimisation_fl_poincare(X0, X, steps[0], max_iter, stop=stop),
+    "fixed_hyperboloid": lambda X0, X, steps, max_iter, stop: optimisation_fl_hyperboloid(X0, X, steps[0], max_iter, stop=stop),
+    "armijo_poincare": lambda X0, X, steps, max_iter, stop: armijo_poincare(X0, X, 0.5, 1e-4, steps[1], max_iter, stop),
+    "armijo_hyperboloid": lambda X0, X, steps, max_iter, stop: armijo_hyperboloid(X0, X, 0.5, 1e-4, steps[1], max_iter, stop),
+    "RBB_poincare": lambda X0, X, steps, max_iter, stop: RBB_poincare(X0, X, *steps, max_iter, stop),
+    "RBB_hyperboloid": lambda X0, X, steps, max_iter, stop: RBB_hyperboloid(X0, X, *steps, max_iter, stop),
+    "armijo_adaptive_poincare": lambda X0, X, steps, max_iter, stop: armijo_adaptive_poincare(X0, X, 1e-4, steps[1], max_iter, stop),
+    "armijo_adaptive_hyperboloid": lambda X0, X, steps, max_iter, stop: armijo_adaptive_hyperboloid(X0, X, 1e-4, steps[1], max_iter, stop),
+    "RBB_nonmonotone_poincare": lambda X0, X, steps, max_iter, stop: RBB_nonmonotone_poincare(X0, X, *steps, max_iter, stop=stop),
+    "RBB_nonmonotone_hyperboloid": lambda X0, X, steps, max_iter, stop: RBB_nonmonotone_hyperboloid(X0, X, *steps, max_iter, stop=stop),
+    "LBFGS_poincare": lambda X0, X, steps, max_iter, stop: LBFGS_poincare(X0, frechet_mean_poincare_rgrad, X, 5, *steps, max_iter, stop),
+    "LBFGS_hyperboloid": lambda X0, X, steps, max_iter, stop: LBFGS_hyperboloid(X0, frechet_mean_hyperboloid_rgrad, X, 5, *steps, max_iter, stop),
+    "RCG_poincare": lambda X0, X, steps, max_iter, stop: RCG_poincare(X0, X, "PR+", max_iter, stop),
+    "RCG_hyperboloid": lambda X0, X, steps, max_iter, stop: RCG_hyperboloid(X0, X, "PR+", max_iter, stop),
+    "RTR_poincare": lambda X0, X, steps, max_iter, stop: RTR_poincare(X0, X, max_iter, stop),
+    "RTR_hyperboloid": lambda X0, X, steps, max_iter, stop: RTR_hyperboloid(X0, X, max_iter, stop),
+}
+
+
+def auto_calibration_bunch(sizes=((2, 4), (2, 100), (10, 100), (10, 1000), (50, 1000)), scales=(0.3, 1, 3), card_bunch=15, seed=0):
+  # random sets whose hyperbolic radii are the ones of uniform points in
+  # the disk times scale, from tight clusters to sets near the boundary
+  rng = np.random.default_rng(seed)
+  bunch_set = []
+  for n, m in sizes:
+    for scale in scales:
+      for _ in range(card_bunch):
+        x_set = rng.standard_normal((m, n))
+        norms = la.norm(x_set, axis=1)
+        r = np.tanh(scale*np.arctanh(0.99*rng.random(m)**(1/n)))
+        x_set = x_set*(r/norms)[:, None]
+        bunch_set.append((einstein_midpoint(x_set), x_set, None))
+  return bunch_set
+
+
+def auto_records(bunch_test_set, solvers=None, max_steps=100, tol=1e-6, cache=None):
+  # one record per problem and solver: the wall time to reach a certified
+  # distance tol from the mean and whether it was reached.
+  # With a ResultCache every run is stored under the fingerprint of the
+  # solver and the problem and read back by the next calls, a new ranking
+  # only runs the solvers and problems that changed
+  solvers = auto_solvers if solvers is None else solvers
+  records = []
+  for (x_0, x_set, _) in bunch_test_set:
+    x_set = prepare(x_set)
+    steps = auto_steps(x_set)
+    manifold = PoincareBall(len(x_0), 1)
+    for name, solver in solvers.items():
+      key = fingerprint("auto_records", name, solver, x_0, x_set, max_steps, tol)
+      data = None if cache is None else cache.load(key)
+      if data is not None:
+        cache.hits += 1
+        elapsed, converged = float(data["time"]), bool(data["converged"])
+      else:
+        start = time.perf_counter()
+        seq, _, _ = solver(x_0, x_set, steps, max_steps, CertifiedDistance(tol))
+        elapsed = time.perf_counter() - start
+        # a solver hitting nan at the first step returns no iterate
+        x = seq[-1] if len(seq) else x_0
+        bound = certified_distance(manifold, x, frechet_mean_poincare_rgrad(x, x_set, manifold))
+        converged = bool(bound <= tol)
+        if cache is not None:
+          cache.misses += 1
+          cache.save(key, x_seq=np.asarray(seq), time=elapsed, converged=converged)
+      records.append({"name": name, "time": elapsed, "converged": converged, "m": len(x_set), "n": len(x_0)})
+  return records
+
+
+def expected_time(records, min_success=0.9):
+  # mean time over the runs divided by the fraction of them that converged,
+  # the time to a solution when the failed ones are run again
+  success = np.mean([r["converged"] for r in records])
+  if success < min_success:
+    return math.inf
+  return float(np.mean([r["time"] for r in records])/success)
+
+
+def auto_ranking(records, min_success=0.9):
+  # records are auto_records outputs, also read back with load_benchmark;
+  # (expected time, name) of every solver, fastest first
+  if isinstance(records, str):
+    records = load_benchmark(records)
+  by_name = {}
+  for record in records:
+    by_name.setdefault(record["name"], []).append(record)
+  return sorted((expected_time(runs, min_success), name) for name, runs in by_name.items())
+
+
+def auto_bucket(m, n):
+  # size class of a problem: dimension up to 2, up to 10 or more, and up to
+  # 10, up to 100 or more points
+  return int(n > 2) + int(n > 10), int(m > 10) + int(m > 100)
+
+
+def fit_auto_policy(records, min_success=0.9, margin=0.2):
+  # {"default": fastest solver of auto_ranking on all the records,
+  #  "buckets": {auto_bucket: fastest solver of the bucket}}, a bucket only
+  # gets its own solver when it beats the default there by more than margin
+  if isinstance(records, str):
+    records = load_benchmark(records)
+  default = auto_ranking(records, min_success)[0][1]
+  by_bucket = {}
+  for record in records:
+    by_bucket.setdefault(auto_bucket(record["m"], record["n"]), []).append(record)
+  buckets = {}
+  for bucket, runs in by_bucket.items():
+    ranking = auto_ranking(runs, min_success)
+    default_time = dict((name, t) for t, name in ranking).get(default, math.inf)
+    best_time, best = ranking[0]
+    if best != default and best_time < (1 - margin)*default_time:
+      buckets[bucket] = best
+  return {"default": default, "buckets": buckets}
+
+
+def auto_choice(policy, m, n):
+  return policy["buckets"].get(auto_bucket(m, n), policy["default"])
+
+
+# save_benchmark(auto_records(auto_calibration_bunch()), auto_records_file)
+# refits the policy on this machine; without the file RBB on the hyperboloid,
+# the fastest overall on the calibration sets, solves everything
+auto_records_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "auto_records.json")
+auto_policy = fit_auto_policy(auto_records_file) if os.path.exists(auto_records_file) else {"default": "RBB_hyperboloid", "buckets": {}}
+
+
+def solve_auto(x_set, x_0=None, max_steps=100, stop=None, policy=None):
+  # the solver of policy (auto_policy by default) for the size of x_set, with
+  # the steps of auto_steps, starts from the einstein midpoint unless x_0 is given
+  x_set = prepare(x_set)
+  policy = auto_policy if policy is None else policy
+  if x_0 is None:
+    x_0 = einstein_midpoint(x_set.ball().rows())
+  solver = auto_choice(policy, len(x_set), len(x_0))
+  return auto_solvers[solver](x_0, x_set, auto_steps(x_set), max_steps, stop)
+
+"""# pymanopt Comparison"""
+
+def frechet_problem(manifold, x_set, trajectory=None):
+  # pymanopt Problem for the frechet mean of the rows of x_set (points of
+  # the disk) on manifold, with the prepared cost, euclidean gradient and
+  # hessian-vector product; the hessian is built once per point.
+  # The optimizers evaluate the gradient once per iterate (trial points of
+  # line searches and trust regions only get the cost): every new point the
+  # gradient is evaluated at is appended to the trajectory list, if given,
+  # as (point, cost, norm of the riemannian gradient)
+  hyperboloid = isinstance(manifold, Hyperboloid)
+  data = prepare(x_set).lift() if hyperboloid else prepare(x_set).ball()
+  grad = frechet_mean_hyperboloid_grad if hyperboloid else frechet_mean_poincare_grad
+  ehess = frechet_mean_hyperboloid_ehess if hyperboloid else frechet_mean_poincare_ehess
+  last = {"point": None}
+  evaluated = {"point": None}
+
+  @pymanopt.function.numpy(manifold)
+  def cost(point):
+    f = frechet_mean(point, data, manifold)
+    evaluated["point"], evaluated["cost"] = np.copy(point), f
+    return f
+
+  @pymanopt.function.numpy(manifold)
+  def euclidean_gradient(point):
+    g = grad(point, data, manifold)
+    if trajectory is not None and not (trajectory and np.array_equal(trajectory[-1][0], point)):
+      if evaluated["point"] is not None and np.array_equal(evaluated["point"], point):
+        f = evaluated["cost"]
+      else:
+        f = frechet_mean(point, data, manifold)
+      rgrad = manifold.euclidean_to_riemannian_gradient(point, g)
+      trajectory.append((np.copy(point), f, manifold.norm(point, rgrad)))
+    return g
+
+  @pymanopt.function.numpy(manifold)
+  def euclidean_hessian(point, tangent_vector):
+    if last["point"] is None or not np.array_equal(last["point"], point):
+      last["point"] = np.copy(point)
+      last["hvp"] = ehess(point, data)[1]
+    return last["hvp"](tangent_vector)
+
+  return pymanopt.Problem(manifold, cost, euclidean_gradient=euclidean_gradient, euclidean_hessian=euclidean_hessian)
+
+
+def pymanopt_solve(optimizer, psi_0, x_set, model="poincare", max_steps=100, min_gradient_norm=1e-9):
+  # runs a pymanopt optimizer class and gives the iterates back as
+  # (psi_seq, f_seq, g_seq) on the disk, as the solvers above: f_seq holds
+  # the cost after each step and g_seq the gradient norm before it
+  n = len(psi_0)
+  manifold = Hyperboloid(n, 1) if model == "hyperboloid" else PoincareBall(n, 1)
+  x_0 = inv_rho(psi_0) if model == "hyperboloid" else psi_0
+  solver = optimizer(max_iterations=max_steps, min_gradient_norm=min_gradient_norm, verbosity=0)
+  trajectory = []
+  solver.run(frechet_problem(manifold, x_set, trajectory), initial_point=x_0)
+  points = [point for point, _, _ in trajectory]
+  f_seq = [f for _, f, _ in trajectory[1:]]
+  g_seq = [g for _, _, g in trajectory[:-1]]
+  if model == "hyperboloid":
+    points = [rho(theta) for theta in points]
+  return points, f_seq, g_seq
+
+
+# pymanopt_suite[name](x_0, x_set, max_steps) -> (psi_seq, f_seq, g_seq) on the disk, as solver_suite
+pymanopt_suite = {
+    "pymanopt_SD_poincare": lambda X0, X, max_iter: pymanopt_solve(pymanopt.optimizers.SteepestDescent, X0, X, "poincare", max_iter),
+    "pymanopt_SD_hyperboloid": lambda X0, X, max_iter: pymanopt_solve(pymanopt.optimizers.SteepestDescent, X0, X, "hyperboloid", max_iter),
+    "pymanopt_CG_poincare": lambda X0, X, max_iter: pymanopt_solve(pymanopt.optimizers.ConjugateGradient, X0, X, "poincare", max_iter),
+    "pymanopt_CG_hyperboloid": lambda X0, X, max_iter: pymanopt_solve(pymanopt.optimizers.ConjugateGradient, X0, X, "hyperboloid", max_iter),
+    "pymanopt_TR_poincare": lambda X0, X, max_iter: pymanopt_solve(pymanopt.optimizers.TrustRegions, X0, X, "poincare", max_iter),
+    "pymanopt_TR_hyperboloid": lambda X0, X, max_iter: pymanopt_solve(pymanopt.optimizers.TrustRegions, X0, X, "hyperboloid", max_iter),
+}
+
+
+def compare_pymanopt(bunch_test_set, solvers=None, max_steps=100, file_name=None):
+  # the pymanopt optimizers next to the closest ones of ours on the same
+  # problems, one run_solver_benchmark record each
+  solvers = {name: solver_suite[name] for name in ["armijo_adaptive_poincare", "armijo_adaptive_hyperboloid",
+                                                    "RCG_poincare", "RCG_hyperboloid", "RTR_poincare",
+                                                    "RTR_hyperboloid"]} if solvers is None else solvers
+  solvers = dict(pymanopt_suite, **solvers)
+  records = [run_solver_benchmark(name, solver, bunch_test_set, max_steps, "bunch") for name, solver in solvers.items()]
+  for record in records:
+    print("{:30s} {:9.2e}s {:6.1f} steps error {:8.1e} failures {}".format(
+        record["name"], record["time"], record["steps"], record["error"], record["failures"]))
+  if file_name is not None:
+    save_benchmark({"metadata": machine_metadata(), "solvers": records}, file_name)
+  return records
+
+#compare_pymanopt(load_bunch_from_file("bunch.txt")[1], file_name="benchmark_pymanopt.json")
+
+"""# Experiments"""
+
+if __name__ == "__main__":
+  dim, bunch = load_bunch_from_file()
+
+  # runs already done are read back from results_cache
+  cache = ResultCache()
+
+  x_0_test, x_set_test, limit_test = bunch[0]
+  print("limit:", limit_test)
+
+  psi_seq_test, f_seq_test, g_seq_test = optimisation_fl_poincare(x_0_test, x_set_test, 0.1, 100)
+  print("Limit sequence poincare: ", psi_seq_test[-1])
+  plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
+
+  psi_seq_test, f_seq_test, g_seq_test = optimisation_fl_hyperboloid(x_0_test, x_set_test, 0.26, 100)
+  print("Limit sequence iperboloide: ", psi_seq_test[-1])
+  plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
+
+  psi_seq_test, f_seq_test, g_seq_test = armijo_poincare(x_0_test, x_set_test, 0.2, 0.001, 0.25, 100)
+  print("Limit sequence poincare: ", psi_seq_test[-1])
+  plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
+
+  psi_seq_test, f_seq_test, g_seq_test = armijo_hyperboloid(x_0_test, x_set_test, 0.2, 0.0001, 0.25, 100)
+  print("Limit sequence iperboloide: ", psi_seq_test[-1])
+  plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
+
+  psi_seq_test, f_seq_test, g_seq_test = RBB_poincare(x_0_test, x_set_test, 0.0001, 0.9, 100)
+  print("Limit sequence poincare: ", psi_seq_test[-1])
+  plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
+
+  psi_seq_test, f_seq_test, g_seq_test = RBB_hyperboloid(x_0_test, x_set_test, 0.0001, 0.9, 100)
+  print("Limit sequence iperboloide: ", psi_seq_test[-1])
+  plot_seq(x_set_test, psi_seq_test, f_seq_test, g_seq_test, limit_test, dim)
+
+  step_space = {"learning_rate": (0.01, 0.99, "linear")}
+
+  alpha_D, score, cost = successive_halving(
+      lambda X0, X, max_iter, learning_rate: optimisation_fl_poincare(X0, X, learning_rate, max_iter),
+      bunch[:20],
+      search_grid(step_space, 99),
+      cache=cache)
+  alpha_D = alpha_D["learning_rate"]
+  print(alpha_D, score, cost)
+
+  alpha_H, score, cost = successive_halving(
+      lambda X0, X, max_iter, learning_rate: optimisation_fl_hyperboloid(X0, X, learning_rate, max_iter),
+      bunch[:20],
+      search_grid(step_space, 99),
+      cache=cache)
+  alpha_H = alpha_H["learning_rate"]
+  print(alpha_H, score, cost)
+
+  lambda_D, score, cost = successive_halving(
+      lambda X0, X, max_iter, learning_rate: armijo_poincare(X0, X, 0.2, 0.001, learning_rate, max_iter),
+      bunch[:10],
+      search_grid(step_space, 99),
+      cache=cache)
+  lambda_D = lambda_D["learning_rate"]
+  print(lambda_D, score, cost)
+
+  lambda_H, score, cost = successive_halving(
+      lambda X0, X, max_iter, learning_rate: armijo_hyperboloid(X0, X, 0.2, 0.001, learning_rate, max_iter),
+      bunch[:10],
+      search_grid(step_space, 99),
+      cache=cache)
+  lambda_H = lambda_H["learning_rate"]
+  print(lambda_H, score, cost)
+
+  armijo_space = {"sigma": (0.05, 0.9, "linear"), "gamma": (1e-5, 1e-1, "log"), "lambda_": (0.01, 1, "log")}
+  armijo_params_D, score, cost = hyperband(
+      lambda X0, X, max_iter, **params: armijo_poincare(X0, X, max_steps=max_iter, **params),
+      bunch[:10],
+      armijo_space,
+      cache=cache)
+  print(armijo_params_D, score, cost)
+
+  bb_space = {"a_min": (1e-5, 1e-1, "log"), "a_max": (0.1, 10, "log")}
+  bb_params_D, score, cost = hyperband(
+      lambda X0, X, max_iter, **params: RBB_poincare(X0, X, max_steps=max_iter, **params),
+      bunch[:10],
+      bb_space,
+      cache=cache)
+  print(bb_params_D, score, cost)
+
+  # full parameter curves of the grid sweeps for the figures of the thesis,
+  # off by default: they run every problem at each of the 99 values, the
+  # tuners above get by with far fewer runs. Their runs go through the cache so a rerun only redraws them. The
+  # parameters of the tests stay the tuned ones, the best values of the
+  # curves are printed next to them
+  plot_parameter_curves = False
+
+  if plot_parameter_curves:
+    sequence_fixed_lenght_poincare, sequence_fixed_lenght_hyper = test_one_parameter_optimization(
+        optimisation_fl_poincare,
+        optimisation_fl_hyperboloid,
+        bunch[:20],
+        100,
+        cache=cache)
+
+    print(min(sequence_fixed_lenght_poincare))
+    print((np.argmin(sequence_fixed_lenght_poincare)+1)/100, alpha_D)
+
+    plt.figure(figsize=(10,10))
+    plt.plot([i/100 for i in range(1, 100)], sequence_fixed_lenght_poincare)
+    plt.xlabel("parameter value", fontsize=18)
+    plt.ylabel("step to convergence", fontsize=18)
+    plt.savefig("fixed_step_parameter_poincare")
+
+    print(min(sequence_fixed_lenght_hyper))
+    print((np.argmin(sequence_fixed_lenght_hyper)+1)/100, alpha_H)
+
+    plt.figure(figsize=(10,10))
+    plt.plot([i/100 for i in range(1, 100)], sequence_fixed_lenght_hyper)
+    plt.xlabel("parameter value", fontsize=18)
+    plt.ylabel("step to convergence", fontsize=18)
+    plt.savefig("fixed_step_parameter_hyperboloid")
+
+    sequence_armijo_poincare, sequence_armijo_hyper = test_one_parameter_optimization(
+        lambda X0, X, learning_rate, max_iter: armijo_poincare(X0, X, 0.2, 0.001, learning_rate, max_iter),
+        lambda X0, X, learning_rate, max_iter: armijo_hyperboloid(X0, X, 0.2, 0.001, learning_rate, max_iter),
+        bunch[:10],
+        100,
+        cache=cache)
+
+    print(min(sequence_armijo_poincare))
+    print((np.argmin(sequence_armijo_poincare)+1)/100, lambda_D)
+
+    plt.figure(figsize=(10,10))
+    plt.plot([i/100 for i in range(1, 100)], sequence_armijo_poincare)
+    plt.xlabel("parameter value", fontsize=18)
+    plt.ylabel("step to convergence", fontsize=18)
+    plt.savefig("armijo_parameter_poincare")
+
+    print(min(sequence_armijo_hyper))
+    print((np.argmin(sequence_armijo_hyper)+1)/100, lambda_H)
+
+    plt.figure(figsize=(10,10))
+    plt.plot([i/100 for i in range(1, 100)], sequence_armijo_hyper)
+    plt.xlabel("parameter value", fontsize=18)
+    plt.ylabel("step to convergence", fontsize=18)
+    plt.savefig("armijo_parameter_hyperboloid")
+
+  test_algorithm(lambda X0, X, max_iter: optimisation_fl_poincare(X0, X, alpha_D, max_iter),
+                 lambda X0, X, max_iter: optimisation_fl_hyperboloid(X0, X, alpha_H, max_iter),
+                 bunch,
+                 100,
+                 "fixed_step_size",
+                 5,
+                 cache=cache)
+
+  test_algorithm(lambda X0, X, max_iter: armijo_poincare(X0, X, 0.2, 0.001, lambda_D, max_iter),
+                 lambda X0, X, max_iter: armijo_hyperboloid(X0, X, 0.2, 0.001, lambda_H, max_iter),
+                 bunch,
+                 100,
+                 "armijo",
+                 5,
+                 cache=cache)
+
+  test_algorithm(lambda X0, X, max_iter: RBB_poincare(X0, X, 0.0001, 0.9, max_iter),
+                 lambda X0, X, max_iter: RBB_hyperboloid(X0, X, 0.0001, 0.9, max_iter),
+                 bunch,
+                 100,
+                 "barzilai_borwein",
+                 5,
+                 cache=cache)
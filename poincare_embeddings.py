@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Poincare embeddings
+
+graph embeddings in the poincare ball trained with sparse row updates on
+the PoincareBall of hyperbolicpoincareriemannianopt.
+"""
+
+import numpy as np
+
+from hyperbolicpoincareriemannianopt import PoincareBall
+
+
+def poincare_dist_grads(X, Y):
+  # distances between the rows of X and Y and their euclidean gradients in
+  # x and in y, poincare_dist_grad on rows; the gradient is set to 0 where
+  # the points coincide
+  a = 1 - np.sum(X*X, axis=-1)
+  b = 1 - np.sum(Y*Y, axis=-1)
+  xy = np.sum(X*Y, axis=-1)
+  q = np.maximum(np.sum((X - Y)**2, axis=-1)/(a*b), 0)
+  d = 2*np.arcsinh(np.sqrt(q))
+  # 4/(b sqrt(c^2 - 1)) with c = 1 + 2q
+  s = np.where(q == 0, 0, 2/np.sqrt(np.where(q == 0, 1, q*(1 + q))))
+  g_x = (s/b)[..., None]*((((1 - b) - 2*xy + 1)/a**2)[..., None]*X - Y/a[..., None])
+  g_y = (s/a)[..., None]*((((1 - a) - 2*xy + 1)/b**2)[..., None]*Y - X/b[..., None])
+  return d, g_x, g_y
+
+
+class PoincareEmbedding:
+    # embeddings of the nodes of a graph as the rows of a (k, n) array,
+    # trained on the loss of Nickel and Kiela: for an edge (u, v) and
+    # sampled nodes v' not linked to u, -log softmax(-d(u, .))[v]. A step
+    # only reads and writes the rows of its minibatch, so its cost depends
+    # on the batch size and on the negatives, not on k
+    def __init__(self, edges, n_nodes=None, dim=2, negatives=10, lr=0.3, burn_in=10, symmetric=True, seed=0):
+        self.edges = np.asarray(edges, dtype=np.int64)
+        self.k = int(self.edges.max()) + 1 if n_nodes is None else n_nodes
+        self.dim = dim
+        self.negatives = negatives
+        self.lr = lr
+        self.burn_in = burn_in
+        self.rng = np.random.default_rng(seed)
+        # columns of the manifold are the nodes, the rows of the array are
+        # handed to it transposed
+        self.manifold = PoincareBall(dim, self.k)
+        self.embedding = self.rng.uniform(-1e-3, 1e-3, size=(self.k, dim))
+        keys = self.edges[:, 0]*self.k + self.edges[:, 1]
+        if symmetric:
+            keys = np.concatenate([keys, self.edges[:, 1]*self.k + self.edges[:, 0]])
+        self.keys = np.unique(keys)
+        self.epoch = 0
+        self.losses = []
+
+    def linked(self, u, v):
+        # whether (u, v) is an edge, by binary search on the sorted keys
+        keys = u*self.k + v
+        i = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return self.keys[i] == keys
+
+    def sample(self, u):
+        # negatives drawn uniformly, the ones equal or linked to u are masked
+        neg = self.rng.integers(0, self.k, size=(len(u), self.negatives))
+        mask = (neg != u[:, None]) & ~self.linked(u[:, None], neg)
+        return neg, mask
+
+    def loss_grad(self, u, v, neg, mask):
+        # loss summed over the batch and the euclidean gradient on the rows
+        # it touches, duplicated rows are summed with np.add.at
+        E = self.embedding
+        candidates = np.concatenate([v[:, None], neg], axis=1)
+        d, g_u, g_c = poincare_dist_grads(E[u][:, None, :], E[candidates])
+        logits = np.where(np.concatenate([np.ones((len(u), 1), dtype=bool), mask], axis=1), -d, -np.inf)
+        shift = np.max(logits, axis=1, keepdims=True)
+        weights = np.exp(logits - shift)
+        total = np.sum(weights, axis=1, keepdims=True)
+        loss = np.sum(d[:, 0] + shift[:, 0] + np.log(total[:, 0]))
+        # dL/dd_j = [j = 0] - softmax(-d)_j
+        dd = -weights/total
+        dd[:, 0] += 1
+
+        rows, inverse = np.unique(np.concatenate([u, candidates.ravel()]), return_inverse=True)
+        grad = np.zeros((len(rows), self.dim))
+        np.add.at(grad, inverse[:len(u)], np.sum(dd[..., None]*g_u, axis=1))
+        np.add.at(grad, inverse[len(u):], (dd[..., None]*g_c).reshape(-1, self.dim))
+        return loss, rows, grad
+
+    def step(self, u, v, lr):
+        neg, mask = self.sample(u)
+        loss, rows, grad = self.loss_grad(u, v, neg, mask)
+        X = self.embedding[rows].T
+        rgrad = self.manifold.egrad2rgrad(X, grad.T)
+        self.embedding[rows] = self.manifold.exp(X, -lr*rgrad).T
+        return loss
+
+    def train(self, epochs=1, batch_size=50):
+        for _ in range(epochs):
+            lr = self.lr/10 if self.epoch < self.burn_in else self.lr
+            order = self.rng.permutation(len(self.edges))
+            loss = 0.0
+            for start in range(0, len(order), batch_size):
+                batch = self.edges[order[start:start + batch_size]]
+                loss += self.step(batch[:, 0], batch[:, 1], lr)
+            self.losses.append(loss/len(self.edges))
+            self.epoch += 1
+        return self.losses
+
+    def dist(self, u, v):
+        return poincare_dist_grads(self.embedding[u], self.embedding[v])[0]
+
+    def mean_rank(self, nodes=None):
+        # rank of the neighbours of each node among the nodes it is not
+        # linked to, by distance, averaged over the edges; O(k) per node
+        nodes = np.unique(self.edges[:, 0]) if nodes is None else np.asarray(nodes)
+        ranks = []
+        for u in nodes:
+            d = self.dist(np.full(self.k, u), np.arange(self.k))
+            linked = self.linked(np.full(self.k, u), np.arange(self.k))
+            others = np.sort(d[~linked & (np.arange(self.k) != u)])
+            ranks.append(np.searchsorted(others, d[linked]) + 1)
+        return float(np.mean(np.concatenate(ranks)))
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+@pytest.fixture(scope="session")
+def bunch():
+    # the problems of the experiments, with their precomputed limits
+    return hp.load_bunch_from_file(os.path.join(ROOT, "bunch.txt"))[1]
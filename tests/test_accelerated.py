@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def failing_grad(fails):
+    # frechet_mean_poincare_rgrad, NaN from the call numbered fails on
+    calls = []
+
+    def f_grad(x, x_set, manifold):
+        calls.append(x)
+        if len(calls) >= fails:
+            return np.full(np.shape(x), np.nan)
+        return hp.frechet_mean_poincare_rgrad(x, x_set, manifold)
+    return f_grad, calls
+
+
+@pytest.mark.parametrize("restart", ["function", "gradient"])
+def test_accelerated_converges(bunch, restart):
+    for x_0, x_set, limit in bunch[:10]:
+        x_seq = hp.accelerated_poincare(x_0, x_set, 0.1, 300, restart=restart, stop=hp.GradientNorm(1e-10))[0]
+        assert hp.PoincareManifold.dist(x_seq[-1], limit) < 1e-6
+        x_seq = hp.accelerated_hyperboloid(x_0, x_set, 0.1, 300, restart=restart, stop=hp.GradientNorm(1e-10))[0]
+        assert hp.PoincareManifold.dist(x_seq[-1], limit) < 1e-6
+
+
+
+@pytest.mark.parametrize("restart", ["function", "gradient"])
+@pytest.mark.parametrize("solver", [hp.accelerated_poincare, hp.accelerated_hyperboloid])
+def test_accelerated_converges_near_the_largest_step(bunch, solver, restart):
+    # 0.26 is close to 1/L on the bunch problems: the steps from the
+    # extrapolated points overshoot, problem 5 was caught in a 2-cycle
+    for x_0, x_set, limit in bunch[:40]:
+        x_seq = solver(x_0, x_set, 0.26, 300, restart=restart, stop=hp.GradientNorm(1e-10))[0]
+        assert hp.PoincareManifold.dist(x_seq[-1], limit) < 1e-6
+
+def test_nan_iterate_is_dropped(bunch):
+    x_0, x_set, _ = bunch[0]
+    f_grad, calls = failing_grad(6)
+    x_seq = hp.accelerated_gradient(hp.PoincareManifold, x_0, f_grad, hp.prepare(x_set), 0.1, 50)[0]
+    assert all(np.isfinite(x).all() for x in x_seq)
+    # the gradient fails at the extrapolated point, the run restarts from
+    # the last iterate and fails again there, that iterate is dropped
+    assert len(calls) == 7
+    assert not any(x is calls[-1] for x in x_seq)
+    assert len(x_seq) == 5
+
+
+def test_nan_at_the_start(bunch):
+    x_0, x_set, _ = bunch[0]
+    f_grad, _ = failing_grad(1)
+    assert hp.accelerated_gradient(hp.PoincareManifold, x_0, f_grad, hp.prepare(x_set), 0.5, 50)[0] == []
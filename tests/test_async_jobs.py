@@ -0,0 +1,33 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+from async_jobs import AsyncSolverPool
+
+
+def test_timed_out_job_keeps_its_slot():
+    async def main():
+        async with AsyncSolverPool(workers=2, max_in_flight=1) as pool:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run(time.sleep, 1.0, timeout=0.1)
+            start = time.perf_counter()
+            await pool.run(time.sleep, 0.1)
+            # the second job waits for the first one to let its slot go
+            return time.perf_counter() - start
+    assert asyncio.run(main()) >= 0.5
+
+
+def test_sweep_matches_direct_runs(bunch):
+    events = []
+
+    async def main():
+        async with AsyncSolverPool(workers=2, max_in_flight=2) as pool:
+            return await pool.sweep(hp.RBB_poincare, bunch[:3], 1e-4, 0.9, 30, progress=events.append)
+    results = asyncio.run(main())
+    for (x_0, x_set, _), (x_seq, f_seq, g_seq) in zip(bunch[:3], results):
+        expected = hp.RBB_poincare(x_0, x_set, 1e-4, 0.9, 30)[0]
+        assert np.allclose(x_seq[-1], expected[-1])
+    assert events and all(event["grad_norm"] >= 0 for event in events)
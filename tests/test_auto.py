@@ -0,0 +1,51 @@
+import numpy as np
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_solve_auto_converges(bunch):
+    for _, x_set, limit in bunch[:5]:
+        psi_seq, _, _ = hp.solve_auto(x_set, stop=hp.CertifiedDistance(1e-8))
+        assert hp.PoincareManifold.dist(psi_seq[-1], limit) < 1e-6
+
+
+def test_auto_records_are_read_back_from_the_cache(tmp_path):
+    bunch_set = hp.auto_calibration_bunch(sizes=((2, 20),), scales=(1,), card_bunch=3)
+    solvers = {name: hp.auto_solvers[name] for name in ["RBB_hyperboloid", "fixed_poincare"]}
+    cache = hp.ResultCache(str(tmp_path))
+    records = hp.auto_records(bunch_set, solvers, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 6)
+    assert hp.auto_records(bunch_set, solvers, cache=cache) == records
+    assert (cache.hits, cache.misses) == (6, 6)
+    ranking = hp.auto_ranking(records)
+    assert [name for _, name in ranking] == sorted(solvers, key=lambda name: hp.expected_time(
+        [r for r in records if r["name"] == name]))
+    assert all(r["converged"] for r in records if r["name"] == "RBB_hyperboloid")
+
+
+def records(times, m=4, n=2):
+    return [{"name": name, "time": t, "converged": True, "m": m, "n": n} for name, t in times.items()]
+
+
+def test_fitted_policy_follows_the_records():
+    small = records({"RBB_hyperboloid": 1.0, "RTR_hyperboloid": 2.0})
+    large = records({"RBB_hyperboloid": 1.0, "RTR_hyperboloid": 2.0}, m=1000, n=50)
+    policy = hp.fit_auto_policy(small + large)
+    assert policy == {"default": "RBB_hyperboloid", "buckets": {}}
+    faster = records({"RBB_hyperboloid": 1.0, "RTR_hyperboloid": 0.5})
+    policy = hp.fit_auto_policy(faster + large*3)
+    assert policy["default"] == "RBB_hyperboloid"
+    assert hp.auto_choice(policy, 4, 2) == "RTR_hyperboloid"
+    assert hp.auto_choice(policy, 1000, 50) == "RBB_hyperboloid"
+    # within the margin the default is kept
+    close = records({"RBB_hyperboloid": 1.0, "RTR_hyperboloid": 0.9})
+    assert hp.fit_auto_policy(close + large*3)["buckets"] == {}
+
+
+def test_solve_auto_uses_the_policy(bunch):
+    _, x_set, _ = bunch[0]
+    x_0 = hp.einstein_midpoint(x_set)
+    policy = {"default": "RBB_hyperboloid", "buckets": {hp.auto_bucket(len(x_set), 2): "fixed_poincare"}}
+    psi_seq, _, _ = hp.solve_auto(x_set, max_steps=5, policy=policy)
+    expected, _, _ = hp.optimisation_fl_poincare(x_0, x_set, hp.auto_steps(x_set)[0], 5)
+    assert np.allclose(psi_seq, expected)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_segmented_frechet_mean(bunch):
+    problems = bunch[:8]
+    points = np.vstack([x_set for _, x_set, _ in problems])
+    ids = np.repeat(np.arange(len(problems)), [len(x_set) for _, x_set, _ in problems])
+    groups, means, info = hp.segmented_frechet_mean(hp.PoincareBall(2, 1), points, ids)
+    assert np.array_equal(groups, np.arange(len(problems)))
+    for mean, (_, _, limit) in zip(means, problems):
+        assert hp.PoincareManifold.dist(mean, limit) < 1e-6
+    assert np.all(info["grad_norm"] < 1e-6)
+
+
+
+def test_segmented_frechet_mean_ragged_unsorted_groups(bunch):
+    # labels out of order, interleaved rows, a singleton group, hyperboloid
+    # coordinates in and out
+    problems = bunch[8:12]
+    rng = np.random.default_rng(0)
+    labels = np.array([7, -1, 3, 12])
+    points = np.vstack([x_set for _, x_set, _ in problems] + [[[0.3, -0.2]]])
+    ids = np.concatenate([np.full(len(x_set), label) for label, (_, x_set, _) in zip(labels, problems)] + [[5]])
+    shuffle = rng.permutation(len(ids))
+    hyperboloid = hp.Hyperboloid(2, 1)
+    groups, means, info = hp.segmented_frechet_mean(hyperboloid, hp.inv_rho_set(points[shuffle]), ids[shuffle])
+    assert list(groups) == [-1, 3, 5, 7, 12]
+    limits = {label: limit for label, (_, _, limit) in zip(labels, problems)}
+    limits[5] = np.array([0.3, -0.2])
+    for group, mean in zip(groups, means):
+        assert hyperboloid.inner_minkowski_columns(mean, mean) == pytest.approx(-1)
+        assert hp.PoincareManifold.dist(hp.rho(mean), limits[group]) < 1e-6
+    assert info["steps"][list(groups).index(5)] == 0
+
+@pytest.mark.parametrize("model", ["poincare", "hyperboloid"])
+def test_tracker_reports_the_returned_mean(model):
+    rng = np.random.default_rng(0)
+    manifold = hp.PoincareBall(3, 1) if model == "poincare" else hp.Hyperboloid(3, 1)
+    tracker = hp.BarycenterTracker(manifold, window=20, steps=2)
+    stream = [hp.PoincareBall(3, 1).rand(rng)*0.8 for _ in range(60)]
+    # a jump of the data halfway through
+    stream[30:] = [x*0.2 + np.array([0.6, 0, 0]) for x in stream[30:]]
+    for i, x in enumerate(stream):
+        mean = tracker.update(x if model == "poincare" else hp.inv_rho(x))
+        window = hp.prepare(np.array(stream[max(0, i - 19):i + 1]))
+        psi = mean if model == "poincare" else hp.rho(mean)
+        ball = hp.PoincareBall(3, 1)
+        assert tracker.f == pytest.approx(hp.frechet_mean(psi, window, ball), rel=1e-9)
+        g = hp.frechet_mean_poincare_rgrad(psi, window, ball)
+        assert tracker.grad_norm == pytest.approx(ball.norm(psi, g), rel=1e-6, abs=1e-12)
+    limit = hp.RBB_poincare(hp.einstein_midpoint(window), window, 1e-4, 0.9, 100)[0][-1]
+    assert hp.PoincareBall(3, 1).dist(psi, limit) < 1e-6
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_stationary_start():
+    x_seq, f_seq, g_seq = hp.RBB_nonmonotone_poincare(np.zeros(2), np.zeros((2, 2)), 1e-4, 0.9)
+    assert len(x_seq) == 1 and f_seq == []
+
+
+@pytest.mark.parametrize("nonmonotone", ["GLL", "ZH"])
+@pytest.mark.parametrize("rule", ["BB1", "BB2", "alternate"])
+def test_nonmonotone_converges(bunch, rule, nonmonotone):
+    for x_0, x_set, limit in bunch[:10]:
+        stop = hp.GradientNorm(1e-10)
+        x_seq = hp.RBB_nonmonotone_poincare(x_0, x_set, 1e-4, 10, 100, rule=rule, nonmonotone=nonmonotone, stop=stop)[0]
+        assert stop.reason is not None
+        assert hp.PoincareManifold.dist(x_seq[-1], limit) < 1e-6
+        x_seq = hp.RBB_nonmonotone_hyperboloid(x_0, x_set, 1e-4, 10, 100, rule=rule, nonmonotone=nonmonotone)[0]
+        assert hp.PoincareManifold.dist(x_seq[-1], limit) < 1e-6
+
+
+def test_unknown_rules(bunch):
+    x_0, x_set, _ = bunch[0]
+    with pytest.raises(ValueError):
+        hp.RBB_nonmonotone_poincare(x_0, x_set, 1e-4, 0.9, rule="BB3")
+    with pytest.raises(ValueError):
+        hp.RBB_nonmonotone_poincare(x_0, x_set, 1e-4, 0.9, nonmonotone="gll")
+    s, y = np.array([0.1, 0.0]), np.array([0.2, 0.1])
+    with pytest.raises(ValueError):
+        hp.BB_step(hp.PoincareManifold, np.zeros(2), s, y, 0, "bb1")
+
+
+def test_bb_step_without_curvature():
+    x, s = np.zeros(2), np.array([0.1, 0.0])
+    assert hp.BB_step(hp.PoincareManifold, x, s, np.zeros(2), 0, "BB1") == np.inf
+    assert hp.BB_step(hp.PoincareManifold, x, s, -2*s, 0, "BB2") == pytest.approx(0.5)
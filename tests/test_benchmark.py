@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_primitive_records(tmp_path):
+    records = hp.benchmark_primitives(sizes=((2, 1, 4),), repeat=1)
+    assert len({record["name"] for record in records}) == len(records)
+    for record in records:
+        assert set(record) == {"name", "time", "time_min", "peak_bytes", "n", "k", "m"}
+        assert 0 < record["time_min"] <= record["time"]
+    file_name = str(tmp_path/"primitives.json")
+    hp.save_benchmark({"primitives": records}, file_name)
+    assert hp.load_benchmark(file_name) == json.loads(json.dumps({"primitives": records}))
+
+
+def test_solver_records(bunch):
+    solvers = {name: hp.solver_suite[name] for name in ["fixed_poincare", "RBB_hyperboloid"]}
+    records = hp.benchmark_solvers(bunch[:3], solvers, scaled=((3, 5),), max_steps=10, card_bunch=2)
+    assert [(record["name"], record["set"]) for record in records] == [
+        ("fixed_poincare", "bunch"), ("RBB_hyperboloid", "bunch"),
+        ("fixed_poincare", "synthetic"), ("RBB_hyperboloid", "synthetic")]
+    for record in records:
+        assert set(record) == {"name", "set", "n", "m", "problems", "time", "steps", "error", "failures",
+                               "peak_bytes", "evals", "calls"}
+        assert isinstance(record["evals"], int) and record["evals"] > 0
+        assert record["evals"] <= sum(record["calls"].values())
+    json.dumps(records)
+
+
+def test_solver_error_is_the_distance_to_the_limit(bunch):
+    problems = bunch[:3]
+    record = hp.run_solver_benchmark("RBB", hp.solver_suite["RBB_hyperboloid"], problems, 100, "bunch")
+    errors = [hp.PoincareManifold.dist(hp.solver_suite["RBB_hyperboloid"](x_0, x_set, 100)[0][-1], limit)
+              for x_0, x_set, limit in problems]
+    assert np.isclose(record["error"], np.median(errors), rtol=0, atol=1e-12)
+    assert 0 < record["error"] < 1e-6
+
+
+def test_compare_benchmarks_flags_slower_records(tmp_path):
+    baseline = {"primitives": [{"name": "poincare.exp", "time": 1.0, "n": 2, "k": 1, "m": 4}],
+                "solvers": [{"name": "RBB_poincare", "set": "bunch", "time": 1.0, "n": 2, "m": 4},
+                            {"name": "RTR_poincare", "set": "bunch", "time": 1.0, "n": 2, "m": 4}]}
+    current = json.loads(json.dumps(baseline))
+    current["solvers"][0]["time"] = 1.5
+    current["solvers"][1]["time"] = 1.05
+    hp.save_benchmark(baseline, str(tmp_path/"baseline.json"))
+    regressions = hp.compare_benchmarks(current, str(tmp_path/"baseline.json"), threshold=0.1)
+    assert regressions == [("solvers", ("RBB_poincare", "bunch", 2, None, 4), 1.5)]
+    assert hp.compare_benchmarks(baseline, baseline) == []
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def fixed_step(X0, X, max_iter, learning_rate):
+    return hp.optimisation_fl_poincare(X0, X, learning_rate, max_iter)
+
+
+def test_checkpoint_resume(tmp_path):
+    checkpoint = str(tmp_path/"checkpoint.txt")
+    manifold = hp.PoincareBall(2, 1)
+    hp.create_bunch_test_set(manifold, card_bunch=2, card_x=3, checkpoint=checkpoint, seed=0)
+    assert os.listdir(tmp_path) == ["checkpoint.txt"]
+    resumed = hp.create_bunch_test_set(manifold, card_bunch=3, card_x=3, checkpoint=checkpoint, seed=0)
+    uninterrupted = hp.create_bunch_test_set(manifold, card_bunch=3, card_x=3, seed=0)
+    assert len(resumed) == 3
+    for (x_0, x_set, limit), (y_0, y_set, y_limit) in zip(uninterrupted, resumed):
+        assert np.allclose(x_0, y_0) and np.allclose(x_set, y_set) and np.allclose(limit, y_limit)
+    assert not np.allclose(resumed[1][1], resumed[2][1])
+    assert len(hp.load_bunch_from_file(checkpoint)[1]) == 3
+
+
+def test_fingerprint_sees_the_manifold_dimension(monkeypatch):
+    key = hp.fingerprint(hp.optimisation_fl_poincare)
+    assert hp.fingerprint(hp.optimisation_fl_poincare) == key
+    monkeypatch.setattr(hp, "PoincareManifold", hp.PoincareBall(3, 1))
+    assert hp.fingerprint(hp.optimisation_fl_poincare) != key
+
+
+def test_cached_run(bunch, tmp_path):
+    cache = hp.ResultCache(str(tmp_path))
+    x_0, x_set, _ = bunch[0]
+    x_seq, f_seq, g_seq = hp.cached_run(cache, hp.optimisation_fl_poincare, x_0, x_set, 0.5, 20)
+    again = hp.cached_run(cache, hp.optimisation_fl_poincare, x_0, x_set, 0.5, 20)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert np.array_equal(np.asarray(x_seq), np.asarray(again[0]))
+
+
+def test_tuning_cost_skips_cache_hits(bunch, tmp_path):
+    cache = hp.ResultCache(str(tmp_path))
+    configs = hp.search_grid({"learning_rate": (0.1, 0.9, "linear")}, 5)
+    _, score, cost = hp.successive_halving(fixed_step, bunch[:6], configs, max_iter=30, min_problems=2, cache=cache)
+    assert cost["runs"] > 0 and cost["cached"] == 0
+    _, cached_score, cached_cost = hp.successive_halving(fixed_step, bunch[:6], configs, max_iter=30, min_problems=2, cache=cache)
+    assert cached_score == score
+    assert cached_cost["runs"] == 0 and cached_cost["iterations"] == 0
+    assert cached_cost["cached"] == cost["runs"]
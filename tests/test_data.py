@@ -0,0 +1,26 @@
+import numpy as np
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_import_does_not_load_the_bunch():
+    assert not hasattr(hp, "bunch")
+    assert hp.PoincareManifold.n == hp.dim
+
+
+def test_synthetic_bunch_is_seeded_locally():
+    np.random.seed(1)
+    state = np.random.get_state()[1].copy()
+    a = hp.synthetic_bunch(3, 5, card_bunch=2, seed=7)
+    b = hp.synthetic_bunch(3, 5, card_bunch=2, seed=7)
+    assert np.array_equal(np.random.get_state()[1], state)
+    for (x_0, x_set, _), (y_0, y_set, _) in zip(a, b):
+        assert np.array_equal(x_0, y_0)
+        assert np.array_equal(x_set, y_set)
+    assert not np.array_equal(a[0][1], hp.synthetic_bunch(3, 5, card_bunch=1, seed=8)[0][1])
+
+
+def test_rand_stays_in_the_ball():
+    rng = np.random.default_rng(0)
+    X = hp.PoincareBall(4, 100).rand(rng)
+    assert np.all(np.sum(X*X, axis=0) < 1)
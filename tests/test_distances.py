@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def column_set(manifold, k, seed):
+    rng = np.random.default_rng(seed)
+    return np.stack([manifold.rand(rng) for _ in range(k)], axis=1)
+
+
+@pytest.mark.parametrize("manifold", [hp.PoincareBall(3, 1), hp.Hyperboloid(3, 1)])
+def test_cdist_matches_dist(manifold):
+    X, Y = column_set(manifold, 23, 0), column_set(manifold, 17, 1)
+    D = manifold.cdist(X, Y)
+    expected = [[manifold.dist(X[:, i], Y[:, j]) for j in range(17)] for i in range(23)]
+    np.testing.assert_allclose(D, expected, rtol=1e-10)
+    # tiles and threads only change how the matrix is filled
+    np.testing.assert_array_equal(manifold.cdist(X, Y, block_size=5, n_jobs=3), D)
+
+
+def test_cdist_near_the_boundary():
+    manifold = hp.PoincareBall(2, 1)
+    X = np.array([[1 - 1e-12, 0], [0, 1 - 1e-12], [0, 0]]).T
+    D = manifold.cdist(X, X)
+    assert np.isfinite(D).all()
+    assert D[0, 2] == pytest.approx(2*np.arctanh(1 - 1e-12), rel=1e-6)
+
+
+def test_nearest_centroid_and_medoid(bunch):
+    _, x_set, _ = bunch[0]
+    x_set = np.asarray(x_set)
+    manifold = hp.PoincareManifold
+    labels, d = hp.nearest_centroid(manifold, x_set, x_set[:2], block_size=2)
+    for x, label, distance in zip(x_set, labels, d):
+        distances = [manifold.dist(x, c) for c in x_set[:2]]
+        assert label == np.argmin(distances)
+        assert distance == pytest.approx(min(distances), abs=1e-7)
+    medoid, i = hp.medoid(manifold, x_set)
+    costs = [hp.frechet_mean(x, x_set, manifold) for x in x_set]
+    assert i == np.argmin(costs) and np.array_equal(medoid, x_set[i])
+
+
+@pytest.mark.parametrize("radius", [0.999, 0.999999])
+def test_cdist_close_points_near_the_boundary(radius):
+    manifold = hp.PoincareBall(2, 1)
+    angles = np.linspace(0, 2*np.pi, 7, endpoint=False)
+    X = radius*np.array([np.cos(angles), np.sin(angles)])
+    Y = X + 1e-9*np.array([[1.0], [-1.0]])
+    D = manifold.cdist(X, X)
+    assert np.all(np.diag(D) == 0)
+    np.testing.assert_allclose(np.diag(manifold.cdist(X, Y)), manifold.dist_columns(X, Y), rtol=1e-9)
+    labels, _ = hp.nearest_centroid(manifold, Y.T, X.T)
+    assert np.array_equal(labels, np.arange(7))
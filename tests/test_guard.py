@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_hyperboloid_cdist_diagonal_is_zero():
+    manifold = hp.Hyperboloid(2, 1)
+    rng = np.random.default_rng(0)
+    X = np.stack([manifold.rand(rng) for _ in range(40)], axis=1)
+    D = manifold.cdist(X, X)
+    assert np.all(np.diag(D) == 0)
+    expected = [[manifold.dist(X[:, i], X[:, j]) for j in range(40)] for i in range(40)]
+    np.testing.assert_allclose(D, expected, rtol=1e-12, atol=1e-15)
+
+
+def test_renormalization_is_opt_in():
+    manifold = hp.Hyperboloid(2, 1)
+    x = manifold.rand(np.random.default_rng(1))
+    u = manifold.proj(x, np.array([0.1, -0.2, 0.3]))
+    with hp.guarding() as guard:
+        manifold.exp(x, u)
+        assert guard.report()["renormalize"] == 0
+        # a point off the upper sheet still gets its time coordinate back
+        assert guard.renormalize(np.array([[0.5], [0.5], [-1.0]]))[-1, 0] == np.sqrt(1.5)
+        assert guard.report()["renormalize"] == 1
+    with hp.guarding(renormalize_every=2) as guard:
+        for _ in range(4):
+            manifold.exp(x, u)
+        assert guard.report()["renormalize"] == 2
+
+
+def test_guard_settings_and_counts_are_per_thread():
+    manifold = hp.PoincareBall(2, 1)
+    x = np.array([0.5, 0.0])
+    u = np.array([100.0, 0.0])
+    seen = {}
+
+    def other():
+        seen["enabled"] = hp.guard.enabled
+        hp.guard.reset()
+        manifold.exp(x, u)
+        seen["counts"] = hp.guard.report()
+
+    with hp.guarding(enabled=False) as guard:
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        manifold.exp(x, u)
+        assert guard.report()["clamp"] == 0
+    assert seen["enabled"] and seen["counts"]["clamp"] == 1
+
+
+def test_drift_off_the_sheet_is_renormalized():
+    manifold = hp.Hyperboloid(2, 1)
+    x = hp.inv_rho(np.array([0.3, 0.4]))
+    # <x, x> = -1 + 1e-7, past the rounding of the squares
+    x[-1] = np.sqrt(1 + x[0]**2 + x[1]**2 - 1e-7)
+    with hp.guarding() as guard:
+        y = manifold.exp(x, np.zeros(3))
+        assert guard.report()["renormalize"] == 1
+    assert manifold.inner_minkowski_columns(y, y) == pytest.approx(-1, abs=1e-15)
+    # rounding alone does not trigger it
+    with hp.guarding() as guard:
+        manifold.exp(hp.inv_rho(np.array([0.3, 0.4])), np.zeros(3))
+        assert guard.report()["renormalize"] == 0
+
+
+def test_hyperboloid_iterates_stay_on_the_sheet(bunch):
+    x_0, x_set, limit = bunch[5]
+    x_seq = hp.accelerated_gradient(hp.HyperboloidManifold, hp.inv_rho(x_0), hp.frechet_mean_hyperboloid_rgrad,
+                                    hp.prepare(x_set).lift(), 0.26, 300, stop=hp.GradientNorm(1e-10))[0]
+    assert max(abs(hp.HyperboloidManifold.inner_minkowski_columns(x, x)[0] + 1) for x in x_seq) < 1e-9
+    assert hp.PoincareManifold.dist(hp.rho(x_seq[-1]), limit) < 1e-6
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+@pytest.mark.parametrize("solver, f_grad", [
+    (hp.LBFGS_poincare, hp.frechet_mean_poincare_rgrad),
+    (hp.LBFGS_hyperboloid, hp.frechet_mean_hyperboloid_rgrad),
+])
+def test_lbfgs_converges(bunch, solver, f_grad):
+    for x_0, x_set, limit in bunch[:20]:
+        psi_seq, f_seq, g_seq = solver(x_0, f_grad, x_set, 5, 1e-4, 10, 100, hp.CertifiedDistance(1e-9))
+        assert hp.PoincareManifold.dist(psi_seq[-1], limit) < 1e-6
+        assert len(f_seq) == len(g_seq) == len(psi_seq) - 1
+        # f_seq follows the iterates and every step decreases it, up to the
+        # rounding of f the approximate armijo search accepts
+        np.testing.assert_allclose(f_seq, [hp.frechet_mean(psi, x_set, hp.PoincareManifold) for psi in psi_seq[1:]],
+                                   rtol=1e-9)
+        assert all(b <= a*(1 + 1e-12) for a, b in zip(f_seq, f_seq[1:]))
+        assert len(psi_seq) < 30
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def start(bunch):
+    x_0, x_set, _ = bunch[0]
+    x_set = hp.prepare(x_set)
+    manifold = hp.PoincareManifold
+    f = hp.frechet_mean(x_0, x_set, manifold)
+    g = hp.frechet_mean_poincare_rgrad(x_0, x_set, manifold)
+    return manifold, x_set, x_0, f, g
+
+
+def test_armijo_interpolation_decreases(bunch):
+    manifold, x_set, x, f, g = start(bunch)
+    alpha, new_x, f_new, g_new = hp.armijo_interpolation(manifold, hp.frechet_mean_poincare_rgrad, x_set, x, f, g, -g, 10)
+    assert 0 < alpha < 10
+    assert f_new <= f + 1e-4*alpha*manifold.inner(x, g, -g)
+    assert np.allclose(g_new, hp.frechet_mean_poincare_rgrad(new_x, x_set, manifold))
+
+
+def test_approximate_acceptance_is_opt_in(bunch):
+    # a reference value a few ulps below f(x): no step passes the armijo
+    # test, the ones shorter than the rounding of f pass the slope test
+    manifold, x_set, x, f, g = start(bunch)
+    f_x = f*(1 - 1e-14)
+    assert hp.armijo_interpolation(manifold, hp.frechet_mean_poincare_rgrad, x_set, x, f_x, g, -g, 1e-16)[0] == 0
+    assert hp.approximate_armijo(manifold, hp.frechet_mean_poincare_rgrad, x_set, x, f_x, g, -g, 1e-16)[0] > 0
+
+
+def test_interpolate_step_is_exact_on_polynomials():
+    # phi(alpha) = 1 - 2 alpha + alpha^2 has its minimum at 1
+    phi = lambda alpha: 1 - 2*alpha + alpha**2
+    assert hp.interpolate_step(phi(0), -2, 3, phi(3)) == pytest.approx(1)
+    # phi(alpha) = 1 - 3 alpha + alpha^3 has its minimum at 1
+    phi = lambda alpha: 1 - 3*alpha + alpha**3
+    assert hp.interpolate_step(phi(0), -3, 2, phi(2), 3, phi(3)) == pytest.approx(1)
+
+
+@pytest.mark.parametrize("solver, tol", [(hp.armijo_adaptive_poincare, 1e-6), (hp.armijo_adaptive_hyperboloid, 1e-5)])
+def test_armijo_adaptive_converges(bunch, solver, tol):
+    # the first step guess 2 (f_k - f_prev)/phi'(0) halves the iterations of
+    # the sigma^h backtracking
+    steps = []
+    for x_0, x_set, limit in bunch[:20]:
+        psi_seq, f_seq, _ = solver(x_0, x_set, 1e-4, 1, 100)
+        assert hp.PoincareManifold.dist(psi_seq[-1], limit) < tol
+        assert all(b <= a for a, b in zip(f_seq, f_seq[1:]))
+        steps.append(hp.time_to_converge(psi_seq, limit, 100, 1e-5))
+    fixed = [hp.time_to_converge(hp.armijo_poincare(x_0, x_set, 0.2, 1e-3, 0.25, 100)[0], limit, 100, 1e-5)
+             for x_0, x_set, limit in bunch[:20]]
+    assert np.mean(steps) < 0.7*np.mean(fixed)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+@pytest.mark.parametrize("method", ["einstein", "lorentzian"])
+def test_midpoint_of_two_points_is_on_the_geodesic(method):
+    manifold = hp.PoincareBall(2, 1)
+    a, b = np.array([0.7, 0.1]), np.array([-0.2, 0.5])
+    psi = hp.generate_starting_point(np.array([a, b]), method)
+    assert manifold.dist(psi, a) == pytest.approx(manifold.dist(psi, b), rel=1e-10)
+    assert manifold.dist(psi, a) == pytest.approx(manifold.dist(a, b)/2, rel=1e-10)
+
+
+@pytest.mark.parametrize("method", ["euclidean", "einstein", "lorentzian"])
+def test_midpoints_of_symmetric_sets(method):
+    x_set = np.array([[0.9, 0.0], [-0.9, 0.0], [0.0, 0.3], [0.0, -0.3]])
+    np.testing.assert_allclose(hp.generate_starting_point(x_set, method), 0, atol=1e-12)
+
+
+@pytest.mark.parametrize("method", ["euclidean", "einstein", "lorentzian"])
+def test_approximate_mean_bounds_the_gap(bunch, method):
+    for _, x_set, limit in bunch[:10]:
+        psi, f, gap = hp.approximate_mean(x_set, method)
+        f_star = hp.frechet_mean(limit, x_set, hp.PoincareManifold)
+        assert np.dot(psi, psi) < 1
+        assert f_star <= f <= f_star + gap + 1e-12
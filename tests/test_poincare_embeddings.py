@@ -0,0 +1,45 @@
+import numpy as np
+
+from poincare_embeddings import PoincareEmbedding, poincare_dist_grads
+
+
+def tree_edges(depth=4, branching=2):
+    edges = []
+    for child in range(1, sum(branching**i for i in range(depth + 1))):
+        edges.append(((child - 1)//branching, child))
+    return np.array(edges)
+
+
+def test_dist_grads_match_finite_differences():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(-0.5, 0.5, size=(5, 3))
+    Y = rng.uniform(-0.5, 0.5, size=(5, 3))
+    d, g_x, g_y = poincare_dist_grads(X, Y)
+    h = 1e-6
+    for j in range(3):
+        e = np.zeros(3)
+        e[j] = h
+        assert np.allclose((poincare_dist_grads(X + e, Y)[0] - poincare_dist_grads(X - e, Y)[0])/(2*h), g_x[:, j], atol=1e-6)
+        assert np.allclose((poincare_dist_grads(X, Y + e)[0] - poincare_dist_grads(X, Y - e)[0])/(2*h), g_y[:, j], atol=1e-6)
+    assert np.all(poincare_dist_grads(X, X)[0] == 0)
+
+
+def test_step_only_moves_the_batch_rows():
+    model = PoincareEmbedding(tree_edges(), negatives=3, seed=0)
+    before = model.embedding.copy()
+    u, v = np.array([0, 1]), np.array([1, 3])
+    model.rng = np.random.default_rng(1)
+    neg, mask = model.sample(u)
+    model.rng = np.random.default_rng(1)
+    model.step(u, v, 0.1)
+    moved = np.flatnonzero(np.any(model.embedding != before, axis=1))
+    assert set(moved) <= set(np.concatenate([u, v, neg.ravel()]))
+
+
+def test_training_embeds_a_tree():
+    model = PoincareEmbedding(tree_edges(), negatives=10, lr=0.3, burn_in=5, seed=0)
+    untrained = model.mean_rank()
+    losses = model.train(epochs=60, batch_size=10)
+    assert losses[-1] < losses[0]
+    assert np.all(np.sum(model.embedding**2, axis=1) < 1)
+    assert model.mean_rank() < min(3, untrained/5)
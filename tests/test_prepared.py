@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_prepared_dataset_is_built_once(bunch):
+    x_0, x_set, _ = bunch[0]
+    points = np.array(x_set, dtype=float)
+    data = hp.PreparedDataset(points)
+    cache = data.prepared()
+    X = cache["X"]
+    # the caller's array is copied, later changes do not reach the cache
+    points[0] = 0
+    assert data.prepared()["X"] is X
+    assert not X.flags.writeable
+    np.testing.assert_allclose(X, x_set)
+
+
+@pytest.mark.parametrize("manifold, lift", [
+    (hp.PoincareBall(2, 1), lambda x: x),
+    (hp.Hyperboloid(2, 1), hp.inv_rho),
+])
+def test_frechet_mean_takes_the_manifold(bunch, manifold, lift):
+    x_0, x_set, _ = bunch[0]
+    theta = lift(x_0)
+    points = [lift(x) for x in x_set]
+    data = hp.prepare(x_set).ball() if isinstance(manifold, hp.PoincareBall) else hp.prepare(x_set).lift()
+
+    def distance(x, y):
+        return manifold.dist(x, y)
+
+    f = hp.frechet_mean(theta, points, distance)
+    assert hp.frechet_mean(theta, points, manifold) == pytest.approx(f, rel=1e-12)
+    assert hp.frechet_mean(theta, data, manifold) == pytest.approx(f, rel=1e-9)
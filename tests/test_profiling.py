@@ -0,0 +1,52 @@
+import threading
+
+import numpy as np
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_profile_run_counts_evaluations(bunch):
+    x_0, x_set, _ = bunch[0]
+    (x_seq, f_seq, g_seq), report = hp.profile_run(hp.optimisation_fl_poincare, x_0, x_set, 0.5, 20)
+    steps = len(x_seq) - 1
+    assert report["calls"]["poincare.exp"] == steps
+    assert report["evaluations"] == report["calls"]["frechet_mean"] + report["calls"]["frechet_mean_poincare_grad"]
+    assert report["phases"]["direction"]["calls"] == report["calls"]["frechet_mean_poincare_rgrad"]
+    assert report["total_time"] > 0
+
+
+def test_nothing_is_counted_outside_profiling():
+    profiler = hp.Profiler()
+    with hp.profiling(profiler):
+        pass
+    hp.PoincareManifold.exp(np.zeros(2), np.ones(2)/10)
+    assert profiler.calls == {}
+    assert hp.phase("direction") is hp.null_phase
+
+
+def test_profiling_nests():
+    x = np.array([0.1, 0.2])
+    with hp.profiling() as outer:
+        hp.PoincareManifold.dist(x, -x)
+        with hp.profiling() as inner:
+            hp.PoincareManifold.dist(x, -x)
+    assert outer.calls["poincare.dist"] == 2
+    assert inner.calls["poincare.dist"] == 1
+
+
+def test_threads_are_profiled_separately(bunch):
+    x_0, x_set, _ = bunch[0]
+    reports = [None]*4
+    barrier = threading.Barrier(4)
+
+    def run(i):
+        barrier.wait()
+        steps = 5*(i + 1)
+        reports[i] = (steps, hp.profile_run(hp.optimisation_fl_poincare, x_0, x_set, 0.001, steps, stop=hp.Budget())[1])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for steps, report in reports:
+        assert report["calls"]["poincare.exp"] == steps
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+@pytest.mark.parametrize("name", sorted(hp.pymanopt_suite))
+def test_pymanopt_trajectories(bunch, name):
+    x_0, x_set, limit = bunch[0]
+    psi_seq, f_seq, g_seq = hp.pymanopt_suite[name](x_0, x_set, 100)
+    assert len(f_seq) == len(g_seq) == len(psi_seq) - 1 > 1
+    np.testing.assert_allclose(psi_seq[0], x_0)
+    # the recorded iterates are the ones the optimizer stepped through
+    assert all(not np.array_equal(a, b) for a, b in zip(psi_seq, psi_seq[1:]))
+    expected = [hp.frechet_mean(psi, x_set, hp.PoincareManifold) for psi in psi_seq[1:]]
+    np.testing.assert_allclose(f_seq, expected, rtol=1e-9)
+    assert np.linalg.norm(psi_seq[-1] - limit) < 1e-6
+
+
+@pytest.mark.parametrize("model", ["poincare", "hyperboloid"])
+def test_pymanopt_calls_are_profiled(bunch, model):
+    x_0, x_set, _ = bunch[0]
+    manifold = hp.PoincareManifold if model == "poincare" else hp.HyperboloidManifold
+    x = x_0 if model == "poincare" else hp.inv_rho(x_0)
+    with hp.profiling() as profiler:
+        manifold.inner_product(x, x, x)
+        manifold.euclidean_to_riemannian_gradient(x, x)
+        manifold.transport(x, x, x)
+    assert profiler.calls[model + ".inner"] == 1
+    assert profiler.calls[model + ".egrad2rgrad"] == 1
+    assert profiler.calls[model + ".transp"] == 1
+    _, report = hp.profile_run(hp.pymanopt_suite["pymanopt_CG_" + model], x_0, x_set, 20)
+    assert report["calls"][model + ".egrad2rgrad"] > 0 and report["calls"][model + ".inner"] > 0
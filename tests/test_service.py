@@ -0,0 +1,112 @@
+import json
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+from barycenter_service import BarycenterBatcher, BarycenterClient, BarycenterService, BatchRequest
+
+
+@pytest.fixture
+def service():
+    service = BarycenterService().start()
+    yield service
+    service.stop()
+
+
+def post(service, payload):
+    # status and body, the body parsed without accepting NaN or Infinity
+    request = urllib.request.Request(service.url + "/solve", data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            code, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        code, body = e.code, e.read()
+    return code, json.loads(body, parse_constant=pytest.fail)
+
+
+def test_solve(service):
+    points = np.array([[0.1, 0.2], [-0.3, 0.1], [0.0, -0.4]])
+    result = BarycenterClient(service.url).solve(points)
+    manifold = hp.PoincareBall(2, 1)
+    assert result["grad_norm"] < 1e-8
+    assert np.linalg.norm(hp.frechet_mean_poincare_rgrad(result["mean"], points, manifold)) < 1e-6
+
+
+@pytest.mark.parametrize("payload", [
+    {"points": [[0.1, 0.2], [1.0, 0.0]]},
+    {"points": [[0.1, 0.2], [2.0, 3.0]]},
+    {"points": [[0.1, 1e400]]},
+    {"points": [[0.0, 0.0, 2.0]], "model": "hyperboloid"},
+    {"points": []},
+    {"points": [[0.1, 0.2]], "model": "klein"},
+    {"model": "poincare"},
+    {"points": [[0.1, 0.2]], "options": {"max_steps": [5]}},
+    {"points": [[0.1, 0.2]], "options": {"tol": {"a": 1}}},
+    {"points": [[0.1, 0.2]], "options": {"steps": 5}},
+    {"points": [[0.1, 0.2]], "options": [5]},
+])
+def test_bad_requests(service, payload):
+    code, body = post(service, payload)
+    assert code == 400
+    assert "error" in body
+
+
+def test_unexpected_errors(service, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(service.batcher, "solve", fail)
+    code, body = post(service, {"points": [[0.1, 0.2]]})
+    assert code == 500
+    assert "boom" in body["error"]
+
+
+def test_non_finite_results(service, monkeypatch):
+    def diverged(*args, **kwargs):
+        return {"mean": np.array([np.nan, 0.5]), "f": np.inf, "grad_norm": np.nan, "steps": 3}
+    monkeypatch.setattr(service.batcher, "solve", diverged)
+    code, body = post(service, {"points": [[0.1, 0.2]]})
+    assert code == 200
+    assert body == {"mean": [None, 0.5], "f": None, "grad_norm": None, "steps": 3}
+
+
+def test_bad_options_leave_the_service_up(service):
+    code, _ = post(service, {"points": [[0.1, 0.2]], "options": {"max_steps": [5]}})
+    assert code == 400
+    code, body = post(service, {"points": [[0.1, 0.2], [-0.1, 0.0]], "options": {"max_steps": 20}})
+    assert code == 200
+    assert body["grad_norm"] < 1e-8
+    assert all(worker.is_alive() for worker in service.batcher.workers)
+
+
+def test_failed_batch_keeps_the_worker():
+    # a request past the checks of submit fails alone, the worker goes on
+    batcher = BarycenterBatcher(max_wait=0.05)
+    try:
+        bad = BatchRequest(np.array([[0.1, 0.2]]), "poincare", {"max_steps": [5]})
+        batcher.queue.put(bad)
+        good = batcher.submit([[0.1, 0.2], [-0.1, 0.0]])
+        with pytest.raises(TypeError):
+            bad.future.result(10)
+        assert good.result(10)["grad_norm"] < 1e-8
+        assert all(worker.is_alive() for worker in batcher.workers)
+        assert batcher.solve([[0.3, 0.1]], timeout=10)["steps"] >= 0
+    finally:
+        batcher.close()
+
+
+def test_worker_survives_a_failing_run(monkeypatch):
+    batcher = BarycenterBatcher()
+    try:
+        def fail(batch):
+            raise RuntimeError("boom")
+        monkeypatch.setattr(batcher, "_run", fail)
+        with pytest.raises(RuntimeError):
+            batcher.solve([[0.1, 0.2]], timeout=10)
+        monkeypatch.undo()
+        assert batcher.solve([[0.1, 0.2]], timeout=10)["grad_norm"] < 1e-8
+    finally:
+        batcher.close()
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_budget_counts_evaluations(bunch):
+    x_0, x_set, _ = bunch[0]
+    budget = hp.Budget(max_evals=30)
+    # the line search backtracks from a long first step, several costs per iteration
+    (x_seq, f_seq, g_seq), report = hp.profile_run(hp.armijo_poincare, x_0, x_set, 0.5, 1e-4, 50, 100, budget)
+    assert budget.reason == "evaluation budget 30 exhausted"
+    assert budget.evals == report["evaluations"]
+    assert 30 <= budget.evals < 60
+    assert len(x_seq) - 1 < 30
+
+
+def test_budget_resets_with_the_run(bunch):
+    x_0, x_set, _ = bunch[0]
+    budget = hp.Budget(max_evals=20)
+    first = hp.RBB_poincare(x_0, x_set, 1e-4, 0.9, 100, stop=budget)[0]
+    second = hp.RBB_poincare(x_0, x_set, 1e-4, 0.9, 100, stop=budget)[0]
+    assert len(first) == len(second)
+
+
+def test_certified_distance(bunch):
+    x_0, x_set, limit = bunch[0]
+    stop = hp.CertifiedDistance(1e-6)
+    x_seq = hp.RBB_poincare(x_0, x_set, 1e-4, 0.9, 100, stop=stop)[0]
+    assert stop.reason is not None
+    assert hp.PoincareManifold.dist(x_seq[-1], limit) <= 1e-6
+
+
+def test_any_of_reports_every_reason(bunch):
+    x_0, x_set, _ = bunch[0]
+    stop = hp.AnyOf(hp.GradientNorm(1e-3), hp.CertifiedDistance(1e-3))
+    hp.RBB_poincare(x_0, x_set, 1e-4, 0.9, 100, stop=stop)
+    assert "gradient norm" in stop.reason or "distance" in stop.reason
+
+
+def test_nan_gradients_are_not_converged():
+    hyperboloid = hp.Hyperboloid(2, 1)
+    x = hp.inv_rho(np.array([0.1, 0.2]))
+    g = np.array([np.nan, 0.0, 0.0])
+    assert np.isnan(hyperboloid.norm(x, g))
+    assert hp.certified_distance(hyperboloid, x, g) == np.inf
+    for criterion in [hp.GradientNorm(1e-6), hp.CertifiedDistance(1e-6), hp.RelativeDecrease(1e-6),
+                      hp.StepLength(1e-6)]:
+        criterion.reset()
+        assert not criterion(hyperboloid, x, 1.0, g)
+        assert not criterion(hyperboloid, x, 1.0, g)
+        assert criterion.reason is None
+
+
+@pytest.mark.parametrize("solver, args", [
+    (hp.optimisation_fixed_lenght, (0.1,)),
+    (hp.RBB, (1e-4, 0.9)),
+])
+def test_diverged_runs_are_not_converged(bunch, solver, args):
+    # the gradient turns nan after two steps
+    x_0, x_set, _ = bunch[0]
+    calls = []
+
+    def f_grad(x, x_set, manifold):
+        calls.append(x)
+        g = hp.frechet_mean_hyperboloid_rgrad(x, x_set, manifold)
+        return g*np.nan if len(calls) > 2 else g
+
+    stop = hp.CertifiedDistance(1e-6)
+    x_seq, f_seq, g_seq = solver(hp.HyperboloidManifold, hp.inv_rho(x_0), f_grad, hp.prepare(x_set).lift(), *args,
+                                 max_steps=50, stop=stop)
+    assert stop.reason is None
+    assert len(x_seq) == 2
@@ -0,0 +1,32 @@
+import numpy as np
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def test_record_runs_fills_the_columns(bunch, tmp_path):
+    store = hp.TrajectoryStore(2, 30, capacity=2)
+    hp.record_runs(store, lambda X0, X, max_iter: hp.RBB_poincare(X0, X, 1e-4, 0.9, max_iter), bunch[:5], 30, count_evals=True)
+    assert len(store) == 5 and len(store.length) >= 5
+    for i, (x_0, x_set, limit) in enumerate(bunch[:5]):
+        x_seq, f_seq, g_seq = hp.RBB_poincare(x_0, x_set, 1e-4, 0.9, 30)
+        n = len(x_seq)
+        assert store.length[i] == n
+        assert np.array_equal(store.x[i, :n], np.asarray(x_seq))
+        assert np.all(np.isnan(store.x[i, n:]))
+        assert np.allclose(store.step[i, :n-1], [hp.PoincareManifold.dist(a, b) for a, b in zip(x_seq[:-1], x_seq[1:])])
+        assert store.evals[i] > 0
+
+    store.save(str(tmp_path/"store.npz"))
+    loaded = hp.TrajectoryStore.load(str(tmp_path/"store.npz"))
+    assert len(loaded) == 5
+    assert np.array_equal(loaded.length[:5], store.length[:5])
+    assert np.array_equal(loaded.hitting_times(), store.hitting_times())
+
+
+def test_hitting_times(bunch):
+    store = hp.TrajectoryStore(2, 100)
+    x_0, x_set, limit = bunch[0]
+    x_seq, f_seq, g_seq = hp.RBB_poincare(x_0, x_set, 1e-4, 0.9, 100)
+    store.add(x_seq, f_seq, g_seq, limit)
+    errors = np.linalg.norm(np.asarray(x_seq) - limit, axis=1)
+    assert store.hitting_times(1e-4)[0] == np.argmax(errors < 1e-4)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def points(seed, radius=0.9):
+    rng = np.random.default_rng(seed)
+    manifold = hp.PoincareBall(3, 1)
+    x1, x2 = manifold.rand(rng)*radius, manifold.rand(rng)*radius
+    u, v = rng.standard_normal(3), rng.standard_normal(3)
+    return manifold, x1, x2, u, v
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_transport_is_an_isometry(seed):
+    manifold, x1, x2, u, v = points(seed)
+    tu, tv = manifold.transp(x1, x2, u), manifold.transp(x1, x2, v)
+    assert manifold.inner(x2, tu, tv) == pytest.approx(manifold.inner(x1, u, v), rel=1e-10)
+    # back along the same geodesic
+    np.testing.assert_allclose(manifold.transp(x2, x1, tu), u, rtol=1e-10)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_transport_of_the_geodesic_direction(seed):
+    manifold, x1, x2, _, _ = points(seed)
+    np.testing.assert_allclose(manifold.transp(x1, x2, manifold.log(x1, x2)), -manifold.log(x2, x1), rtol=1e-8, atol=1e-12)
+
+
+def test_gyration_matches_mobius_addition():
+    manifold, x, y, g, _ = points(0)
+    g = 0.1*g
+    expected = manifold.mobius_add(-manifold.mobius_add(x, y), manifold.mobius_add(x, manifold.mobius_add(y, g)))
+    np.testing.assert_allclose(manifold.gyration(x, y, g), expected, rtol=1e-9, atol=1e-12)
+
+
+def test_conformal_transport_is_exact_through_the_origin():
+    manifold, x1, _, u, _ = points(1)
+    x2 = -0.5*x1
+    np.testing.assert_allclose(manifold.transp_conformal(x1, x2, u), manifold.transp(x1, x2, u), rtol=1e-10)
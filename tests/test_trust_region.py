@@ -0,0 +1,36 @@
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+@pytest.mark.parametrize("solver", [hp.RTR_poincare, hp.RTR_hyperboloid])
+def test_rtr_converges_in_high_dimension(solver):
+    # the module manifolds are built for R^2, the inner CG must still get
+    # the iterations of a 10 dimensional problem
+    for x_0, x_set, _ in hp.synthetic_bunch(10, 30, card_bunch=3, seed=1):
+        stop = hp.GradientNorm(1e-10)
+        x_seq, f_seq, g_seq = solver(x_0, x_set, 30, stop)
+        assert stop.reason is not None
+        assert len(x_seq) <= 12
+
+
+@pytest.mark.parametrize("max_inner, solved", [(None, True), (2, False)])
+def test_truncated_cg_solves_the_newton_system(max_inner, solved):
+    # PoincareManifold is the R^2 manifold of the module, used on R^10
+    x_0, x_set, _ = hp.synthetic_bunch(10, 20, card_bunch=1, seed=2)[0]
+    manifold = hp.PoincareManifold
+    g = hp.frechet_mean_poincare_rgrad(x_0, x_set, manifold)
+    hess = hp.frechet_mean_poincare_rhess(x_0, x_set, manifold)
+    eta, H_eta, boundary = hp.truncated_CG(manifold, x_0, g, hess, 1e3, kappa=1e-12, theta=1, max_inner=max_inner)
+    assert not boundary
+    assert (manifold.norm(x_0, H_eta + g) <= 1e-8*manifold.norm(x_0, g)) == solved
+
+
+def test_truncated_cg_stops_on_the_boundary():
+    x_0, x_set, _ = hp.synthetic_bunch(6, 20, card_bunch=1, seed=2)[0]
+    manifold = hp.PoincareBall(6, 1)
+    g = hp.frechet_mean_poincare_rgrad(x_0, x_set, manifold)
+    hess = hp.frechet_mean_poincare_rhess(x_0, x_set, manifold)
+    eta, _, boundary = hp.truncated_CG(manifold, x_0, g, hess, 1e-3)
+    assert boundary
+    assert manifold.norm(x_0, eta) == pytest.approx(1e-3)
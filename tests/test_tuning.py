@@ -0,0 +1,25 @@
+import numpy as np
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def fixed_step(X0, X, max_iter, learning_rate):
+    return hp.optimisation_fl_poincare(X0, X, learning_rate, max_iter)
+
+
+def test_successive_halving_finds_the_grid_optimum(bunch):
+    problems = bunch[:9]
+    configs = hp.search_grid({"learning_rate": (0.05, 0.95, "linear")}, 19)
+    best, score, cost = hp.successive_halving(fixed_step, problems, configs, max_iter=90, min_iter=10, min_problems=3)
+    grid = hp.TuningRun(fixed_step, problems)
+    grid_scores = [grid.score(config, len(problems), 90) for config in configs]
+    assert score <= min(grid_scores) + 1
+    assert cost["runs"] < cost["grid_runs"]
+
+
+def test_hyperband_samples_the_space(bunch):
+    space = {"sigma": (0.05, 0.9, "linear"), "gamma": (1e-5, 1e-1, "log"), "lambda_": (0.01, 1, "log")}
+    best, score, cost = hp.hyperband(lambda X0, X, max_iter, **params: hp.armijo_poincare(X0, X, max_steps=max_iter, **params),
+                                     bunch[:5], space, max_iter=30, min_iter=10)
+    assert set(best) == set(space)
+    assert np.isfinite(score) and cost["runs"] > 0
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import hyperbolicpoincareriemannianopt as hp
+
+
+def batch(manifold, k, seed):
+    rng = np.random.default_rng(seed)
+    X = np.stack([manifold.rand(rng) for _ in range(k)], axis=1)
+    U = manifold.proj(X, 0.3*rng.standard_normal(X.shape))
+    return X, U
+
+
+@pytest.mark.parametrize("manifold", [hp.PoincareBall(3, 1), hp.Hyperboloid(3, 1)])
+def test_column_operations_match_the_loop(manifold):
+    X, U = batch(manifold, 50, 0)
+    Y, V = batch(manifold, 50, 1)
+    columns = range(X.shape[1])
+    np.testing.assert_allclose(manifold.inner_columns(X, U, V),
+                               [manifold.inner(X[:, i], U[:, i], V[:, i]) for i in columns], rtol=1e-12)
+    np.testing.assert_allclose(manifold.norm_columns(X, U),
+                               [manifold.norm(X[:, i], U[:, i]) for i in columns], rtol=1e-12)
+    np.testing.assert_allclose(manifold.dist_columns(X, Y),
+                               [manifold.dist(X[:, i], Y[:, i]) for i in columns], rtol=1e-12)
+    # a k = 1 instance takes the batch as well
+    E = manifold.exp(X, U)
+    np.testing.assert_allclose(E, np.stack([manifold.exp(X[:, i], U[:, i]) for i in columns], axis=1), rtol=1e-12)
+    assert manifold.dist(manifold.pairmean(X[:, 0], Y[:, 0]), X[:, 0]) == pytest.approx(
+        manifold.dist(X[:, 0], Y[:, 0])/2, rel=1e-9)
+
+
+def test_hyperboloid_gradients_leave_their_arguments():
+    manifold = hp.Hyperboloid(3, 1)
+    X, U = batch(manifold, 5, 2)
+    G, H = U.copy(), 2*U
+    manifold.egrad2rgrad(X, G)
+    manifold.ehess2rhess(X, G, H, U)
+    np.testing.assert_array_equal(G, U)
+    np.testing.assert_array_equal(H, 2*U)